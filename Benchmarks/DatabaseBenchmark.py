@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@summary: Benchmark for the PySchedServer database. Fills a temporary
+database with jobs and measures the cost of single job lookups, once by
+loading the whole table and filtering in python (the old behaviour) and
+once with filters done by the database.
+
+Usage: python DatabaseBenchmark.py [--sizes 1000,10000,80000] [--lookups 50]
+'''
+
+from PySched.PySchedServer.DatabaseManagement import SqliteManager
+from PySched.PySchedServer.DatabaseManagement.Tables import SqliteJob, SqliteUser
+from PySched.Common.Database.Query import createFilterFunction
+from PySched.Common.DataStructures import Job
+
+import argparse
+import datetime
+import random
+import shutil
+import tempfile
+import time
+
+def fillDatabase(dbController, count, start=0, userCount=1):
+    '''
+    @summary: Inserts count jobs into the database within one transaction
+    @param dbController: the SqliteManager
+    @param count: the count of jobs to insert
+    @param start: the count of jobs already within the database
+    @param userCount: the count of users owning the jobs
+    @result:
+    '''
+    s = dbController.sessionClass()
+    if start == 0:
+        for i in range(1, userCount + 1):
+            user = SqliteUser("user{}@pysched".format(i))
+            user.id = i
+            s.add(user)
+
+    for i in range(start, start + count):
+        job = SqliteJob()
+        job.name = "Job {}".format(i)
+        job.userId = i % userCount + 1
+        job.reqPrograms = ""
+        job.stateId = random.choice([0, 2, 5, 5, 10, 10, 100])
+        job.workstation = "ws{}".format(i % 50)
+        job.added = datetime.datetime.now()
+        s.add(job)
+
+    s.commit()
+    s.close()
+
+def legacyLookup(dbController, jobId):
+    '''
+    @summary: Job lookup as done before the filters were moved into the
+    database: load everything, convert everything, filter in python.
+    '''
+    s = dbController.sessionClass()
+    jobs = [item.convertToPySched() for item in s.query(SqliteJob)]
+    s.close()
+
+    result = filter(createFilterFunction(jobId=jobId), jobs)
+    if result:
+        return result[0]
+
+def timeLookups(lookup, dbController, jobIds):
+    '''
+    @summary: Returns the mean time of a lookup in milliseconds
+    '''
+    start = time.time()
+    for jobId in jobIds:
+        lookup(dbController, jobId)
+
+    return (time.time() - start) * 1000.0 / len(jobIds)
+
+def main():
+    parser = argparse.ArgumentParser(description="PySched database benchmark")
+    parser.add_argument("--sizes", default="1000,10000,80000",
+        help="Comma separated list of table sizes")
+    parser.add_argument("--lookups", type=int, default=50,
+        help="Lookups per table size")
+    parser.add_argument("--legacyLookups", type=int, default=3,
+        help="Lookups per table size for the python side filter")
+    args = parser.parse_args()
+
+    sizes = sorted([int(x) for x in args.sizes.split(",")])
+    workingDir = tempfile.mkdtemp()
+
+    try:
+        dbController = SqliteManager(workingDir)
+        current = 0
+
+        print "{:>10} {:>18} {:>18}".format(
+            "jobs", "python filter [ms]", "sql filter [ms]")
+
+        for size in sizes:
+            fillDatabase(dbController, size - current, current)
+            current = size
+
+            jobIds = [random.randint(1, size) for _ in range(args.lookups)]
+            legacy = timeLookups(legacyLookup, dbController,
+                jobIds[:args.legacyLookups])
+            pushedDown = timeLookups(
+                lambda db, jobId: db.getFromDatabase(Job, first=True,
+                    jobId=jobId),
+                dbController,
+                jobIds)
+
+            print "{:>10} {:>18.2f} {:>18.2f}".format(size, legacy, pushedDown)
+    finally:
+        shutil.rmtree(workingDir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@summary: Benchmark for the secondary indexes of the PySchedServer database.
+Runs the queries of getJobList, checkJobs, getJobCountOnWorkstation and
+getUser on a database without indexes (like a database created by an older
+version), upgrades the schema and runs them again.
+
+Usage: python IndexBenchmark.py [--jobs 100000] [--users 200] [--runs 20]
+'''
+
+from PySched.PySchedServer.DatabaseManagement import SqliteManager
+from PySched.Common.DataStructures import Job, JobState, User
+
+from DatabaseBenchmark import fillDatabase
+
+from sqlalchemy import inspect
+
+import argparse
+import shutil
+import tempfile
+import time
+
+def dropIndexes(dbController):
+    '''
+    @summary: Drops all secondary indexes, so the database looks like one
+    created by an older PySchedServer version.
+    '''
+    inspector = inspect(dbController.engine)
+    for table in inspector.get_table_names():
+        for index in inspector.get_indexes(table):
+            dbController.engine.execute(
+                'DROP INDEX "{}"'.format(index["name"]))
+
+def getQueries(users, workstations):
+    '''
+    @summary: Returns the benchmarked queries as (name, function) tuples.
+    Each function is called with the SqliteManager and the run number.
+    '''
+    return [
+        ("getJobList", lambda db, i: db.getFromDatabase(Job,
+            userId=i % users + 1,
+            stateId__lt=JobState.lookup("ARCHIVED"))),
+        ("checkJobs", lambda db, i: db.getFromDatabase(Job,
+            stateId__ge=JobState.lookup("RUNNING"),
+            stateId__lt=JobState.lookup("ARCHIVED"))),
+        ("getJobCountOnWorkstation", lambda db, i: db.getFromDatabase(Job,
+            workstation="ws{}".format(i % workstations),
+            stateId=JobState.lookup("RUNNING"))),
+        ("getUser", lambda db, i: db.getFromDatabase(User, first=True,
+            userId="user{}@pysched".format(i % users + 1))),
+        ]
+
+def runQueries(dbController, queries, runs):
+    '''
+    @summary: Returns a dictionary with the mean time in ms of each query.
+    '''
+    results = {}
+    for name, query in queries:
+        start = time.time()
+        for i in range(runs):
+            query(dbController, i)
+        results[name] = (time.time() - start) * 1000.0 / runs
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="PySched index benchmark")
+    parser.add_argument("--jobs", type=int, default=100000,
+        help="Count of jobs within the database")
+    parser.add_argument("--users", type=int, default=200,
+        help="Count of users owning the jobs")
+    parser.add_argument("--runs", type=int, default=20,
+        help="Runs per query")
+    args = parser.parse_args()
+
+    workingDir = tempfile.mkdtemp()
+
+    try:
+        dbController = SqliteManager(workingDir)
+        fillDatabase(dbController, args.jobs, userCount=args.users)
+        queries = getQueries(args.users, 50)
+
+        dropIndexes(dbController)
+        before = runQueries(dbController, queries, args.runs)
+
+        created = dbController.tables.upgradeSchema()
+        print "Created indexes: {}".format(", ".join(created))
+        after = runQueries(dbController, queries, args.runs)
+
+        print "{:>26} {:>14} {:>14}".format("query", "before [ms]", "after [ms]")
+        for name, _ in queries:
+            print "{:>26} {:>14.2f} {:>14.2f}".format(
+                name, before[name], after[name])
+    finally:
+        shutil.rmtree(workingDir)
+
+if __name__ == '__main__':
+    main()
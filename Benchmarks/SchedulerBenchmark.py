@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@summary: Benchmark for the scheduling strategies. Simulates the same
+synthetic workload with several scheduler configurations and prints
+makespan, mean waiting time, utilisation and scheduling decisions per second.
+The load configurations are simulated with periodic, noisy workstation
+informations and compare the raw and the smoothed cpu loads.
+
+With --check, a small deterministic workload is simulated instead and the
+exit code is 1 if a configuration leaves jobs unfinished, oversubscribes a
+workstation or exceeds the makespan and utilisation bounds. The check runs
+unattended, e.g. in a CI job.
+
+Usage: python SchedulerBenchmark.py [--workstations 50] [--jobs 2000]
+       python SchedulerBenchmark.py --check
+'''
+
+from PySched.PySchedServer.Scheduler.Simulator import Simulator, \
+    generateWorkstations, generateJobs
+
+import argparse
+import copy
+import sys
+
+# Compared configurations: (name, scheduling parameters)
+CONFIGURATIONS = [
+    ("single", {"batchPlacement": 0}),
+    ("batch", {"batchPlacement": 1, "backfill": 0}),
+    ("backfill", {"batchPlacement": 1, "backfill": 1}),
+    ]
+
+# Compared load configurations: (name, scheduling parameters)
+LOAD_CONFIGURATIONS = [
+    ("raw", {"loadSmoothing": 0}),
+    ("risk 0", {"loadSmoothing": 1, "loadRiskFactor": 0}),
+    ("risk 0.5", {"loadSmoothing": 1, "loadRiskFactor": 0.5}),
+    ("risk 1", {"loadSmoothing": 1, "loadRiskFactor": 1}),
+    ]
+
+# Workload of the --check mode
+CHECK_WORKSTATIONS = 5
+CHECK_JOBS = 50
+CHECK_SEED = 1
+
+# Bounds of the --check mode: the maximal makespan relative to the latest
+# job end without any waiting, and the minimal utilisation
+CHECK_MAKESPAN_FACTOR = 1.75
+CHECK_UTILISATION = 0.45
+
+def main():
+    parser = argparse.ArgumentParser(description="PySched scheduler benchmark")
+    parser.add_argument("--workstations", type=int, default=50,
+        help="Count of simulated workstations")
+    parser.add_argument("--jobs", type=int, default=2000,
+        help="Count of submitted jobs")
+    parser.add_argument("--interarrival", type=float, default=5.0,
+        help="Mean seconds between two submissions")
+    parser.add_argument("--runtime", type=float, default=1800.0,
+        help="Mean runtime of the jobs in seconds")
+    parser.add_argument("--big", type=float, default=0.2,
+        help="Share of multi cpu jobs")
+    parser.add_argument("--seed", type=int, default=1,
+        help="Seed of the workload generator")
+    parser.add_argument("--noise", type=float, default=0.05,
+        help="Probability of a load spike or dip per cpu and report")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+        help="Seconds between two workstation informations")
+    parser.add_argument("--check", action="store_true",
+        help="Simulate a small fixed workload and fail if a bound is missed")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check(args) else 1)
+
+    workstations = generateWorkstations(args.workstations, seed=args.seed)
+    jobs = generateJobs(args.jobs, interarrival=args.interarrival,
+        meanRuntime=args.runtime, bigShare=args.big, seed=args.seed)
+
+    print "{} workstations ({} cpus), {} jobs".format(len(workstations),
+        sum(workstation["cpuCount"] for workstation in workstations), len(jobs))
+    print "{:>10} {:>10} {:>13} {:>14} {:>12} {:>8} {:>12}".format(
+        "config", "finished", "makespan [h]", "mean wait [s]",
+        "utilisation", "passes", "decisions/s")
+
+    for name, params in CONFIGURATIONS:
+        results = Simulator(workstations, copy.deepcopy(jobs), params).run()
+        print "{:>10} {:>10} {:>13.2f} {:>14.0f} {:>11.1f}% {:>8} {:>12.0f}"\
+            .format(name, results["finished"], results["makespan"] / 3600.0,
+                results["meanWait"], results["utilisation"] * 100,
+                results["passes"], results["decisionsPerSecond"])
+
+    print
+    print "Load noise {:.0%}, workstation informations every {:.0f} s".format(
+        args.noise, args.report_interval)
+    print "{:>10} {:>10} {:>13} {:>14} {:>12} {:>15}".format(
+        "loads", "finished", "makespan [h]", "mean wait [s]", "utilisation",
+        "oversubscribed")
+
+    for name, params in LOAD_CONFIGURATIONS:
+        results = Simulator(workstations, copy.deepcopy(jobs), params,
+            reportInterval=args.report_interval, loadNoise=args.noise,
+            seed=args.seed).run()
+        print "{:>10} {:>10} {:>13.2f} {:>14.0f} {:>11.1f}% {:>15}".format(
+            name, results["finished"], results["makespan"] / 3600.0,
+            results["meanWait"], results["utilisation"] * 100,
+            results["oversubscribed"])
+
+def check(args):
+    '''
+    @summary: Simulates CHECK_JOBS jobs on CHECK_WORKSTATIONS workstations
+    with all configurations and checks the results. The load configurations
+    are simulated without load noise, thus no workstation may be
+    oversubscribed.
+    @param args: the parsed arguments (interarrival, runtime, big and
+    report_interval are used)
+    @result: True if all configurations pass
+    '''
+    workstations = generateWorkstations(CHECK_WORKSTATIONS, seed=CHECK_SEED)
+    jobs = generateJobs(CHECK_JOBS, interarrival=args.interarrival,
+        meanRuntime=args.runtime, bigShare=args.big, seed=CHECK_SEED)
+    maxMakespan = CHECK_MAKESPAN_FACTOR * max(submitTime + runtime
+        for submitTime, job, runtime in jobs)
+
+    runs = [(name, Simulator(workstations, copy.deepcopy(jobs), params))
+        for name, params in CONFIGURATIONS]
+    runs += [(name, Simulator(workstations, copy.deepcopy(jobs), params,
+        reportInterval=args.report_interval, loadNoise=0.0, seed=CHECK_SEED))
+        for name, params in LOAD_CONFIGURATIONS]
+
+    passed = True
+    for name, simulator in runs:
+        results = simulator.run()
+        failures = []
+        if results["finished"] != len(jobs):
+            failures.append("{} of {} jobs finished".format(
+                results["finished"], len(jobs)))
+        if results["oversubscribed"]:
+            failures.append("{} jobs oversubscribed".format(
+                results["oversubscribed"]))
+        if results["makespan"] > maxMakespan:
+            failures.append("makespan {:.2f} h > {:.2f} h".format(
+                results["makespan"] / 3600.0, maxMakespan / 3600.0))
+        if results["utilisation"] < CHECK_UTILISATION:
+            failures.append("utilisation {:.1%} < {:.1%}".format(
+                results["utilisation"], CHECK_UTILISATION))
+
+        print "{:>10} {}".format(name, "; ".join(failures) if failures
+            else "ok ({:.2f} h, {:.1%})".format(results["makespan"] / 3600.0,
+                results["utilisation"]))
+        passed = passed and not failures
+
+    return passed
+
+if __name__ == '__main__':
+    main()
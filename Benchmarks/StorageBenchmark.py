@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@summary: Benchmark for the storage profiles of the PySchedServer database.
+Runs job updates (as done for every received jobInfo) on a database with each
+profile and prints the updates per second.
+
+Usage: python StorageBenchmark.py [--jobs 1000] [--updates 2000]
+'''
+
+from PySched.PySchedServer.DatabaseManagement import SqliteManager
+from PySched.Common.Database.StorageProfile import PROFILES
+from PySched.Common.DataStructures import Job
+
+from DatabaseBenchmark import fillDatabase
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+def runUpdates(dbController, jobCount, updates):
+    '''
+    @summary: Updates random jobs and returns the updates per second
+    '''
+    jobs = dbController.getFromDatabase(Job, limit=jobCount)
+
+    start = time.time()
+    for i in range(updates):
+        job = random.choice(jobs)
+        job.stateId = random.choice([2, 5, 10])
+        dbController.updateDatabaseEntry(job)
+
+    return updates / (time.time() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="PySched storage benchmark")
+    parser.add_argument("--jobs", type=int, default=1000,
+        help="Count of jobs within the database")
+    parser.add_argument("--updates", type=int, default=2000,
+        help="Count of job updates per profile")
+    parser.add_argument("--profiles", default=",".join(sorted(PROFILES)),
+        help="Comma separated list of profiles")
+    args = parser.parse_args()
+
+    print "{:>10} {:>14} {:>16}".format("profile", "updates/s", "checkpoint [ms]")
+
+    for profile in args.profiles.split(","):
+        workingDir = tempfile.mkdtemp()
+        try:
+            dbController = SqliteManager(workingDir, profile=profile)
+            fillDatabase(dbController, args.jobs)
+            rate = runUpdates(dbController, args.jobs, args.updates)
+
+            start = time.time()
+            dbController.checkpoint("TRUNCATE")
+            checkpointTime = (time.time() - start) * 1000.0
+
+            print "{:>10} {:>14.1f} {:>16.2f}".format(
+                profile, rate, checkpointTime)
+        finally:
+            shutil.rmtree(workingDir)
+
+if __name__ == '__main__':
+    main()
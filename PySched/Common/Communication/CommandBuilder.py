@@ -80,6 +80,50 @@ class CommandBuilder(object):
         '''
         return CommandBuilder.buildCommand("addJob", path=pathToJobFile, **jobInformations)
 
+    @staticmethod
+    def buildAddJobsString(userId, jobs):
+        '''
+        @summary: Global Command. Creates an addJobs command, which adds
+        several jobs of one user at once.
+        @param userId: the user id of the owner of the jobs
+        @param jobs: a list of dictionaries with the job informations
+        @result:
+        '''
+        return CommandBuilder.buildCommand("addJobs", userId=userId, jobs=jobs)
+
+    @staticmethod
+    def buildAddJobDagString(userId, jobs):
+        '''
+        @summary: Global Command. Creates an addJobDag command, which adds a
+        workflow of dependent jobs of one user at once.
+        @param userId: the user id of the owner of the jobs
+        @param jobs: a list of dictionaries with the job informations. Jobs
+        of the workflow are referenced by their dagKey within the
+        dependencies, e.g. ["afterok:pre"]
+        @result:
+        '''
+        return CommandBuilder.buildCommand("addJobDag", userId=userId, jobs=jobs)
+
+    @staticmethod
+    def buildGetJobStatsString(userId):
+        '''
+        @summary: Global Command. Creates a getJobStats command, which
+        requests the count of jobs per state.
+        @param userId: the user id of the requesting user
+        @result:
+        '''
+        return CommandBuilder.buildCommand("getJobStats", userId=userId)
+
+    @staticmethod
+    def buildGetQueueString(userId):
+        '''
+        @summary: Global Command. Creates a getQueue command, which requests
+        the job queue of the scheduler. Admin only.
+        @param userId: the user id of the requesting user
+        @result:
+        '''
+        return CommandBuilder.buildCommand("getQueue", userId=userId)
+
 
     @staticmethod
     def buildPingString():
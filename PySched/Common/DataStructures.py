@@ -32,6 +32,13 @@ class Job(object):
         self.minMemory = None
         self.reqOS = None
         self.reqPrograms = []
+        self.priority = 0
+        # estimated runtime in seconds (optional)
+        self.walltime = None
+        # jobs which must end before this job, e.g. ["afterok:12"]
+        self.dependencies = []
+        # True when the job files have been received
+        self.uploaded = False
 
         # Process informations:
         self.executeStr = None
@@ -114,7 +121,8 @@ class JobState(object):
     '''
     @summary: Lookup dictionary for job states
     '''
-    table = {0: "QUEUED",
+    table = {-1: "WAITING_FOR_DEPENDENCIES",
+             0: "QUEUED",
              1: "PREPARED",
              2: "WAITING_FOR_WORKSTATION",
              3: "COMPILED",
@@ -129,6 +137,7 @@ class JobState(object):
              14: "WORKSTATION_ERROR",
              15: "PERMISSION_DENIED",
              16: "SCHEDULER_ERROR",
+             17: "DEPENDENCY_ERROR",
 
              99: "ARCHIVED",
              100: "ARCHIVED (DONE)",
@@ -138,6 +147,7 @@ class JobState(object):
              104: "ARCHIVED (WORKSTATION_ERROR)",
              105: "ARCHIVED (PERMISSION_DENIED)",
              106: "ARCHIVED (SCHEDULER_ERROR)",
+             107: "ARCHIVED (DEPENDENCY_ERROR)",
 
              999: "DELETED"}
 
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Runs all database accesses on dedicated threads. Writes are
+serialised on a single writer thread, reads may be run on additional reader
+threads. The results are returned as Deferreds, which are fired within the
+reactor thread.
+'''
+
+from twisted.internet import defer, reactor
+from twisted.python import failure
+from twisted.python.threadable import isInIOThread
+
+import logging
+import Queue
+import threading
+
+# Database functions which only read from the database
+READ_FUNCTIONS = ["getFromDatabase", "getJobLog", "getArchivedJobs"]
+
+class DatabaseExecutor(object):
+    '''
+    @summary: Executor for database accesses. Owns one writer thread and
+    optionally some reader threads. If no reader threads are used, all
+    accesses are run in order on the writer thread.
+    '''
+    def __init__(self, dbController, readerThreads=0, loggerName="PySchedServer"):
+        '''
+        @summary: Initializes the executor
+        @param dbController: the database manager. See
+        Common.Interfaces.DatabaseInterface
+        @param readerThreads: count of additional threads for reads
+        @param loggerName: the name of the logger to use
+        @result:
+        '''
+        self.logger = logging.getLogger(loggerName)
+        self.dbController = dbController
+        self.readerThreads = readerThreads
+
+        self.writeQueue = Queue.Queue()
+        if readerThreads > 0:
+            self.readQueue = Queue.Queue()
+        else:
+            self.readQueue = self.writeQueue
+
+        self.threads = []
+        self.running = False
+
+    def start(self):
+        '''
+        @summary: Starts the writer and reader threads
+        @result:
+        '''
+        if self.running:
+            return
+
+        self.running = True
+        self._startThread("DatabaseWriter", self.writeQueue)
+        for i in range(self.readerThreads):
+            self._startThread("DatabaseReader-{}".format(i), self.readQueue)
+
+        self.logger.info("Database executor started ({} reader threads).".
+            format(self.readerThreads))
+
+    def stop(self):
+        '''
+        @summary: Stops all threads after the queued tasks are done.
+        @result:
+        '''
+        if not self.running:
+            return
+
+        self.running = False
+        self.writeQueue.put(None)
+        if self.readQueue is not self.writeQueue:
+            for i in range(self.readerThreads):
+                self.readQueue.put(None)
+
+        for thread in self.threads:
+            if thread is not threading.currentThread():
+                thread.join()
+
+        self.threads = []
+        self.logger.info("Database executor stopped.")
+
+    # Deferred API
+    # ========================
+    def addToDatabase(self, obj):
+        return self.runWrite(self.dbController.addToDatabase, obj)
+
+    def getFromDatabase(self, objClass, **kwargs):
+        return self.runRead(self.dbController.getFromDatabase, objClass,
+            **kwargs)
+
+    def updateDatabaseEntry(self, obj):
+        return self.runWrite(self.dbController.updateDatabaseEntry, obj)
+
+    def deleteFromDatabase(self, obj):
+        return self.runWrite(self.dbController.deleteFromDatabase, obj)
+
+    def runWrite(self, function, *args, **kwargs):
+        '''
+        @summary: Runs the function on the writer thread.
+        @result: A Deferred which fires with the result of the function
+        '''
+        return self._runDeferred(self.writeQueue, function, args, kwargs)
+
+    def runRead(self, function, *args, **kwargs):
+        '''
+        @summary: Runs the function on a reader thread (or the writer thread
+        if no reader threads are used)
+        @result: A Deferred which fires with the result of the function
+        '''
+        return self._runDeferred(self.readQueue, function, args, kwargs)
+
+    # Blocking API
+    # ========================
+    def runBlocking(self, function, *args, **kwargs):
+        '''
+        @summary: Runs the function on the database threads and waits for the
+        result. Must not be used within the running reactor, use runRead or
+        runWrite there. If the executor is not running the function is called
+        directly.
+        @param write: (keyword) Run on the writer thread. Default True
+        @result: the result of the function
+        '''
+        assert not (reactor.running and isInIOThread()), \
+            "Blocking database access within the reactor thread"
+
+        write = kwargs.pop("write", True)
+
+        if not self.running or threading.currentThread() in self.threads:
+            return function(*args, **kwargs)
+
+        done = threading.Event()
+        result = {}
+
+        def callback(success, value):
+            result["success"] = success
+            result["value"] = value
+            done.set()
+
+        queue = self.writeQueue if write else self.readQueue
+        queue.put((function, args, kwargs, callback))
+        done.wait()
+
+        if not result["success"]:
+            result["value"].raiseException()
+
+        return result["value"]
+
+    def getBlockingProxy(self):
+        '''
+        @summary: Returns an object with the same functions as the
+        database manager, which run the call on the database threads and
+        wait for the result.
+        @result:
+        '''
+        return BlockingDatabaseProxy(self)
+
+    # Internal Functions
+    # ========================
+    def _startThread(self, name, queue):
+        thread = threading.Thread(target=self._work, args=(queue,), name=name)
+        thread.setDaemon(True)
+        self.threads.append(thread)
+        thread.start()
+
+    def _runDeferred(self, queue, function, args, kwargs):
+        d = defer.Deferred()
+
+        def callback(success, value):
+            if success:
+                reactor.callFromThread(d.callback, value)
+            else:
+                reactor.callFromThread(d.errback, value)
+
+        if not self.running:
+            try:
+                d.callback(function(*args, **kwargs))
+            except:
+                d.errback(failure.Failure())
+            return d
+
+        queue.put((function, args, kwargs, callback))
+        return d
+
+    def _work(self, queue):
+        '''
+        @summary: Thread main loop. Runs the queued tasks until a None task
+        is received.
+        '''
+        while True:
+            task = queue.get()
+            if task is None:
+                break
+
+            function, args, kwargs, callback = task
+            try:
+                value = function(*args, **kwargs)
+            except:
+                self.logger.error("Database access {} failed.".format(
+                    getattr(function, "__name__", function)))
+                callback(False, failure.Failure())
+            else:
+                callback(True, value)
+
+
+class BlockingDatabaseProxy(object):
+    '''
+    @summary: Synchronous view of a DatabaseExecutor. Every function of the
+    database manager is available and is run on the database threads.
+    '''
+    def __init__(self, executor):
+        self.executor = executor
+
+    def __getattr__(self, name):
+        function = getattr(self.executor.dbController, name)
+        if not callable(function):
+            return function
+
+        write = not name in READ_FUNCTIONS
+        def call(*args, **kwargs):
+            kwargs["write"] = write
+            return self.executor.runBlocking(function, *args, **kwargs)
+
+        return call
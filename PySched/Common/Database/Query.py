@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Translates PySched style filter arguments into SQLAlchemy queries.
+Every Sqlite table class provides a dictionary "filterColumns" which maps the
+attribute names of the PySched object to the attribute names of the Sqlite
+object. Filters on attributes within this dictionary are done by the database,
+all other filters are applied to the converted PySched objects.
+
+Filter arguments are given as keywords, e.g. stateId=5. A list as value
+selects all rows whose value is within the list. The suffixes __ne, __lt,
+__le, __gt and __ge may be appended to the keyword to compare with
+the corresponding operator, e.g. stateId__lt=10.
+'''
+
+from PySched.Common import str2Datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "lt": lambda a, b: a < b,
+    "le": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "ge": lambda a, b: a >= b,
+    }
+
+def splitFilterKey(key):
+    '''
+    @summary: Splits a filter keyword into attribute name and operator
+    @param key: the filter keyword e.g. "stateId__lt"
+    @result: a tuple (attribute, operator)
+    '''
+    if "__" in key:
+        attribute, operator = key.rsplit("__", 1)
+        if operator in OPERATORS:
+            return attribute, operator
+
+    return key, "eq"
+
+def coerceValue(column, value):
+    '''
+    @summary: Converts a filter value (which may be received as a string
+    over the network) to the python type of the given column.
+    @param column: the mapped column attribute
+    @param value: the value to convert
+    @result: the converted value or the original value if it can't be
+    converted
+    '''
+    if value is None:
+        return None
+
+    columnType = column.property.columns[0].type
+    try:
+        if isinstance(columnType, DateTime):
+            if isinstance(value, basestring):
+                return str2Datetime(value)
+        elif isinstance(columnType, Boolean):
+            if isinstance(value, basestring):
+                return value.lower() in ("true", "1")
+            return bool(value)
+        elif isinstance(columnType, Integer):
+            return int(value)
+        elif isinstance(columnType, Float):
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+
+    return value
+
+def createFilterFunction(**filterArgs):
+    '''
+    @summary: Creates a function from filterArgs to be used in a filter. Is
+    used for all filters which can't be handled by the database.
+    @param **filterArgs:
+    @result:
+    '''
+    def compare(itemValue, operator, value):
+        if operator == "eq":
+            return str(itemValue) == str(value)
+        if operator == "ne":
+            return str(itemValue) != str(value)
+        if itemValue is None:
+            return False
+        return OPERATORS[operator](itemValue, value)
+
+    def checkItem(item):
+        for key, value in filterArgs.iteritems():
+            attribute, operator = splitFilterKey(key)
+            itemValue = getattr(item, attribute, None)
+
+            if isinstance(value, (list, tuple, set)):
+                if not str(itemValue) in [str(v) for v in value]:
+                    return False
+            elif not compare(itemValue, operator, value):
+                return False
+
+        return True
+    return checkItem
+
+def buildQuery(session, sqliteClass, orderBy=None, **filterArgs):
+    '''
+    @summary: Creates a query for the given table class.
+    @param session: the database session
+    @param sqliteClass: the Sqlite table class to query
+    @param orderBy: name of the PySched attribute to order by. A leading '-'
+    sorts descending. If None, the rows are ordered by their id.
+    @param **filterArgs: the filters to apply
+    @result: a tuple (query, remainingFilters). remainingFilters is a
+    dictionary with all filters which could not be translated into SQL.
+    '''
+    columns = getattr(sqliteClass, "filterColumns", {})
+    query = session.query(sqliteClass)
+    remainingFilters = {}
+
+    for key, value in filterArgs.iteritems():
+        attribute, operator = splitFilterKey(key)
+        if not attribute in columns:
+            remainingFilters[key] = value
+            continue
+
+        column = getattr(sqliteClass, columns[attribute])
+        if isinstance(value, (list, tuple, set)):
+            values = [coerceValue(column, v) for v in value]
+            query = query.filter(column.in_(values))
+        else:
+            query = query.filter(
+                OPERATORS[operator](column, coerceValue(column, value)))
+
+    orderColumn = sqliteClass.id
+    if orderBy:
+        descending = orderBy.startswith("-")
+        attribute = orderBy.lstrip("-")
+        if attribute in columns:
+            orderColumn = getattr(sqliteClass, columns[attribute])
+            if descending:
+                orderColumn = orderColumn.desc()
+
+    query = query.order_by(orderColumn)
+
+    return query, remainingFilters
+
+def runQuery(session, sqliteClass, first=False, orderBy=None, limit=None,
+    offset=None, **filterArgs):
+    '''
+    @summary: Runs a filtered query and converts the result to PySched objects.
+    Limit and offset are done by the database as long as all filters could
+    be translated into SQL.
+    @param session: the database session
+    @param sqliteClass: the Sqlite table class to query
+    @param first: return only the first matching object (or None)
+    @param orderBy: see buildQuery
+    @param limit: maximal count of returned objects
+    @param offset: count of matching objects to skip
+    @param **filterArgs: the filters to apply
+    @result: a list of PySched objects or a single object if first is set
+    '''
+    query, remainingFilters = buildQuery(session, sqliteClass,
+        orderBy=orderBy, **filterArgs)
+
+    if not remainingFilters:
+        if first:
+            item = query.offset(offset).first()
+            if item:
+                return item.convertToPySched()
+            return None
+
+        return [item.convertToPySched() for item in
+            query.offset(offset).limit(limit)]
+
+    checkItem = createFilterFunction(**remainingFilters)
+    returnList = []
+    skip = offset or 0
+    for item in query:
+        obj = item.convertToPySched()
+        if not checkItem(obj):
+            continue
+        if skip > 0:
+            skip -= 1
+            continue
+
+        if first:
+            return obj
+
+        returnList.append(obj)
+        if limit and len(returnList) >= limit:
+            break
+
+    if first:
+        return None
+
+    return returnList
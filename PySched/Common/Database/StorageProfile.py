@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Storage profiles for the SQLite databases of server and client.
+A profile sets the journal mode, synchronous level, cache size and mmap size
+of every connection. Connections are pooled per thread and kept open.
+'''
+
+from twisted.internet.task import LoopingCall
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import SingletonThreadPool
+
+import logging
+
+# Pragmas per profile. cache_size < 0 is in KiB, mmap_size is in bytes.
+PROFILES = {
+    # The SQLite defaults. Every commit is synced to the disk.
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        },
+    # Write ahead log, synced on checkpoints only. A power loss may undo
+    # the last commits, but never corrupts the database.
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "wal_autocheckpoint": 10000,
+        },
+    # Write ahead log without syncs. Only for disposable databases.
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "wal_autocheckpoint": 10000,
+        },
+    }
+
+DEFAULT_PROFILE = "wal"
+
+# Interval of the checkpoint loop in seconds
+CHECKPOINT_INTERVAL = 30
+
+# Interval of the checkpoint loop in seconds if the executor has no reader
+# threads. The checkpoints are run on the writer thread then, between them
+# the wal_autocheckpoint of the profile limits the write ahead log.
+WRITER_CHECKPOINT_INTERVAL = 300
+
+def getProfile(profile=None):
+    '''
+    @summary: Returns the pragmas of a profile
+    @param profile: the name of the profile or a dictionary of pragmas.
+    If None the default profile is used.
+    @result: a dictionary pragma -> value
+    '''
+    if isinstance(profile, dict):
+        return profile
+
+    profile = profile or DEFAULT_PROFILE
+    if not profile in PROFILES:
+        raise ValueError("Unknown storage profile: {}".format(profile))
+
+    return PROFILES[profile]
+
+def createEngine(pathToDB, profile=None):
+    '''
+    @summary: Creates an engine for the given database file. Every thread
+    uses its own connection, which is kept open and configured with the
+    pragmas of the profile.
+    @param pathToDB: the path to the database file
+    @param profile: the storage profile. See getProfile
+    @result: the engine
+    '''
+    pragmas = getProfile(profile)
+    engine = create_engine("sqlite:////{}".format(pathToDB),
+        poolclass=SingletonThreadPool, pool_size=10)
+
+    def setPragmas(connection, connectionRecord):
+        cursor = connection.cursor()
+        # journal_mode must be set first, it is stored within the file.
+        if "journal_mode" in pragmas:
+            cursor.execute("PRAGMA journal_mode={}".format(
+                pragmas["journal_mode"]))
+        for pragma, value in pragmas.iteritems():
+            if pragma != "journal_mode":
+                cursor.execute("PRAGMA {}={}".format(pragma, value))
+        cursor.close()
+
+    event.listen(engine, "connect", setPragmas)
+    return engine
+
+def checkpoint(engine, mode="PASSIVE"):
+    '''
+    @summary: Copies the write ahead log into the database file. Does
+    nothing if the database doesn't use a write ahead log.
+    @param engine: the engine of the database
+    @param mode: the checkpoint mode (PASSIVE, FULL, RESTART or TRUNCATE)
+    @result: a tuple (busy, walPages, checkpointedPages). walPages is -1 if
+    the database doesn't use a write ahead log.
+    '''
+    connection = engine.connect()
+    try:
+        return tuple(connection.execute(
+            "PRAGMA wal_checkpoint({})".format(mode)).fetchone())
+    finally:
+        connection.close()
+
+
+class CheckpointLoop(object):
+    '''
+    @summary: Runs checkpoints of a database periodically. The checkpoints are
+    run by the DatabaseExecutor on a reader thread, so neither the reactor
+    nor the writer are blocked by them. An executor without reader threads
+    runs them on its writer thread, thus they are run less often then.
+    '''
+    def __init__(self, dbExecutor, interval=None,
+        loggerName="PySchedServer"):
+        '''
+        @summary: Initializes the loop
+        @param dbExecutor: the DatabaseExecutor of the database. Its database
+        manager needs a checkpoint function.
+        @param interval: the interval between two checkpoints in seconds.
+        Default CHECKPOINT_INTERVAL or, without reader threads,
+        WRITER_CHECKPOINT_INTERVAL
+        @param loggerName: the name of the logger to use
+        @result:
+        '''
+        self.logger = logging.getLogger(loggerName)
+        self.dbExecutor = dbExecutor
+        if interval is None:
+            interval = CHECKPOINT_INTERVAL if dbExecutor.readerThreads > 0 \
+                else WRITER_CHECKPOINT_INTERVAL
+        self.interval = interval
+        self.pending = False
+        self.loop = LoopingCall(self.checkpoint)
+
+    def start(self):
+        if not self.loop.running:
+            self.loop.start(self.interval, now=False)
+
+    def stop(self):
+        if self.loop.running:
+            self.loop.stop()
+
+    def checkpoint(self):
+        '''
+        @summary: Starts a checkpoint if the last one is finished.
+        @result:
+        '''
+        if self.pending:
+            return
+
+        self.pending = True
+        d = self.dbExecutor.runRead(self.dbExecutor.dbController.checkpoint)
+        d.addCallbacks(self._checkpointDone, self._checkpointFailed)
+
+    def _checkpointDone(self, result):
+        self.pending = False
+        busy, walPages, checkpointedPages = result
+        if walPages > 0:
+            self.logger.debug("Checkpoint: {} of {} pages written.".format(
+                checkpointedPages, walPages))
+
+    def _checkpointFailed(self, failure):
+        self.pending = False
+        self.logger.error("Checkpoint failed: {}".format(
+            failure.getErrorMessage()))
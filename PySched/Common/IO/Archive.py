@@ -25,11 +25,13 @@ def pack(outputPath, *args):
     tar.close()
     return outputPath
 
-def packFolder(outputPath, folder):
+def packFolder(outputPath, folder, exclude=None):
     '''
     @summary: Creates an uncompressed tar-File with all files in the specified folder.
     @param outputPath: Output Path for the TAR-Archiv
-    @param *args: List of files to put into the archive
+    @param folder: the folder to pack
+    @param exclude: paths (relative to the folder, separated by '/') of
+    files which are not packed
     @result:
     '''
 
@@ -37,26 +39,28 @@ def packFolder(outputPath, folder):
     files = os.listdir(folder)
     for filename in files:
         arcName = filename
-        addToArchive(tar, os.path.join(folder, filename), arcName)
+        addToArchive(tar, os.path.join(folder, filename), arcName, exclude)
 
     tar.close()
     return outputPath
 
-def addToArchive(tar, filename, arcName):
+def addToArchive(tar, filename, arcName, exclude=None):
     '''
     @summary: Recursive function.
     Adds a file or directory to an tar archive
     @param tar: an tar object to add the file to
     @param filename: the filename
     @param arcName: the filename within the archive
+    @param exclude: archive names (separated by '/') of files which are not
+    added
     '''
 
     if os.path.isdir(filename):
         files = os.listdir(filename)
         for f in files:
-            addToArchive(tar, os.path.join(filename, f), os.path.join(arcName, os.path.split(f)[1]))
+            addToArchive(tar, os.path.join(filename, f), os.path.join(arcName, os.path.split(f)[1]), exclude)
 
-    else:
+    elif not exclude or not arcName.replace(os.sep, "/") in exclude:
         tar.add(name=filename, arcname=arcName)
 
 def unpack(filename, path=None):
@@ -146,6 +146,19 @@ def getFileMD5Hashsum(path):
 
     return md5_hash.hexdigest()
 
+def getFileSHA1Hashsum(path):
+    '''
+    @summary: Computes the SHA1-Hashsum of the given File
+    @param pathToFile: Path to file
+    @result: The SHA1-Hashsum as String
+    '''
+    path = expandPath(path)
+    sha1_hash = hashlib.sha1()
+    for bytes in readBytesFromFile(path, chunk_size=1024 * 1024):
+        sha1_hash.update(bytes)
+
+    return sha1_hash.hexdigest()
+
 def readBytesFromFile(path, chunk_size=1000):
     '''
     @summary: Reads the given File chunk-wise.
@@ -31,12 +31,22 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
-    def readFromDatabase(self, type):
+    def getFromDatabase(self, type, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
         '''
         @summary: Returns a list containing all Elements of the given
-        type from the database
+        type from the database which pass the filter. Implementations should
+        do the filtering within the database where possible.
+        See Common.Database.Query for the supported filter arguments.
         @param type: A PySched-Object type
-        @result: Returns a list of all elements of the type within the database
+        @param first: If true, only the first matching element (or None)
+        is returned
+        @param orderBy: Attribute name to order by. A leading '-' sorts
+        descending
+        @param limit: Maximal count of returned elements
+        @param offset: Count of matching elements to skip
+        @param **filterArgs: a List of filters to use. E.g. jobId=0
+        @result: Returns a list of all matching elements within the database
         '''
         raise NotImplementedError
 
@@ -37,7 +37,7 @@ class SchedulerInterface(object):
         if job.stateId < JobState.lookup("PREPARED"):
             self.logger.info("Preparing Job {}...".format(job.jobId))
             if not self.prepareJob(job):
-                job.log("Failed to prepare Job.")
+                self.pySchedServer.addToJobLog(job.jobId, "Failed to prepare Job.")
                 self.logger.error("Failed to prepare Job {jobId}".format(jobId=job.jobId))
                 job.stateId = JobState.lookup("SCHEDULER_ERROR")
                 self.pySchedServer.updateDatabaseEntry(job)
@@ -45,7 +45,7 @@ class SchedulerInterface(object):
 
         self.logger.info("Check job permissions for job {}...".format(job.jobId))
         if not self.checkJobPermission(job):
-            job.log("Job has not the demanded permissions")
+            self.pySchedServer.addToJobLog(job.jobId, "Job has not the demanded permissions")
             self.logger.error("Can't run job {jobId}. Job permission denied.".format(jobId=job.jobId))
             job.stateId = JobState.lookup("PERMISSION_DENIED")
             self.pySchedServer.updateDatabaseEntry(job)
@@ -53,7 +53,7 @@ class SchedulerInterface(object):
 
         self.logger.info("Check user permissions for job {}...".format(job.jobId))
         if not self.checkUserPermission(job):
-            job.log("User has not the demanded permission")
+            self.pySchedServer.addToJobLog(job.jobId, "User has not the demanded permission")
             self.logger.error("Can't run job {jobId}. User permission denied".format(jobId=job.jobId))
             job.stateId = JobState.lookup("PERMISSION_DENIED")
             self.pySchedServer.updateDatabaseEntry(job)
@@ -76,7 +76,7 @@ class SchedulerInterface(object):
 
         self.logger.info("Compile Job {}...".format(job.jobId))
         if not self.compileJob(job):
-            job.log("Failed to compile the Job.")
+            self.pySchedServer.addToJobLog(job.jobId, "Failed to compile the Job.")
             self.logger.error("Failed to compile job {jobId}".format(jobId=job.jobId))
             job.stateId = JobState.lookup("COMPILER_ERROR")
             self.pySchedServer.updateDatabaseEntry(job)
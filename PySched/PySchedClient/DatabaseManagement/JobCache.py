@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: In-memory copy of the job table of the client. The client only
+stores the jobs of its workstation, thus all jobs are kept in memory and
+the reactor reads them without a database access. Writes update the cache
+at once and are written by the database writer thread in order.
+'''
+
+from PySched.Common.DataStructures import Job
+from PySched.Common.Database.Query import createFilterFunction
+
+import copy
+import logging
+import threading
+
+class JobCache(object):
+    '''
+    @summary: Write-behind cache of the client jobs
+    '''
+    def __init__(self, dbExecutor):
+        '''
+        @summary: Initializes the cache
+        @param dbExecutor: the DatabaseExecutor of the client database
+        @result:
+        '''
+        self.logger = logging.getLogger("PySchedClient")
+        self.dbExecutor = dbExecutor
+        self.lock = threading.Lock()
+
+        # jobId -> Job
+        self.jobs = {}
+
+    def load(self):
+        '''
+        @summary: Reads all jobs from the database. Must be called before the
+        reactor is started.
+        @result:
+        '''
+        jobs = self.dbExecutor.runBlocking(
+            self.dbExecutor.dbController.getFromDatabase, Job, write=False)
+        with self.lock:
+            self.jobs = dict((self._key(job.jobId), job) for job in jobs)
+
+        self.logger.info("{} jobs loaded.".format(len(self.jobs)))
+
+    def get(self, first=False, orderBy=None, limit=None, offset=None,
+        **filterArgs):
+        '''
+        @summary: Returns the jobs passing the filter. See
+        DatabaseInterface.getFromDatabase
+        @result: a list of jobs or a job if first is set
+        '''
+        checkItem = createFilterFunction(**filterArgs)
+        with self.lock:
+            jobs = [job for job in self.jobs.itervalues() if checkItem(job)]
+
+        descending = bool(orderBy) and orderBy.startswith("-")
+        attribute = orderBy.lstrip("-") if orderBy else "jobId"
+        jobs.sort(key=lambda job: getattr(job, attribute, None),
+            reverse=descending)
+
+        jobs = jobs[offset or 0:]
+        if first:
+            return self._copy(jobs[0]) if jobs else None
+
+        if limit:
+            jobs = jobs[:limit]
+        return [self._copy(job) for job in jobs]
+
+    def add(self, job):
+        '''
+        @summary: Adds a job to the cache and queues the database write
+        @param job: the job
+        @result: a copy of the cached job
+        '''
+        return self._write(job, self.dbExecutor.addToDatabase)
+
+    def update(self, job):
+        '''
+        @summary: Updates a job within the cache and queues the database write
+        @param job: the job
+        @result: a copy of the cached job
+        '''
+        return self._write(job, self.dbExecutor.updateDatabaseEntry)
+
+    # Internal Functions
+    # ========================
+    def _write(self, job, write):
+        job = self._copy(job)
+        with self.lock:
+            self.jobs[self._key(job.jobId)] = job
+
+        d = write(self._copy(job))
+        d.addErrback(self._writeFailed, job.jobId)
+        return self._copy(job)
+
+    def _writeFailed(self, failure, jobId):
+        self.logger.error("Failed to write job {}: {}".format(jobId,
+            failure.getErrorMessage()))
+
+    def _key(self, jobId):
+        '''
+        @summary: Ids may be received as strings over the network.
+        '''
+        try:
+            return int(jobId)
+        except (TypeError, ValueError):
+            return jobId
+
+    def _copy(self, job):
+        '''
+        @summary: Returns a copy of the job. Callers modify the returned
+        jobs, thus the cached job must not be handed out.
+        '''
+        result = copy.copy(job)
+        for key, value in job.__dict__.iteritems():
+            if isinstance(value, (list, dict)):
+                setattr(result, key, copy.copy(value))
+
+        return result
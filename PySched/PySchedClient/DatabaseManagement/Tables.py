@@ -42,6 +42,18 @@ class SqliteJob(Tables.declBase):
     stateId = Column('stateId', Integer)
     log = Column('log', String)
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "jobId": "id",
+        "jobName": "name",
+        "jobDescription": "jobDescription",
+        "executeStr": "executeStr",
+        "added": "added",
+        "started": "started",
+        "finished": "finished",
+        "stateId": "stateId",
+        }
+
     def __init__(self, name, jobDescription, executeStr):
         '''
         @summary: Creates an Job instance.
@@ -132,6 +144,11 @@ class SqliteProgram(Tables.declBase):
     name = Column("programName", String)
     path = Column("programExec", String)
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "programName": "name",
+        "programExec": "path",
+        }
     def __init__(self, programName, programExec):
         self.name = programName
         self.path = programExec
@@ -7,10 +7,11 @@ Created on 2012-12-04 14:54
 
 from PySched.Common.Interfaces.DatabaseInterface import DatabaseInterface
 from PySched.Common.DataStructures import Job, Program
+from PySched.Common.Database.Query import runQuery
+from PySched.Common.Database.StorageProfile import createEngine, checkpoint
 
 from Tables import SqliteJob, SqliteProgram, Tables
 
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 import logging
@@ -20,10 +21,16 @@ class SqliteManager(DatabaseInterface):
     '''
     @summary: SQLite implementation of the base database manager.
     '''
-    def __init__(self, workingDir):
+    def __init__(self, workingDir, profile=None):
+        '''
+        @summary: Opens (or creates) the database
+        @param workingDir: the directory of the database file
+        @param profile: the storage profile. See Common.Database.StorageProfile
+        @result:
+        '''
         super(SqliteManager, self).__init__(workingDir)
         self.pathToDB = os.path.join(self.workingDir, "PySchedClient.sqlite")
-        self.engine = create_engine("sqlite:////{}".format(self.pathToDB))
+        self.engine = createEngine(self.pathToDB, profile)
         self.sessionClass = sessionmaker(bind=self.engine)
         self.tables = Tables(self.engine)
         self.tables.createAllTables()
@@ -31,6 +38,14 @@ class SqliteManager(DatabaseInterface):
 
         self.logger.info("Database up and running.")
 
+    def checkpoint(self, mode="PASSIVE"):
+        '''
+        @summary: Writes the write ahead log into the database file
+        @param mode: the checkpoint mode
+        @result: see StorageProfile.checkpoint
+        '''
+        return checkpoint(self.engine, mode)
+
     def addToDatabase(self, obj):
         self.logger.debug("Adding {} to database...".format(type(obj)))
 
@@ -50,8 +65,10 @@ class SqliteManager(DatabaseInterface):
 
         return obj
 
-    def getFromDatabase(self, obj):
-        self.logger.debug("Retrieving {} to database...".format(obj))
+    def getFromDatabase(self, obj, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
+        self.logger.debug("Retrieving {} from database ({})...".format(
+            obj, filterArgs))
 
         sqliteObject = None
         if obj == Job:
@@ -60,16 +77,11 @@ class SqliteManager(DatabaseInterface):
             sqliteObject = SqliteProgram
 
         s = self.sessionClass()
-        returnList = []
-
-        query = s.query(sqliteObject)
-
-        for item in query:
-            returnList.append(item.convertToPySched())
-
+        result = runQuery(s, sqliteObject, first=first, orderBy=orderBy,
+            limit=limit, offset=offset, **filterArgs)
         s.close()
 
-        return returnList
+        return result
 
     def updateDatabaseEntry(self, obj):
         self.logger.debug("Updating object in database...")
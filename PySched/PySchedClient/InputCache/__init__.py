@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Content addressed cache of job input files. The files are stored
+by their SHA1 digest, the digests are reported to the server, which doesn't
+transfer cached files again.
+'''
+
+from PySched.Common.IO import FileUtils
+
+from collections import OrderedDict
+
+import logging
+import os
+import threading
+import time
+
+# Maximal size (bytes) of the cached files
+INPUT_CACHE_SIZE = 10 * 1024**3
+
+# Seconds an evicted file is kept. The server may still expect the file
+# until the next workstation informations are received.
+RETIRE_DELAY = 300
+
+
+class InputCache(object):
+    '''
+    @summary: Input cache of the workstation. Files are evicted in least
+    recently used order.
+    '''
+    def __init__(self, workingDir, maxSize=INPUT_CACHE_SIZE,
+        retireDelay=RETIRE_DELAY):
+        '''
+        @summary: Initializes the cache
+        @param workingDir: the working directory of the client
+        @param maxSize: the maximal size of the cached files
+        @param retireDelay: seconds an evicted file is kept
+        @result:
+        '''
+        self.logger = logging.getLogger("PySchedClient")
+        self.cacheDir = os.path.join(workingDir, "inputCache")
+        self.maxSize = maxSize
+        self.retireDelay = retireDelay
+        self.lock = threading.Lock()
+
+        # digest -> size in least recently used order
+        self.entries = OrderedDict()
+        self.size = 0
+
+        # Evicted files: digest -> (size, time of the eviction)
+        self.retired = {}
+
+        FileUtils.createDirectory(self.cacheDir)
+        self._loadEntries()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def getDigests(self):
+        '''
+        @summary: Returns the digests of the cached files
+        @result:
+        '''
+        with self.lock:
+            return self.entries.keys()
+
+    def add(self, path, digest):
+        '''
+        @summary: Adds a file to the cache
+        @param path: path to the file
+        @param digest: the SHA1 digest of the file, the file is not cached
+        if it doesn't match
+        @result: True if the file is cached
+        '''
+        with self.lock:
+            if self._touch(digest):
+                return True
+
+        if FileUtils.getFileSHA1Hashsum(path) != digest:
+            self.logger.warning("Digest of {} doesn't match, file not cached."
+                .format(path))
+            return False
+
+        cachePath = os.path.join(self.cacheDir, digest)
+        tempPath = cachePath + ".tmp"
+        FileUtils.copyFile(path, tempPath)
+        os.rename(tempPath, cachePath)
+        size = os.path.getsize(cachePath)
+
+        with self.lock:
+            if not digest in self.entries:
+                self.entries[digest] = size
+                self.size += size
+            self._evict()
+        return True
+
+    def restore(self, digest, dest):
+        '''
+        @summary: Copies a cached file
+        @param digest: the SHA1 digest of the file
+        @param dest: the destination
+        @result: True if the file was cached
+        '''
+        with self.lock:
+            if not self._touch(digest):
+                return False
+
+        FileUtils.createDirectory(os.path.split(dest)[0])
+        FileUtils.copyFile(os.path.join(self.cacheDir, digest), dest)
+        return True
+
+    # Internal Functions
+    # ========================
+    def _loadEntries(self):
+        files = []
+        for digest in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, digest)
+            if digest.endswith(".tmp"):
+                FileUtils.deleteFile(path)
+            else:
+                files.append((os.path.getmtime(path), digest,
+                    os.path.getsize(path)))
+
+        for mtime, digest, size in sorted(files):
+            self.entries[digest] = size
+            self.size += size
+
+        self._evict()
+        self.logger.info("Input cache: {} files, {} bytes.".format(
+            len(self.entries), self.size))
+
+    def _touch(self, digest):
+        '''
+        @summary: Marks a file as used. Retired files are cached again.
+        @result: True if the file is available
+        '''
+        if digest in self.entries:
+            self.entries[digest] = self.entries.pop(digest)
+        elif digest in self.retired:
+            size, retired = self.retired.pop(digest)
+            self.entries[digest] = size
+            self.size += size
+        else:
+            return False
+
+        path = os.path.join(self.cacheDir, digest)
+        try:
+            os.utime(path, None)
+        except OSError:
+            self.size -= self.entries.pop(digest)
+            return False
+        return True
+
+    def _evict(self):
+        '''
+        @summary: Retires the least recently used files until the cache fits
+        into its size and deletes files retired for more than retireDelay
+        seconds.
+        '''
+        now = time.time()
+        while self.size > self.maxSize and len(self.entries) > 1:
+            digest, size = self.entries.popitem(last=False)
+            self.size -= size
+            self.retired[digest] = (size, now)
+
+        for digest, (size, retired) in self.retired.items():
+            if now - retired > self.retireDelay:
+                del self.retired[digest]
+                FileUtils.deleteFile(os.path.join(self.cacheDir, digest))
@@ -95,9 +95,8 @@ class JobRunner(JobRunnerInterface):
         process = self.runningJobs.get(jobId, None)
 
         if process:
-            pid = process.pid
-            p = psutil.Process(pid)
-            p.suspend()
+            for p in self.getProcessTree(process.pid):
+                p.suspend()
             return True
         return False
 
@@ -111,14 +110,28 @@ class JobRunner(JobRunnerInterface):
 
         if process:
             try:                
-                pid = process.pid                
-                p = psutil.Process(pid)
-                p.resume()
+                for p in self.getProcessTree(process.pid):
+                    p.resume()
                 return True
             except:
                 return False
         return False    
 
+    def getProcessTree(self, pid):
+        '''
+        @summary: Returns the process and all its child processes, e.g. the
+        programs started by a job script.
+        @param pid: the process id
+        @result: a list of psutil.Process objects
+        '''
+        p = psutil.Process(pid)
+        # psutil < 2.0 names the function get_children
+        children = getattr(p, "children", None) or getattr(p, "get_children")
+        try:
+            return [p] + children(recursive=True)
+        except psutil.NoSuchProcess:
+            return [p]
+
 
     def jobStarted(self, jobId):
         '''
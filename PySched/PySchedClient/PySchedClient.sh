@@ -8,6 +8,7 @@ import sys
 
 def main(args=None):
     from PySched import PySchedClient
+    from PySched.Common.Database.StorageProfile import PROFILES, DEFAULT_PROFILE
     #===============================================================================
     # Main Client Program
     #===============================================================================
@@ -17,6 +18,8 @@ def main(args=None):
     parser.add_argument("-d", '--debug', action='store_true', help="Debug mode")
     parser.add_argument("-k", '--key', help="Path to the server key")
     parser.add_argument("-m", '--multicast', help="Use non standard multicast group")
+    parser.add_argument("--dbProfile", choices=sorted(PROFILES.keys()), default=DEFAULT_PROFILE,
+        help="Storage profile of the database (default: {})".format(DEFAULT_PROFILE))
     parser.add_argument("workingDir", help="Sets the directory for job storage and execution")
     
     if not args:
@@ -96,7 +96,8 @@ class WIM(WIMInterface):
             "diskFree": psutil.disk_usage(
                 self.pySchedClient.workingDir)[2] / (1024**3),
             "reservedCpus": self.pySchedClient.getReservedCPUCount(),
-            "maintenance": self.checkForMaintenanceFile()
+            "maintenance": self.checkForMaintenanceFile(),
+            "inputCache": self.pySchedClient.inputCache.getDigests()
         })
 
     def checkForPrograms(self, programs):
@@ -13,9 +13,13 @@ from PySched.Common.Communication.CommandBuilder import CommandBuilder
 from PySched.Common.IO import FileUtils, Archive
 from PySched.Common import datetime2Str
 from PySched.Common.DataStructures import Job, JobState, Program
+from PySched.Common.Database.DatabaseExecutor import DatabaseExecutor
+from PySched.Common.Database.StorageProfile import CheckpointLoop
 
 from DatabaseManagement import SqliteManager
+from DatabaseManagement.JobCache import JobCache
 from WorkstationInformationManager import WIM
+from InputCache import InputCache
 from JobRunner import JobRunner
 from NetworkManagement import NetworkManager
 from MessageHandler import MessageHandler
@@ -67,6 +71,10 @@ class PySchedClient(object):
         # Init
         self.reservedCpus = {}
 
+        # Input files of the received jobs: jobId -> (inputFiles, cachedInputs)
+        self.jobInputs = {}
+        self.inputCache = InputCache(self.workingDir)
+
         # Load additional Path
         if os.path.exists(os.path.join(self.workingDir, "PATHS")):
             self.logger.info("Reading additional PATHS...")
@@ -79,7 +87,21 @@ class PySchedClient(object):
         self.jobRunner = JobRunner(self)
 
         # Database. Database class needs to extend Common.Interfaces.DatabaseInterface
-        self.dbController = SqliteManager(self.workingDir)
+        # All accesses are run in order on the database thread. Writes are
+        # not waited for.
+        self.dbExecutor = DatabaseExecutor(
+            SqliteManager(self.workingDir, profile=args.dbProfile),
+            loggerName="PySchedClient")
+        self.dbExecutor.start()
+        self.checkpointLoop = CheckpointLoop(self.dbExecutor,
+            loggerName="PySchedClient")
+        self.checkpointLoop.start()
+        self.dbController = self.dbExecutor.getBlockingProxy()
+
+        # Jobs are read from memory, the reactor never waits for the
+        # database.
+        self.jobCache = JobCache(self.dbExecutor)
+        self.jobCache.load()
         self.logger.info("Database Manager initialized.")
 
         # WIM
@@ -158,61 +180,64 @@ class PySchedClient(object):
     # =====================================================
     def addToDatabase(self, obj):
         '''
-        @summary: Adds the given object to the database
-        @param obj: The object to add.
-        @result:
+        @summary: Adds the given job to the database. The job is written by
+        the database thread.
+        @param obj: The job to add.
+        @result: The added job
         '''
-        return self.dbController.addToDatabase(obj)
+        return self.jobCache.add(obj)
 
 
-    def getFromDatabase(self, objClass, first=False, **filterArgs):
+    def getFromDatabase(self, objClass, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
         '''
         @summary: Returns a list of all <type> that passes the filter
         from the database.
         @param type: Which object should be read from the database
+        @param first: Return only the first object that passes the filter
+        @param orderBy: Attribute to order by. A leading '-' sorts descending
+        @param limit: Maximal count of returned objects
+        @param offset: Count of objects to skip
         @param **filterArgs: a List of filters to use. E.g. id=0
         @result:
         '''
-        objects = self.dbController.getFromDatabase(objClass)
-        self.logger.debug("Retrieved {} object from database".format(len(objects)))
+        if objClass == Job:
+            result = self.jobCache.get(first=first, orderBy=orderBy,
+                limit=limit, offset=offset, **filterArgs)
+        else:
+            result = self.dbController.getFromDatabase(objClass, first=first,
+                orderBy=orderBy, limit=limit, offset=offset, **filterArgs)
+
+        if first:
+            return result
 
-        returnList = filter(self.createFilterFunction(**filterArgs), objects)
-        self.logger.debug("{} of {} objects passed the filter function ({})".format(len(returnList), len(objects), filterArgs))
+        self.logger.debug("{} objects passed the filter function ({})".format(
+            len(result), filterArgs))
 
-        if len(returnList) == 0:
+        if len(result) == 0:
             return None
 
-        if first:
-            return returnList[0]
-
-        return returnList
+        return result
 
     def updateDatabaseEntry(self, obj):
         '''
-        @summary: Updates the entry within the database
+        @summary: Updates the entry within the database. The entry is written
+        by the database thread.
         @param obj: the object to update
-        @result:
+        @result: the updated object (jobs) or a Deferred which fires with the
+        updated object
         '''
-        return self.dbController.updateDatabaseEntry(obj)
+        if isinstance(obj, Job):
+            return self.jobCache.update(obj)
 
+        d = self.dbExecutor.updateDatabaseEntry(obj)
+        d.addErrback(self.databaseError)
+        return d
 
-    def createFilterFunction(self, **filterArgs):
-        '''
-        @summary: Creates a function from filterArgs to be used in
-        a filter.
-        @param **filterArgs:
-        @result:
-        '''
-        def checkItem(item):
-            for key, value in filterArgs.iteritems():
-                self.logger.debug("Check object for {}={}".format(key, value))
-                if str(getattr(item, key, None)) != str(value):
-                    self.logger.debug("Object discarded. Key: {}, Value: {}, Needed Value: {}".format(key, getattr(item, key, None), value))
-                    return False
-                self.logger.debug("Object passed.")
+    def databaseError(self, failure):
+        self.logger.error("Database access failed: {}".format(
+            failure.getErrorMessage()))
 
-            return True
-        return checkItem
 
     # PySchedFunctions
     # =====================================================
@@ -233,11 +258,13 @@ class PySchedClient(object):
 
     def reserveCPU(self, jobId):
         '''
-        @summary: Reserves a CPU for an job.
+        @summary: Reserves a CPU for an job until the job is started or
+        ended, at most for 30 minutes.
         @param jobId: the jobId
         @result: 
         '''
         if jobId:
+            self.setCpuFree(jobId)
             self.reservedCpus[jobId] = reactor.callLater(
                 1800, self.setCpuFree, jobId)
 
@@ -248,7 +275,9 @@ class PySchedClient(object):
         @result: 
         '''
         try:
-            del self.reservedCpus[jobId]
+            timer = self.reservedCpus.pop(jobId)
+            if timer.active():
+                timer.cancel()
         except:
             pass
 
@@ -271,7 +300,13 @@ class PySchedClient(object):
         job = self.getFromDatabase(Job, jobId=jobInformations["jobId"], first=True)
         remotePath = jobInformations.get("path", None)
 
+        # Input files which are cached or have to be cached (see fileReceived)
+        inputFiles = jobInformations.pop("inputFiles", None) or {}
+        cachedInputs = jobInformations.pop("cachedInputs", None) or []
+
         if not job or not remotePath:
+            self.jobInputs[str(jobInformations["jobId"])] = (inputFiles,
+                cachedInputs)
             job = Job()
             job.__dict__.update(jobInformations)
             self.addToDatabase(job)
@@ -304,13 +339,22 @@ class PySchedClient(object):
         self.createFileIndex(jobId)
 
         if not self.jobRunner.runJob(job):
-            job.stateId = JobState.lookup("WORKSTATION_ERROR")
-            job.started = datetime2Str(datetime.datetime.now())
-            job.finished = job.started
-            self.updateDatabaseEntry(job)
-            self.setCpuFree(jobId)
-            self.logger.info("Sending updated JobState of Job {}".format(job.jobId))
-            self.networkManager.sendMessage(self.serverId, CommandBuilder.buildJobInformationString(**job.__dict__))
+            self.jobFailed(job)
+
+    def jobFailed(self, job):
+        '''
+        @summary: Sets a job which couldn't be started to WORKSTATION_ERROR
+        and reports it to the server.
+        @param job: the job
+        @result:
+        '''
+        job.stateId = JobState.lookup("WORKSTATION_ERROR")
+        job.started = datetime2Str(datetime.datetime.now())
+        job.finished = job.started
+        self.updateDatabaseEntry(job)
+        self.setCpuFree(job.jobId)
+        self.logger.info("Sending updated JobState of Job {}".format(job.jobId))
+        self.networkManager.sendMessage(self.serverId, CommandBuilder.buildJobInformationString(**job.__dict__))
 
     def updateJobData(self, jobId, remotePath):
         '''
@@ -342,6 +386,7 @@ class PySchedClient(object):
         job.stateId = JobState.lookup("RUNNING")
         job.started = datetime2Str(datetime.datetime.now())        
         self.updateDatabaseEntry(job)
+        self.setCpuFree(job.jobId)
         self.logger.info("Sending updated JobState of Job {}".format(job.jobId))
         self.networkManager.sendMessage(self.serverId, CommandBuilder.buildJobInformationString(**job.__dict__))
         self.sendWorkstationState()
@@ -364,6 +409,7 @@ class PySchedClient(object):
                 job.stateId = JobState.lookup("ERROR")
 
         self.updateDatabaseEntry(job)
+        self.setCpuFree(job.jobId)
         self.cleanupJobDir(jobId)
 
         self.networkManager.sendMessage(self.serverId, 
@@ -577,7 +623,34 @@ class PySchedClient(object):
             FileUtils.copyFile(pathToFile, dest)
             Archive.unpack(dest)
             FileUtils.deleteFile(dest)
-            reactor.callInThread(self.runJob, jobId)
+            reactor.callInThread(self.prepareInputs, jobId)
+
+    def prepareInputs(self, jobId):
+        '''
+        @summary: Copies the cached input files into the job directory and
+        adds the received input files to the input cache. Runs the job
+        afterwards. Is run on a worker thread, the job is started within the
+        reactor.
+        @param jobId: the id of the job
+        @result:
+        '''
+        jobDir = os.path.join(self.workingDir, str(jobId))
+        inputFiles, cachedInputs = self.jobInputs.pop(str(jobId), ({}, []))
+
+        for path, digest in inputFiles.iteritems():
+            filePath = os.path.join(jobDir, *path.split("/"))
+            if path in cachedInputs:
+                if not self.inputCache.restore(digest, filePath):
+                    self.logger.error("Input file {} of job {} not cached."
+                        .format(path, jobId))
+                    job = self.getFromDatabase(Job, first=True, jobId=jobId)
+                    if job:
+                        reactor.callFromThread(self.jobFailed, job)
+                    return
+            elif os.path.isfile(filePath):
+                self.inputCache.add(filePath, digest)
+
+        reactor.callFromThread(self.runJob, jobId)
 
     def createFileIndex(self, jobId):
         '''
@@ -682,7 +755,9 @@ class PySchedClient(object):
             self.stopNetworkServices()
         except:
             pass
-        
+
+        self.checkpointLoop.stop()
+        self.dbExecutor.stop()
         reactor.stop()
 
     def getVersion(self):
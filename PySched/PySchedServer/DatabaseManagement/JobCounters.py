@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Job counters by state, user and workstation. The counters are
+built from the database at startup and updated by the SqliteManager on every
+write, thus counting jobs doesn't need a database access.
+'''
+
+from collections import defaultdict
+
+import threading
+
+class JobCounters(object):
+    '''
+    @summary: Counts the jobs per state, per (user, state) and per
+    (workstation, state).
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.byState = defaultdict(int)
+            self.byUser = defaultdict(int)
+            self.byWorkstation = defaultdict(int)
+
+    def rebuild(self, rows):
+        '''
+        @summary: Replaces all counters
+        @param rows: iterable of (stateId, userId, workstation, count) tuples
+        @result:
+        '''
+        self.clear()
+        with self.lock:
+            for stateId, userId, workstation, count in rows:
+                self._change(stateId, userId, workstation, count)
+
+    def add(self, stateId, userId, workstation):
+        with self.lock:
+            self._change(stateId, userId, workstation, 1)
+
+    def remove(self, stateId, userId, workstation):
+        with self.lock:
+            self._change(stateId, userId, workstation, -1)
+
+    def move(self, old, new):
+        '''
+        @summary: Moves a job from one counter to another
+        @param old: tuple (stateId, userId, workstation) before the update
+        @param new: tuple (stateId, userId, workstation) after the update
+        @result:
+        '''
+        if old == new:
+            return
+
+        with self.lock:
+            self._change(*old, count=-1)
+            self._change(*new, count=1)
+
+    # Lookups
+    # ========================
+    def getCount(self, stateId, userId=None, workstation=None):
+        '''
+        @summary: Returns the count of jobs in the given state. If a user or a
+        workstation is given, only the jobs of the user / on the workstation
+        are counted.
+        @result: the count of jobs
+        '''
+        with self.lock:
+            if userId is not None:
+                return self.byUser.get((userId, stateId), 0)
+            if workstation is not None:
+                return self.byWorkstation.get((workstation, stateId), 0)
+
+            return self.byState.get(stateId, 0)
+
+    def getStatistics(self, userId=None):
+        '''
+        @summary: Returns a copy of the counters
+        @param userId: if given, only the counters of this user are returned
+        @result: a dictionary with the keys states ({stateId: count}),
+        users ({userId: {stateId: count}}) and
+        workstations ({workstation: {stateId: count}})
+        '''
+        with self.lock:
+            users = self._group(self.byUser)
+            if userId is not None:
+                users = {userId: users.get(userId, {})}
+                states = users[userId]
+                workstations = {}
+            else:
+                states = dict(self.byState)
+                workstations = self._group(self.byWorkstation)
+
+        return {
+            "states": states,
+            "users": users,
+            "workstations": workstations,
+            }
+
+    # Internal Functions
+    # ========================
+    def _change(self, stateId, userId, workstation, count):
+        self._update(self.byState, stateId, count)
+        self._update(self.byUser, (userId, stateId), count)
+        if workstation:
+            self._update(self.byWorkstation, (workstation, stateId), count)
+
+    def _update(self, counter, key, count):
+        counter[key] += count
+        if counter[key] <= 0:
+            del counter[key]
+
+    def _group(self, counter):
+        result = {}
+        for (key, stateId), count in counter.iteritems():
+            result.setdefault(key, {})[stateId] = count
+
+        return result
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Write-through cache for jobs and users. The cache sits between
+the PySchedServer and the database manager and answers the lookups of
+single jobs (by jobId) and users (by id or userId) without a database access.
+All writes are passed to the database first and the cache is updated with
+the returned object afterwards.
+'''
+
+from PySched.Common.DataStructures import Job, User, JobState
+
+from collections import OrderedDict
+
+import copy
+import logging
+import threading
+
+class ObjectCache(object):
+    '''
+    @summary: Write-through cache for Job and User objects. Jobs which are
+    not archived are always kept, archived (and deleted) jobs are kept within
+    a LRU list of limited size.
+    '''
+    def __init__(self, dbController, archivedJobLimit=1000):
+        '''
+        @summary: Initializes the cache
+        @param dbController: the database manager to cache
+        @param archivedJobLimit: maximal count of cached archived jobs
+        @result:
+        '''
+        self.logger = logging.getLogger("PySchedServer")
+        self.dbController = dbController
+        self.archivedJobLimit = archivedJobLimit
+
+        self.activeJobs = {}
+        self.archivedJobs = OrderedDict()
+        self.usersById = {}
+        self.usersByUserId = {}
+
+        # cache key -> [generation, count of running loads]. Writes bump the
+        # generation of the keys being loaded, a load only caches its result
+        # if the generation didn't change during the database read.
+        self.loading = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    # Database Functions
+    # ========================
+    def addToDatabase(self, obj):
+        '''
+        @summary: Adds the object to the database and caches the result
+        @param obj: the object to add
+        @result: the added object
+        '''
+        result = self.dbController.addToDatabase(obj)
+        if result:
+            self._store(result)
+            return self._copy(result)
+
+        return result
+
+    def addAllToDatabase(self, objs):
+        '''
+        @summary: Adds all objects to the database within one transaction and
+        caches the results
+        @param objs: the objects to add
+        @result: the added objects
+        '''
+        result = self.dbController.addAllToDatabase(objs)
+        if not result:
+            return result
+
+        copies = []
+        for obj in result:
+            self._store(obj)
+            copies.append(self._copy(obj))
+
+        return copies
+
+    def getFromDatabase(self, objClass, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
+        '''
+        @summary: Returns the requested object from the cache if the request
+        is a lookup of a single job or user. All other requests are passed to
+        the database.
+        @result: see DatabaseInterface.getFromDatabase
+        '''
+        if first and not offset and len(filterArgs) == 1:
+            key, value = filterArgs.items()[0]
+            lookup = self._getLookup(objClass, key)
+
+            if lookup:
+                cacheKey = self._normalizeKey(key, value)
+                loadKey = self._loadKey(objClass, cacheKey)
+                with self.lock:
+                    obj = lookup(cacheKey)
+                    if obj:
+                        self.hits += 1
+                        return self._copy(obj)
+                    self.misses += 1
+
+                    loading = self.loading.setdefault(loadKey, [0, 0])
+                    loading[1] += 1
+                    generation = loading[0]
+
+                obj = None
+                try:
+                    obj = self.dbController.getFromDatabase(objClass,
+                        first=True, **filterArgs)
+                finally:
+                    with self.lock:
+                        loading = self.loading[loadKey]
+                        loading[1] -= 1
+                        if not loading[1]:
+                            del self.loading[loadKey]
+
+                        # A write during the read may have cached a newer
+                        # object, which must not be replaced
+                        if obj and loading[0] == generation:
+                            self._store(obj)
+
+                return self._copy(obj) if obj else obj
+
+        return self.dbController.getFromDatabase(objClass, first=first,
+            orderBy=orderBy, limit=limit, offset=offset, **filterArgs)
+
+    def updateDatabaseEntry(self, obj):
+        '''
+        @summary: Updates the entry within the database and the cache.
+        @param obj: the object to update
+        @result: the updated object
+        '''
+        self._remove(obj)
+        result = self.dbController.updateDatabaseEntry(obj)
+        if result:
+            with self.lock:
+                self._store(result)
+                self._invalidateLoads(result)
+            return self._copy(result)
+
+        return result
+
+    def deleteFromDatabase(self, obj):
+        '''
+        @summary: Deletes the object from the database and the cache.
+        @param obj: the object to delete
+        @result:
+        '''
+        self._remove(obj)
+        return self.dbController.deleteFromDatabase(obj)
+
+    def __getattr__(self, name):
+        '''
+        @summary: All other database functions (e.g. the job log) are passed
+        to the database manager.
+        '''
+        return getattr(self.dbController, name)
+
+    # Cache Functions
+    # ========================
+    def getStatistics(self):
+        '''
+        @summary: Returns the hit / miss counters and the size of the cache
+        @result: a dictionary
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": float(self.hits) / lookups if lookups else 0.0,
+                "activeJobs": len(self.activeJobs),
+                "archivedJobs": len(self.archivedJobs),
+                "users": len(self.usersById),
+                }
+
+    def clear(self):
+        '''
+        @summary: Removes all objects from the cache
+        @result:
+        '''
+        with self.lock:
+            self.activeJobs.clear()
+            self.archivedJobs.clear()
+            self.usersById.clear()
+            self.usersByUserId.clear()
+
+    def _getLookup(self, objClass, key):
+        '''
+        @summary: Returns the lookup function for the given filter key or None
+        if the filter can't be answered by the cache.
+        '''
+        if objClass == Job and key == "jobId":
+            return self._getJob
+        if objClass == User and key == "id":
+            return self.usersById.get
+        if objClass == User and key in ("userId", "email"):
+            return self.usersByUserId.get
+
+        return None
+
+    def _normalizeKey(self, key, value):
+        '''
+        @summary: Ids may be received as strings over the network.
+        '''
+        if key in ("jobId", "id"):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return value
+
+        return value
+
+    def _loadKey(self, objClass, cacheKey):
+        '''
+        @summary: Returns the key of a load within self.loading. Users are
+        looked up by several keys, thus all user loads share one key.
+        '''
+        if objClass == Job:
+            return (Job, cacheKey)
+        return (objClass, )
+
+    def _invalidateLoads(self, obj):
+        '''
+        @summary: Prevents running loads of the object from caching their
+        (possibly outdated) result.
+        '''
+        if isinstance(obj, Job):
+            loadKey = self._loadKey(Job, self._normalizeKey("jobId", obj.jobId))
+        else:
+            loadKey = self._loadKey(type(obj), None)
+
+        with self.lock:
+            loading = self.loading.get(loadKey, None)
+            if loading:
+                loading[0] += 1
+
+    def _getJob(self, jobId):
+        job = self.activeJobs.get(jobId, None)
+        if job:
+            return job
+
+        job = self.archivedJobs.pop(jobId, None)
+        if job:
+            # Mark as recently used
+            self.archivedJobs[jobId] = job
+
+        return job
+
+    def _store(self, obj):
+        '''
+        @summary: Adds the object to the cache.
+        '''
+        with self.lock:
+            if isinstance(obj, Job):
+                self.activeJobs.pop(obj.jobId, None)
+                self.archivedJobs.pop(obj.jobId, None)
+
+                if obj.stateId < JobState.lookup("ARCHIVED"):
+                    self.activeJobs[obj.jobId] = obj
+                else:
+                    self.archivedJobs[obj.jobId] = obj
+                    while len(self.archivedJobs) > self.archivedJobLimit:
+                        self.archivedJobs.popitem(last=False)
+
+            elif isinstance(obj, User):
+                self.usersById[obj.id] = obj
+                self.usersByUserId[obj.userId] = obj
+
+    def _remove(self, obj):
+        '''
+        @summary: Removes the object from the cache.
+        '''
+        with self.lock:
+            self._invalidateLoads(obj)
+            if isinstance(obj, Job):
+                jobId = self._normalizeKey("jobId", obj.jobId)
+                self.activeJobs.pop(jobId, None)
+                self.archivedJobs.pop(jobId, None)
+
+            elif isinstance(obj, User):
+                cached = self.usersById.pop(
+                    self._normalizeKey("id", obj.id), None)
+                if cached:
+                    self.usersByUserId.pop(cached.userId, None)
+                self.usersByUserId.pop(obj.userId, None)
+
+    def _copy(self, obj):
+        '''
+        @summary: Returns a copy of the cached object. Callers modify the
+        returned objects, thus the cached object must not be handed out.
+        '''
+        result = copy.copy(obj)
+        for key, value in obj.__dict__.iteritems():
+            if isinstance(value, (list, dict)):
+                setattr(result, key, copy.copy(value))
+
+        return result
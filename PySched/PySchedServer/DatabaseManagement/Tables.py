@@ -11,10 +11,20 @@ from PySched.Common.DataStructures import Job, User, Compiler, Program
 from PySched.Common import str2Datetime, datetime2Str
 
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy import Index, Table, inspect, select, literal_column
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.ext.declarative import declarative_base
 
 import datetime
+import logging
+import os
+import re
+
+# Messages of the old job logs: "[timestamp] message" (log file) or
+# "[timestamp]: message" (log column)
+OLD_LOG_MESSAGE = re.compile(
+    r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]:? ?(.*)$", re.S)
 
 
 class Tables(object):
@@ -22,11 +32,211 @@ class Tables(object):
 
     declBase = declarative_base()
 
-    def __init__(self, engine):
+    def __init__(self, engine, workingDir=None):
+        '''
+        @param engine: the engine of the database
+        @param workingDir: the working directory of the server (job
+        directories), used by the migrations
+        '''
         self.engine = engine
+        self.workingDir = workingDir
 
     def createAllTables(self):
         Tables.declBase.metadata.create_all(self.engine)
+        self.upgradeSchema()
+
+    def upgradeSchema(self):
+        '''
+        @summary: Brings the tables of an existing database up to date.
+        create_all only creates missing tables, thus columns and indexes
+        which were added to an existing table are created here.
+        @result: Returns the names of the created indexes
+        '''
+        logger = logging.getLogger("PySchedServer")
+        inspector = inspect(self.engine)
+        created = []
+
+        for table in Tables.declBase.metadata.sorted_tables:
+            columns = [column["name"] for column in
+                inspector.get_columns(table.name)]
+
+            for column in table.columns:
+                if not column.name in columns:
+                    logger.info("Adding column {} to table {}".format(
+                        column.name, table.name))
+                    self.engine.execute("ALTER TABLE {} ADD COLUMN {} {}".format(
+                        table.name, column.name,
+                        column.type.compile(dialect=self.engine.dialect)))
+
+            existing = [index["name"] for index in
+                inspector.get_indexes(table.name)]
+
+            for index in table.indexes:
+                if not index.name in existing:
+                    logger.info("Creating index {} on table {}".format(
+                        index.name, table.name))
+                    index.create(self.engine)
+                    created.append(index.name)
+
+        if created:
+            # Update the statistics used by the query planner
+            self.engine.execute("ANALYZE")
+
+        self.migrate()
+        return created
+
+    def migrate(self):
+        '''
+        @summary: Runs the data migrations which weren't run on this database
+        yet. The version of the data is stored within the database file
+        (user_version).
+        @result:
+        '''
+        logger = logging.getLogger("PySchedServer")
+        current = self.engine.execute("PRAGMA user_version").scalar()
+
+        migrations = [
+            (1, self._migrateJobLogs),
+            (2, self._migrateJobIds),
+            (3, self._migrateUploads),
+            ]
+
+        for version, migration in migrations:
+            if current < version:
+                logger.info("Migrating database to version {}".format(
+                    version))
+                migration()
+                self.engine.execute("PRAGMA user_version={}".format(version))
+
+    # Migrations
+    # ========================
+    def _migrateJobLogs(self):
+        '''
+        @summary: Copies the old job logs (log column of the jobs table and
+        <jobId>/logs/joblog.log) into the job_log table
+        @result:
+        '''
+        inspector = inspect(self.engine)
+        connection = self.engine.connect()
+        transaction = connection.begin()
+        try:
+            for table in [SqliteJob.__table__, SqliteArchivedJob.__table__]:
+                hasLog = "log" in [column["name"] for column in
+                    inspector.get_columns(table.name)]
+                columns = [table.c.id, table.c.added]
+                if hasLog:
+                    columns.append(literal_column("log"))
+                rows = connection.execute(select(columns)).fetchall()
+
+                for row in rows:
+                    jobId, added = row[0], row[1]
+                    entries = []
+                    if hasLog and row[2]:
+                        entries += parseOldLog(row[2].split(";"), ";", added)
+
+                    entries += parseOldLog(self._readOldLogFile(jobId), "\n",
+                        added)
+                    if not entries:
+                        continue
+
+                    entries.sort(key=lambda entry: entry[0])
+                    connection.execute(SqliteJobLog.__table__.insert(), [
+                        {"jobId": jobId, "timestamp": timestamp,
+                        "message": message} for timestamp, message in entries])
+
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+
+    def _migrateJobIds(self):
+        '''
+        @summary: Rebuilds the jobs table with AUTOINCREMENT, so the ids of
+        archived jobs aren't handed out again, and continues the ids after
+        the highest id of both job tables. The database is switched to
+        incremental vacuum (see SqliteManager.vacuum) afterwards.
+        @result:
+        '''
+        jobs = SqliteJob.__table__
+        sql = self.engine.execute("SELECT sql FROM sqlite_master WHERE "
+            "type='table' AND name='jobs'").scalar()
+
+        if not "AUTOINCREMENT" in sql.upper():
+            columns = ", ".join(column.name for column in jobs.columns)
+            createTable = str(CreateTable(jobs).compile(
+                dialect=self.engine.dialect)).strip()
+            self.engine.execute(createTable.replace(
+                "CREATE TABLE jobs ", "CREATE TABLE jobs_new ", 1))
+            self.engine.execute("INSERT INTO jobs_new ({0}) SELECT {0} FROM "
+                "jobs".format(columns))
+
+            # The foreign keys of other tables must keep referencing "jobs"
+            self.engine.execute("PRAGMA legacy_alter_table=ON")
+            self.engine.execute("ALTER TABLE jobs RENAME TO jobs_old")
+            self.engine.execute("ALTER TABLE jobs_new RENAME TO jobs")
+            self.engine.execute("PRAGMA legacy_alter_table=OFF")
+            self.engine.execute("DROP TABLE jobs_old")
+            for index in jobs.indexes:
+                index.create(self.engine)
+
+        lastId = max(
+            self.engine.execute("SELECT max(id) FROM jobs").scalar(),
+            self.engine.execute("SELECT max(id) FROM jobs_archive").scalar())
+        self.engine.execute("DELETE FROM sqlite_sequence WHERE name='jobs'")
+        self.engine.execute("INSERT INTO sqlite_sequence (name, seq) "
+            "VALUES ('jobs', {})".format(int(lastId or 0)))
+
+        if self.engine.execute("PRAGMA auto_vacuum").scalar() != 2:
+            self.engine.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.engine.execute("VACUUM")
+
+    def _migrateUploads(self):
+        '''
+        @summary: The upload of jobs isn't known for existing jobs. They are
+        considered uploaded, as before.
+        @result:
+        '''
+        for table in [SqliteJob.__table__, SqliteArchivedJob.__table__]:
+            self.engine.execute(table.update().where(
+                table.c.uploaded == None).values(uploaded=True))
+
+    def _readOldLogFile(self, jobId):
+        if not self.workingDir:
+            return []
+
+        logPath = os.path.join(self.workingDir, str(jobId), "logs",
+            "joblog.log")
+        if not os.path.isfile(logPath):
+            return []
+
+        with open(logPath) as logFile:
+            return logFile.read().splitlines()
+
+
+def parseOldLog(parts, separator, default=None):
+    '''
+    @summary: Parses the messages of an old job log. Parts without a timestamp
+    continue the previous message.
+    @param parts: the lines of the log file or the ';' separated parts of
+    the log column
+    @param separator: the separator of the parts, used to join continued
+    messages
+    @param default: timestamp of leading parts without a timestamp
+    @result: a list of tuples (timestamp, message)
+    '''
+    entries = []
+    for part in parts:
+        match = OLD_LOG_MESSAGE.match(part)
+        if match:
+            entries.append([str2Datetime(match.group(1)), match.group(2)])
+        elif entries:
+            entries[-1][1] += separator + part
+        elif part:
+            entries.append([default, part])
+
+    return [tuple(entry) for entry in entries]
 
 class SqliteCompiler(Tables.declBase):
     '''
@@ -37,6 +247,13 @@ class SqliteCompiler(Tables.declBase):
     compilerName = Column('compilerName', String)
     compilerDescription = Column('compilerDescription', String)
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "id": "id",
+        "compilerName": "compilerName",
+        "compilerDescription": "compilerDescription",
+        }
+
     def __init__(self, compilerName, compilerDescription):
         self.compilerName = compilerName
         self.compilerDescription = compilerDescription
@@ -84,6 +301,15 @@ class SqliteProgram(Tables.declBase):
     programExec = Column('programExec', String)
     programVersion = Column('programVersion', String)
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "id": "id",
+        "programName": "programName",
+        "programPath": "programPath",
+        "programExec": "programExec",
+        "programVersion": "programVersion",
+        }
+
     def __init__(self):
         self.programName = None
         self.programExec = None
@@ -140,9 +366,18 @@ class SqliteUser(Tables.declBase):
     id = Column('id', Integer, primary_key=True)
     firstName = Column('firstName', String)
     lastName = Column('lastName', String)
-    email = Column('email', String)
+    email = Column('email', String, index=True)
     admin = Column('admin', Boolean)
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "id": "id",
+        "userId": "email",
+        "email": "email",
+        "firstName": "firstName",
+        "lastName": "lastName",
+        "admin": "admin",
+        }
 
     def __init__(self, email):
         self.email = email
@@ -198,6 +433,15 @@ class SqliteJob(Tables.declBase):
     ''' Server side Job table '''
 
     __tablename__ = "jobs"
+    __table_args__ = (
+        # Jobs of an user (getJobList)
+        Index("ix_jobs_userId_stateId", "userId", "stateId"),
+        # Jobs on a workstation (getJobCountOnWorkstation, checkJobs)
+        Index("ix_jobs_workstation_stateId", "workstation", "stateId"),
+        # The ids of jobs moved to the archive must not be reused
+        {"sqlite_autoincrement": True},
+        )
+
     id = Column("id", Integer, primary_key=True)
     name = Column("name", String)
     jobDescription = Column("jobDescription", String)
@@ -212,12 +456,36 @@ class SqliteJob(Tables.declBase):
     added = Column('added', DateTime)
     started = Column('started', DateTime)
     finished = Column('finished', DateTime)
-    stateId = Column('stateId', Integer)
+    stateId = Column('stateId', Integer, index=True)
     workstation = Column('workstation', String)
-    log = Column('log', String)
+    priority = Column('priority', Integer, default=0)
+    walltime = Column('walltime', Integer)
+    dependencies = Column('dependencies', String)
+    uploaded = Column('uploaded', Boolean, default=False)
 
     user = relationship("SqliteUser", backref=backref('jobs', order_by=id))
 
+    # PySched attribute -> Sqlite attribute. Used for database side filtering
+    filterColumns = {
+        "jobId": "id",
+        "jobName": "name",
+        "jobDescription": "jobDescription",
+        "userId": "userId",
+        "multiCpu": "multiCpu",
+        "minCpu": "minCpu",
+        "minMemory": "minMemory",
+        "reqOS": "reqOS",
+        "compilerStr": "compilerStr",
+        "executeStr": "executeStr",
+        "added": "added",
+        "started": "started",
+        "finished": "finished",
+        "stateId": "stateId",
+        "workstation": "workstation",
+        "priority": "priority",
+        "walltime": "walltime",
+        }
+
     def __init__(self):
         '''
         @summary: Creates an Job instance.
@@ -238,7 +506,10 @@ class SqliteJob(Tables.declBase):
         self.finished = None
         self.stateId = 0
         self.workstation = None
-        self.log = None
+        self.priority = 0
+        self.walltime = None
+        self.dependencies = None
+        self.uploaded = False
 
     def update(self, updatedObject):
         '''
@@ -261,7 +532,10 @@ class SqliteJob(Tables.declBase):
         self.finished = updatedObject.finished
         self.stateId = updatedObject.stateId
         self.workstation = updatedObject.workstation
-        self.log = updatedObject.log
+        self.priority = updatedObject.priority
+        self.walltime = updatedObject.walltime
+        self.dependencies = updatedObject.dependencies
+        self.uploaded = updatedObject.uploaded
 
 
     def convertToPySched(self):
@@ -286,7 +560,11 @@ class SqliteJob(Tables.declBase):
         job.finished = datetime2Str(self.finished)
         job.stateId = self.stateId
         job.workstation = self.workstation
-        job.log = self.log.split(';')
+        job.priority = self.priority or 0
+        job.walltime = self.walltime
+        job.dependencies = self.dependencies.split(';') \
+            if self.dependencies else []
+        job.uploaded = bool(self.uploaded)
 
         return job
 
@@ -302,11 +580,6 @@ class SqliteJob(Tables.declBase):
             reqPrograms += progs + ";"
         reqPrograms = reqPrograms.rstrip(";")
 
-        log = ""
-        for l in obj.log:
-            log += l + ";"
-        log = log.rstrip(";")
-
         job = SqliteJob()
         job.id = obj.jobId
         job.name = obj.jobName
@@ -324,6 +597,65 @@ class SqliteJob(Tables.declBase):
         job.finished = str2Datetime(obj.finished)
         job.stateId = obj.stateId
         job.workstation = obj.workstation
-        job.log = log
+        job.priority = int(obj.priority or 0)
+        job.walltime = int(obj.walltime) if obj.walltime else None
+        job.dependencies = ";".join(obj.dependencies or []) or None
+        job.uploaded = bool(obj.uploaded)
 
         return job
+
+
+def copyTable(table, name, indexes=[]):
+    '''
+    @summary: Creates a table with the same columns as the given table.
+    Foreign keys and indexes are not copied.
+    @param table: the table to copy
+    @param name: the name of the new table
+    @param indexes: names of the columns to index within the new table
+    @result: the new table
+    '''
+    columns = [Column(column.name, column.type,
+        primary_key=column.primary_key) for column in table.columns]
+    newTable = Table(name, Tables.declBase.metadata, *columns)
+
+    for column in indexes:
+        Index("ix_{}_{}".format(name, column), newTable.c[column])
+
+    return newTable
+
+
+class SqliteArchivedJob(Tables.declBase):
+    '''
+    @summary: Server side archive of old jobs. Has the same columns as the
+    jobs table, archived jobs are moved here after some time to keep the jobs
+    table small.
+    '''
+    __table__ = copyTable(SqliteJob.__table__, "jobs_archive",
+        indexes=["userId"])
+
+    reqPrograms = __table__.c.requiredPrograms
+    filterColumns = SqliteJob.filterColumns
+
+    update = SqliteJob.update.__func__
+    convertToPySched = SqliteJob.convertToPySched.__func__
+
+
+class SqliteJobLog(Tables.declBase):
+    '''
+    @summary: Server side job log table. The log of a job is append only,
+    each row contains one log message.
+    '''
+    __tablename__ = "job_log"
+    __table_args__ = (
+        Index("ix_job_log_jobId_timestamp", "jobId", "timestamp"),
+        )
+
+    id = Column("id", Integer, primary_key=True)
+    jobId = Column("jobId", Integer, ForeignKey(SqliteJob.id))
+    timestamp = Column("timestamp", DateTime)
+    message = Column("message", String)
+
+    def __init__(self, jobId, timestamp, message):
+        self.jobId = jobId
+        self.timestamp = timestamp
+        self.message = message
@@ -6,33 +6,58 @@ Created on 2012-12-04 14:54
 '''
 
 from PySched.Common.Interfaces.DatabaseInterface import DatabaseInterface
-from PySched.Common.DataStructures import Job, User, Compiler, Program
+from PySched.Common.DataStructures import Job, User, Compiler, Program, JobState
+from PySched.Common.Database.Query import runQuery
+from PySched.Common.Database.StorageProfile import createEngine, checkpoint
 
-from Tables import SqliteJob, SqliteUser, SqliteCompiler, SqliteProgram, Tables
+from Tables import SqliteJob, SqliteUser, SqliteCompiler, SqliteProgram, SqliteJobLog, Tables
+from Tables import SqliteArchivedJob
+from JobCounters import JobCounters
 
-from sqlalchemy import create_engine
+from sqlalchemy import and_, or_, select, func
 from sqlalchemy.orm import sessionmaker
 
 import os
 import logging
 
+# Count of free pages released by one vacuum step
+VACUUM_PAGES = 1000
+
 class SqliteManager(DatabaseInterface):
     '''
     @summary: SQLite implementation of the base database manager.
     '''
-    def __init__(self, workingDir):
+    def __init__(self, workingDir, profile=None):
+        '''
+        @summary: Opens (or creates) the database
+        @param workingDir: the directory of the database file
+        @param profile: the storage profile. See Common.Database.StorageProfile
+        @result:
+        '''
         super(SqliteManager, self).__init__(workingDir)
         self.logger = logging.getLogger("PySchedServer")
 
         self.pathToDB = os.path.join(self.workingDir, "PySchedServer.sqlite")
         self.logger.debug("Checking database path: {}".format(self.pathToDB))
-        self.engine = create_engine("sqlite:////{}".format(self.pathToDB))
+        self.engine = createEngine(self.pathToDB, profile)
         self.sessionClass = sessionmaker(bind=self.engine)
-        self.tables = Tables(self.engine)
+        # The job directories are within the parent of the database directory
+        self.tables = Tables(self.engine, os.path.dirname(self.workingDir))
         self.tables.createAllTables()
 
+        self.jobCounters = JobCounters()
+        self.rebuildJobCounters()
+
         self.logger.info("Database up and running.")
 
+    def checkpoint(self, mode="PASSIVE"):
+        '''
+        @summary: Writes the write ahead log into the database file
+        @param mode: the checkpoint mode
+        @result: see StorageProfile.checkpoint
+        '''
+        return checkpoint(self.engine, mode)
+
     def addToDatabase(self, obj):
         self.logger.debug("Adding {} to database...".format(type(obj)))
 
@@ -58,13 +83,58 @@ class SqliteManager(DatabaseInterface):
         s.add(sqliteObject)
         s.commit()
         obj = sqliteObject.convertToPySched()
+        if isinstance(obj, Job):
+            self.jobCounters.add(*self._counterKey(obj))
         s.close()
 
         self.logger.debug("Done.")
         return obj
 
-    def getFromDatabase(self, obj):
-        self.logger.debug("Retrieving {} to database...".format(obj))
+    def addAllToDatabase(self, objs):
+        '''
+        @summary: Adds all given objects to the database within one
+        transaction
+        @param objs: a list of objects to add
+        @result: a list of the added objects (in the given order)
+        '''
+        self.logger.debug("Adding {} objects to database...".format(len(objs)))
+
+        sqliteObjects = []
+        for obj in objs:
+            if isinstance(obj, Job):
+                sqliteObjects.append(SqliteJob.convertFromPySched(obj))
+            elif isinstance(obj, User):
+                sqliteObjects.append(SqliteUser.convertFromPySched(obj))
+            elif isinstance(obj, Compiler):
+                sqliteObjects.append(SqliteCompiler.convertFromPySched(obj))
+            elif isinstance(obj, Program):
+                sqliteObjects.append(SqliteProgram.convertFromPySched(obj))
+            else:
+                self.logger.error("Could not convert {} to SqliteObject".
+                    format(type(obj)))
+                return None
+
+        s = self.sessionClass()
+        s.add_all(sqliteObjects)
+        # Convert before the commit expires the objects (the ids are
+        # assigned by the flush).
+        s.flush()
+        result = [sqliteObject.convertToPySched()
+            for sqliteObject in sqliteObjects]
+        s.commit()
+        s.close()
+
+        for obj in result:
+            if isinstance(obj, Job):
+                self.jobCounters.add(*self._counterKey(obj))
+
+        self.logger.debug("Done.")
+        return result
+
+    def getFromDatabase(self, obj, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
+        self.logger.debug("Retrieving {} from database ({})...".format(
+            obj, filterArgs))
 
         sqliteObject = None
         if obj == Job:
@@ -84,18 +154,12 @@ class SqliteManager(DatabaseInterface):
         self.logger.debug("selected SqliteObject: {}".format(sqliteObject))
 
         s = self.sessionClass()
-        returnList = []
-
-        query = s.query(sqliteObject)
-
-        for item in query:
-            self.logger.debug("Converting SqliteObject to PySchedObject")
-            returnList.append(item.convertToPySched())
-
+        result = runQuery(s, sqliteObject, first=first, orderBy=orderBy,
+            limit=limit, offset=offset, **filterArgs)
         s.close()
 
         self.logger.debug("Done.")
-        return returnList
+        return result
 
     def updateDatabaseEntry(self, obj):
         self.logger.debug("Updating object in database...")
@@ -123,11 +187,19 @@ class SqliteManager(DatabaseInterface):
         self.logger.debug("Retrieving {} object from database, where id={}".format(sqliteClass, sqliteObject.id))
         objectToUpdate = s.query(sqliteClass).filter(sqliteClass.id==sqliteObject.id).first()
 
+        if not objectToUpdate and sqliteClass == SqliteJob:
+            objectToUpdate = s.query(SqliteArchivedJob).filter(
+                SqliteArchivedJob.id==sqliteObject.id).first()
+
+        if sqliteClass == SqliteJob:
+            oldKey = self._counterKey(objectToUpdate)
         objectToUpdate.update(sqliteObject)
 
         s.flush()
         s.commit()
         returnObj = objectToUpdate.convertToPySched()
+        if sqliteClass == SqliteJob:
+            self.jobCounters.move(oldKey, self._counterKey(returnObj))
         s.close()
 
         self.logger.debug("Object updated.".format(sqliteClass, sqliteObject.id))
@@ -162,9 +234,147 @@ class SqliteManager(DatabaseInterface):
         self.logger.debug("Retrieving {} object from database, where id={}".format(sqliteClass, sqliteObject.id))
         objectToDelete = s.query(sqliteClass).filter(sqliteClass.id==sqliteObject.id).first()
 
+        if not objectToDelete and sqliteClass == SqliteJob:
+            objectToDelete = s.query(SqliteArchivedJob).filter(
+                SqliteArchivedJob.id==sqliteObject.id).first()
+
+        if sqliteClass == SqliteJob:
+            s.query(SqliteJobLog).filter(
+                SqliteJobLog.jobId==sqliteObject.id).delete()
+
+        if isinstance(obj, Job):
+            self.jobCounters.remove(*self._counterKey(objectToDelete))
+
         s.delete(objectToDelete)
         s.flush()
         s.commit()
         s.close()
 
         self.logger.debug("Done.")
+
+    def appendToJobLog(self, entries):
+        '''
+        @summary: Appends messages to the job log. All entries are inserted
+        within one transaction.
+        @param entries: a list of tuples (jobId, timestamp, message)
+        @result:
+        '''
+        if not entries:
+            return
+
+        self.logger.debug("Appending {} job log entries...".format(len(entries)))
+        s = self.sessionClass()
+        s.execute(SqliteJobLog.__table__.insert(), [
+            {"jobId": jobId, "timestamp": timestamp, "message": message}
+            for jobId, timestamp, message in entries])
+        s.commit()
+        s.close()
+
+    def getJobLog(self, jobId, since=None, until=None, tail=None):
+        '''
+        @summary: Returns the log of a job
+        @param jobId: the id of the job
+        @param since: only return messages logged at or after this datetime
+        @param until: only return messages logged before this datetime
+        @param tail: only return the last <tail> messages
+        @result: a list of tuples (timestamp, message) in logging order
+        '''
+        s = self.sessionClass()
+        query = s.query(SqliteJobLog.timestamp, SqliteJobLog.message).filter(
+            SqliteJobLog.jobId==jobId)
+
+        if since:
+            query = query.filter(SqliteJobLog.timestamp >= since)
+        if until:
+            query = query.filter(SqliteJobLog.timestamp < until)
+
+        if tail:
+            result = query.order_by(SqliteJobLog.id.desc()).limit(tail).all()
+            result.reverse()
+        else:
+            result = query.order_by(SqliteJobLog.id).all()
+
+        s.close()
+        return [(timestamp, message) for timestamp, message in result]
+
+    def moveToArchive(self, cutoff):
+        '''
+        @summary: Moves all archived jobs finished (or added, if never
+        finished) before the cutoff date into the archive table. The jobs are
+        moved within one transaction.
+        @param cutoff: a datetime
+        @result: the ids of the moved jobs
+        '''
+        jobs = SqliteJob.__table__
+        condition = and_(
+            jobs.c.stateId >= JobState.lookup("ARCHIVED"),
+            or_(jobs.c.finished < cutoff,
+                and_(jobs.c.finished == None, jobs.c.added < cutoff)))
+
+        s = self.sessionClass()
+        jobIds = [row[0] for row in
+            s.execute(select([jobs.c.id]).where(condition))]
+
+        if jobIds:
+            self.logger.debug("Moving {} jobs to the archive...".format(
+                len(jobIds)))
+            columns = [column.name for column in jobs.columns]
+            s.execute(SqliteArchivedJob.__table__.insert().from_select(
+                columns, select([jobs]).where(condition)))
+            s.execute(jobs.delete().where(condition))
+            s.commit()
+
+        s.close()
+        return jobIds
+
+    def getArchivedJobs(self, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
+        '''
+        @summary: Returns jobs from the archive table. See getFromDatabase
+        @result: a list of jobs or a job if first is set
+        '''
+        s = self.sessionClass()
+        result = runQuery(s, SqliteArchivedJob, first=first, orderBy=orderBy,
+            limit=limit, offset=offset, **filterArgs)
+        s.close()
+
+        return result
+
+    def vacuum(self, pages=VACUUM_PAGES):
+        '''
+        @summary: Releases free pages of the database file (incremental
+        vacuum). Each call only releases a few pages, so other writes aren't
+        stalled as by a full VACUUM.
+        @param pages: the maximal count of released pages
+        @result: the count of free pages left
+        '''
+        connection = self.engine.raw_connection()
+        try:
+            # Each page is released by one step of the statement, thus the
+            # (empty) rows must be fetched.
+            cursor = connection.cursor()
+            cursor.execute("PRAGMA incremental_vacuum({})".format(int(pages)))
+            cursor.fetchall()
+            cursor.execute("PRAGMA freelist_count")
+            return cursor.fetchone()[0]
+        finally:
+            connection.close()
+
+    def rebuildJobCounters(self):
+        '''
+        @summary: Counts all jobs (including the archive) by state, user and
+        workstation. See JobCounters
+        @result:
+        '''
+        s = self.sessionClass()
+        rows = []
+        for table in [SqliteJob, SqliteArchivedJob]:
+            rows += s.query(table.stateId, table.userId, table.workstation,
+                func.count(table.id)).group_by(
+                table.stateId, table.userId, table.workstation).all()
+        s.close()
+
+        self.jobCounters.rebuild(rows)
+
+    def _counterKey(self, job):
+        return (job.stateId, job.userId, job.workstation)
@@ -10,6 +10,9 @@ from PySched.Common.Communication.CommandBuilder import CommandBuilder
 from PySched.Common.DataStructures import JobState, Program
 from PySched.Common.IO import FileUtils
 
+from twisted.internet import reactor
+from twisted.python.threadpool import ThreadPool
+
 import json
 import logging
 
@@ -26,6 +29,12 @@ class MessageHandler(MessageHandlerInterface):
         self.logger = logging.getLogger("PySchedServer")
         self.pySchedServer = pySchedServer
 
+        # All commands are processed in order by a single thread, thus the
+        # reactor is never blocked by database accesses of a command.
+        self.commandPool = ThreadPool(1, 1, "PySchedServer-Commands")
+        self.commandPool.start()
+        reactor.addSystemEventTrigger("after", "shutdown",
+            self.commandPool.stop)
 
     # ======================= Incoming Messages ===============================
     def messageReceived(self, networkId, message):
@@ -36,15 +45,32 @@ class MessageHandler(MessageHandlerInterface):
         @result:
         '''
         self.logger.debug("Message received: {}".format(message))
-        commandDict = json.loads(message)
+        self.commandPool.callInThread(self.runCommand, networkId, message)
+
+    def runCommand(self, networkId, message):
+        '''
+        @summary:           Runs the command of a received message. Is
+                            called within the command thread.
+        @param networkId:   An identifier for the sender of the message
+        @param message:     the received message
+        @result:
+        '''
+        try:
+            commandDict = json.loads(message)
+        except ValueError:
+            self.logger.warning("Cannot parse command: {}".format(message))
+            return
 
         # Run command....
         cmd = commandDict.get("command", None)
 
         if cmd and hasattr(self, cmd):
-            getattr(self, cmd)(
-                networkId, 
-                commandDict)
+            try:
+                getattr(self, cmd)(
+                    networkId, 
+                    commandDict)
+            except Exception, e:
+                self.logger.error("Command {} failed: {}".format(cmd, e))
         else:
             self.logger.warning("Cannot parse command: {}".format(message))
             self.pySchedServer.networkManager.sendMessage(
@@ -63,7 +89,8 @@ class MessageHandler(MessageHandlerInterface):
         @param networkId:   The id of the client who closed the connection.
         @result:
         '''
-        self.pySchedServer.removeWorkstation(networkId)
+        self.commandPool.callInThread(
+            self.pySchedServer.removeWorkstation, networkId)
 
     def workstationInfo(self, networkId, info):
         '''
@@ -107,6 +134,55 @@ class MessageHandler(MessageHandlerInterface):
                 CommandBuilder.buildResponseString(
                     result=False))
 
+    def addJobs(self, networkId, data):
+        '''
+        @summary:           Is called when a list of jobs should be added.
+        @param networkId:   global id of the sender
+        @param data:        dictionary containing the userId and the list
+                            of job informations
+        @result:
+        '''
+        jobs = self.pySchedServer.addJobs(
+            data.get("userId", None),
+            data.get("jobs", []))
+
+        if jobs:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=True, 
+                    jobIds=[job.jobId for job in jobs]))
+        else:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=False))
+
+    def addJobDag(self, networkId, data):
+        '''
+        @summary:           Is called when a workflow of dependent jobs
+                            should be added.
+        @param networkId:   global id of the sender
+        @param data:        dictionary containing the userId and the list
+                            of job informations (see PySchedServer.addJobDag)
+        @result:
+        '''
+        jobs = self.pySchedServer.addJobDag(
+            data.get("userId", None),
+            data.get("jobs", []))
+
+        if jobs:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=True, 
+                    jobIds=[job.jobId for job in jobs]))
+        else:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=False))
+
     def schedule(self, networkId, data):
         '''
         @summary:           Is called when th scheduler should be forced to
@@ -145,39 +221,112 @@ class MessageHandler(MessageHandlerInterface):
         @summary:           is called when a user requested a list of his jobs.
         @param networkId:   global id of the client
         @param data:        dictionary containing the userId and the showAll 
-                            flag
+                            flag. Optional:
+                            offset, limit, after: paging. If a limit is
+                            given, the response contains the cursor of the
+                            next page (or None for the last page).
+                            states, workstation, addedSince, addedUntil:
+                            filters
+                            fields: list of job attributes to return
         @result:
         '''
         userId = data.get("userId", None)
         showAll = data.get("showAll", False)
         showAllUser = data.get("showAllUser", False)
+        limit = data.get("limit", None)
+        fields = data.get("fields", None)
 
         self.logger.debug("Get Jobs for user ({}, showAll={})".
             format(userId, showAll))
 
-        jobs = self.pySchedServer.getJobList(userId, showAll, showAllUser)
+        jobs = self.pySchedServer.getJobList(userId, showAll, showAllUser,
+            offset=data.get("offset", None),
+            limit=limit,
+            after=data.get("after", None),
+            states=data.get("states", None),
+            workstation=data.get("workstation", None),
+            addedSince=data.get("addedSince", None),
+            addedUntil=data.get("addedUntil", None))
 
-        if not jobs:
+        if jobs is False or (not jobs and not limit):
             self.pySchedServer.networkManager.sendMessage(
                 networkId, 
                 CommandBuilder.buildResponseString(
                     result=False))
             return False
 
+        userNames = {}
         jobList = []
         for job in jobs:
-            job.userId = self.pySchedServer.lookupUserId(job.userId).userId
+            if not job.userId in userNames:
+                user = self.pySchedServer.lookupUserId(job.userId)
+                userNames[job.userId] = user.userId if user else None
+            job.userId = userNames[job.userId]
             job.stateId = JobState.lookup(job.stateId)
-            jobList.append(job.__dict__)
+
+            if fields:
+                jobList.append(dict((field, job.__dict__.get(field, None))
+                    for field in fields))
+            else:
+                jobList.append(job.__dict__)
+
+        response = {"jobs": jobList}
+        if limit:
+            response["nextCursor"] = jobs[-1].jobId \
+                if len(jobs) >= int(limit) else None
 
         self.pySchedServer.networkManager.sendMessage(
             networkId, 
             CommandBuilder.buildResponseString(
                 result=True, 
-                jobs=jobList))
+                **response))
 
         return True
 
+    def getJobStats(self, networkId, data):
+        '''
+        @summary:           is called when a user requested the count of jobs
+                            per state.
+        @param networkId:   global id of the client
+        @param data:        dictionary containing the userId
+        @result:
+        '''
+        stats = self.pySchedServer.getJobStats(data.get("userId", None))
+
+        if stats:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=True, 
+                    **stats))
+        else:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=False))
+
+    def getQueue(self, networkId, data):
+        '''
+        @summary:           is called when an admin requested the job queue
+                            of the scheduler.
+        @param networkId:   global id of the client
+        @param data:        dictionary containing the userId
+        @result:
+        '''
+        queue = self.pySchedServer.getQueue(data.get("userId", None))
+
+        if queue:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=True, 
+                    **queue))
+        else:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId, 
+                CommandBuilder.buildResponseString(
+                    result=False))
+
     def archiveJob(self, networkId, data):
         '''
         @summary:           Is called when an user requests to archive a job
@@ -363,14 +512,14 @@ class MessageHandler(MessageHandlerInterface):
 
 
     def getWorkstations(self, networkId, data):
-        workstations = self.pySchedServer.workstations
+        workstations = self.pySchedServer.getWorkstations()
         server = self.pySchedServer.getServerInformations()
 
         self.pySchedServer.networkManager.sendMessage(
             networkId, 
             CommandBuilder.buildResponseString(
                 result=True, 
-                workstations=workstations.values(), 
+                workstations=workstations, 
                 server=server))
 
     def deleteJob(self, networkId, data):
@@ -453,13 +602,24 @@ class MessageHandler(MessageHandlerInterface):
         '''
         @summary:           Returns the logfile of a Job to the user.
         @param networkId:  the sender who send the request
-        @param data:        jobId, username
+        @param data:        jobId, username, since (optional, only messages
+                            logged since this time), tail (optional, only 
+                            the last n messages)
         @result:
         '''
         userId = data.get("userId", None)
         jobId = data.get("jobId", None)
+        since = data.get("since", None)
+        tail = data.get("tail", None)
+
+        log = self.pySchedServer.getLog(userId, jobId, since=since, tail=tail)
+        if log is False:
+            self.pySchedServer.networkManager.sendMessage(
+                networkId,
+                CommandBuilder.buildResponseString(
+                    result=False))
+            return
 
-        log = self.pySchedServer.getLog(userId, jobId)
         self.pySchedServer.networkManager.sendMessage(
             networkId, 
             CommandBuilder.buildResponseString(
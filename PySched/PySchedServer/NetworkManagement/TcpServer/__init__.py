@@ -28,7 +28,8 @@ class TcpServer(object):
         self.port = port
         self.networkManager = networkManager
         self.clientFactory = TcpClientFactory(self)
-        self.clients = []
+        # client id -> client
+        self.clients = {}
 
     def startServer(self):
         '''
@@ -49,7 +50,7 @@ class TcpServer(object):
         @param client:      the new client
         @result:
         '''
-        self.clients.append(client)
+        self.clients[client.id] = client
         self.networkManager.connectionMade(client.id)
 
     def connectionLost(self, client):
@@ -58,7 +59,8 @@ class TcpServer(object):
         @param client:      the client which lost the connection
         @result:
         '''
-        self.clients.remove(client)
+        if self.clients.get(client.id, None) is client:
+            del self.clients[client.id]
         self.networkManager.connectionLost(client.id)
 
 
@@ -74,11 +76,11 @@ class TcpServer(object):
 
     def getClients(self):
         '''
-        @summary:           Returns a dictionary with all currently connected 
+        @summary:           Returns a list with all currently connected 
                             clients
-        @result:            A dictionary containing all client with their id as key
+        @result:            A list containing all clients
         '''
-        return self.clients
+        return self.clients.values()
 
     def getClient(self, identifier):
         '''
@@ -86,9 +88,7 @@ class TcpServer(object):
         @param identifier:  The id or name of the client.
         @result:            a Client object
         '''
-        for client in self.clients:
-            if client.id == identifier:
-                return client
+        return self.clients.get(identifier, None)
 
 
     def sendMessage(self, identifier, message):
@@ -9,6 +9,9 @@ from PySched.Common.IO import FileUtils
 from PySched.Common.Interfaces.Network.NetworkInterface import NetworkInterface
 from PySched.Common.IO.FileUtils import getFileMD5Hashsum, deleteFile
 
+from twisted.internet import reactor, threads
+from twisted.python.threadable import isInIOThread
+
 from UdpServer import UdpServer
 from TcpServer import TcpServer
 
@@ -86,7 +89,10 @@ class NetworkManager(NetworkInterface):
         @result:
         '''
         self.logger.debug("Sending message to {}: {}".format(receiver, message))
-        self.tcpServer.sendMessage(receiver, message)
+        if isInIOThread():
+            self.tcpServer.sendMessage(receiver, message)
+        else:
+            reactor.callFromThread(self.tcpServer.sendMessage, receiver, message)
 
     def sendFile(self, receiver, pathToFile):
         '''
@@ -96,7 +102,11 @@ class NetworkManager(NetworkInterface):
         @result:
         '''
         md5 = getFileMD5Hashsum(pathToFile)
-        return self.tcpServer.sendFile(receiver, pathToFile, md5)
+        if isInIOThread():
+            return self.tcpServer.sendFile(receiver, pathToFile, md5)
+
+        return threads.blockingCallFromThread(reactor, self.tcpServer.sendFile,
+            receiver, pathToFile, md5)
 
     def fileReceived(self, networkId, pathToFile, md5):
         self.messageReceiver.fileTransferCompleted(networkId, pathToFile)
@@ -8,6 +8,7 @@ import argparse
 
 def main(args=None):
     from PySched import PySchedServer
+    from PySched.Common.Database.StorageProfile import PROFILES, DEFAULT_PROFILE
     #===============================================================================
     # Main Server Program
     #===============================================================================
@@ -16,6 +17,10 @@ def main(args=None):
     parser.add_argument("-q", '--quiet', action='store_true', help="Be quiet.")
     parser.add_argument("-d", '--debug', action='store_true', help="Debug mode")
     parser.add_argument("-m", '--multicast', help="Use non standard multicast group")
+    parser.add_argument("--dbProfile", choices=sorted(PROFILES.keys()), default=DEFAULT_PROFILE,
+        help="Storage profile of the database (default: {})".format(DEFAULT_PROFILE))
+    parser.add_argument("--archiveAge", type=int, default=30,
+        help="Days after which archived jobs are moved to the archive table (0: never)")
     parser.add_argument("workingDir", help="Sets the directory for job storage and execution")
 
     if not args:
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Content addressed cache of compile results. The key of a compile
+is the SHA1 digest of the input files of the job directory and of the
+compiler command. The files created or changed by the compiler (artefacts)
+are stored under the key, jobs with the same key get the artefacts copied
+into their job directory instead of being compiled again.
+'''
+
+from PySched.Common.IO import FileUtils
+
+from collections import OrderedDict
+
+import hashlib
+import logging
+import os
+import threading
+
+# Default of the scheduling parameter compileCacheSize: maximal size (bytes)
+# of the cached artefacts
+COMPILE_CACHE_SIZE = 2 * 1024**3
+
+# Directories of a job directory which are neither inputs nor artefacts
+IGNORED_DIRS = set(["logs"])
+
+
+class CompileCache(object):
+    '''
+    @summary: Compile cache of the server. Entries are evicted in least
+    recently used order.
+    '''
+    def __init__(self, workingDir, maxSize=COMPILE_CACHE_SIZE):
+        '''
+        @summary: Initializes the cache
+        @param workingDir: the working directory of the server
+        @param maxSize: the maximal size of the cached artefacts
+        @result:
+        '''
+        self.logger = logging.getLogger("PySchedServer")
+        self.cacheDir = os.path.join(workingDir, "compileCache")
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+
+        # key -> size in least recently used order
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.statistics = {"hits": 0, "misses": 0, "stores": 0,
+            "evictions": 0}
+
+        FileUtils.createDirectory(self.cacheDir)
+        self._loadEntries()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def snapshot(self, jobDir, compilerStr, digests=None):
+        '''
+        @summary: Indexes the input files of a job directory
+        @param jobDir: the job directory
+        @param compilerStr: the compiler command of the job
+        @param digests: known digests {path: (size, mtime, digest)}, e.g.
+        the input index of the Locality. Unchanged files aren't hashed
+        again.
+        @result: a tuple (key, {path: (size, mtime)}). The paths are relative
+        to the job directory and separated by '/'.
+        '''
+        digests = digests or {}
+        digest = hashlib.sha1(compilerStr.encode("utf-8"))
+        index = {}
+        for path, filePath in sorted(self._walk(jobDir)):
+            stat = os.stat(filePath)
+            index[path] = (stat.st_size, stat.st_mtime)
+
+            known = digests.get(path, None)
+            if known and known[:2] == index[path]:
+                fileDigest = known[2]
+            else:
+                fileDigest = FileUtils.getFileSHA1Hashsum(filePath)
+            digest.update("\0{}\0{}".format(path, fileDigest))
+
+        return digest.hexdigest(), index
+
+    def restore(self, key, jobDir):
+        '''
+        @summary: Copies the artefacts of a compile into a job directory
+        @param key: the key of the compile
+        @param jobDir: the job directory
+        @result: True on a hit
+        '''
+        with self.lock:
+            if not key in self.entries:
+                self.statistics["misses"] += 1
+                return False
+
+            entryDir = os.path.join(self.cacheDir, key)
+            try:
+                for path, filePath in self._walk(entryDir):
+                    dest = os.path.join(jobDir, *path.split("/"))
+                    FileUtils.createDirectory(os.path.split(dest)[0])
+                    FileUtils.copyFile(filePath, dest)
+                os.utime(entryDir, None)
+            except (IOError, OSError), e:
+                self.logger.warning("Failed to restore compile {}: {}"
+                    .format(key, e))
+                self._remove(key)
+                self.statistics["misses"] += 1
+                return False
+
+            self.entries[key] = self.entries.pop(key)
+            self.statistics["hits"] += 1
+            return True
+
+    def store(self, key, jobDir, index):
+        '''
+        @summary: Stores the artefacts of a successful compile
+        @param key: the key of the compile
+        @param jobDir: the compiled job directory
+        @param index: the input files of the job directory before the
+        compile (see snapshot)
+        @result: True if the artefacts are cached
+        '''
+        with self.lock:
+            if key in self.entries:
+                return True
+
+        artefacts = []
+        size = 0
+        for path, filePath in self._walk(jobDir):
+            stat = os.stat(filePath)
+            if index.get(path, None) != (stat.st_size, stat.st_mtime):
+                artefacts.append((path, filePath))
+                size += stat.st_size
+
+        if size > self.maxSize:
+            self.logger.info("Artefacts of compile {} exceed the compile "
+                "cache.".format(key))
+            return False
+
+        entryDir = os.path.join(self.cacheDir, key)
+        tempDir = entryDir + ".tmp"
+        FileUtils.deleteFile(tempDir)
+        try:
+            FileUtils.createDirectory(tempDir)
+            for path, filePath in artefacts:
+                dest = os.path.join(tempDir, *path.split("/"))
+                FileUtils.createDirectory(os.path.split(dest)[0])
+                FileUtils.copyFile(filePath, dest)
+        except (IOError, OSError), e:
+            self.logger.warning("Failed to cache compile {}: {}"
+                .format(key, e))
+            FileUtils.deleteFile(tempDir)
+            return False
+
+        with self.lock:
+            FileUtils.deleteFile(entryDir)
+            os.rename(tempDir, entryDir)
+            self.entries[key] = size
+            self.size += size
+            self.statistics["stores"] += 1
+            self._evict()
+        return True
+
+    def getStatistics(self):
+        '''
+        @summary: Returns the cache statistics
+        @result: a dictionary with the keys hits, misses, stores, evictions,
+        hitRate, entries and size (bytes)
+        '''
+        with self.lock:
+            statistics = dict(self.statistics)
+            lookups = statistics["hits"] + statistics["misses"]
+            statistics["hitRate"] = \
+                float(statistics["hits"]) / lookups if lookups else 0.0
+            statistics["entries"] = len(self.entries)
+            statistics["size"] = self.size
+            return statistics
+
+    # Internal Functions
+    # ========================
+    def _walk(self, directory):
+        '''
+        @summary: Lists the files of a directory, the IGNORED_DIRS of the top
+        level are skipped.
+        @result: a generator of (path separated by '/', file path)
+        '''
+        for root, dirs, filenames in os.walk(directory):
+            if root == directory:
+                dirs[:] = [name for name in dirs if not name in IGNORED_DIRS]
+            for filename in filenames:
+                filePath = os.path.join(root, filename)
+                yield (os.path.relpath(filePath, directory)
+                    .replace(os.sep, "/"), filePath)
+
+    def _loadEntries(self):
+        entries = []
+        for key in os.listdir(self.cacheDir):
+            entryDir = os.path.join(self.cacheDir, key)
+            if key.endswith(".tmp"):
+                FileUtils.deleteFile(entryDir)
+            else:
+                entries.append((os.path.getmtime(entryDir), key,
+                    sum(os.path.getsize(filePath)
+                        for path, filePath in self._walk(entryDir))))
+
+        for mtime, key, size in sorted(entries):
+            self.entries[key] = size
+            self.size += size
+
+        self._evict()
+        self.logger.info("Compile cache: {} entries, {} bytes.".format(
+            len(self.entries), self.size))
+
+    def _evict(self):
+        while self.size > self.maxSize and self.entries:
+            self._remove(next(iter(self.entries)))
+            self.statistics["evictions"] += 1
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)
+        FileUtils.deleteFile(os.path.join(self.cacheDir, key))
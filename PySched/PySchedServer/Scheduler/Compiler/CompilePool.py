@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Bounded pool of compile processes. At most compileSlots compilers
+run at once, further jobs wait in a backlog ordered by priority and
+submission. Compilers running longer than compileTimeout seconds are
+killed.
+'''
+
+from twisted.internet import reactor
+
+from CompilerProcessProtocol import CompilerProcessProtocol
+
+from collections import deque
+
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+# Default of the scheduling parameter compileTimeout (seconds, 0 disables
+# the timeout)
+COMPILE_TIMEOUT = 3600
+
+# Count of finished compiles kept for the latency statistics
+COMPILE_STATISTICS = 100
+
+
+def getDefaultSlots():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class CompilePool(object):
+    '''
+    @summary: Compile slots and backlog of the compiler
+    '''
+    def __init__(self, compiler):
+        '''
+        @summary: Initializes the pool
+        @param compiler: Reference to the Compiler, which receives the
+        results of the compile processes
+        @result:
+        '''
+        self.compiler = compiler
+        self.scheduler = compiler.scheduler
+        self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
+
+        # Heap of (-priority, sequence, submitted, job)
+        self.backlog = []
+        self.sequence = itertools.count()
+
+        # jobId -> {"submitted", "started", "protocol", "timeout",
+        # "timedOut"}. Started jobs are counted before their process is
+        # spawned within the reactor.
+        self.running = {}
+
+        # (waiting seconds, compile seconds) of the last compiles
+        self.latencies = deque(maxlen=COMPILE_STATISTICS)
+        self.statistics = {"submitted": 0, "started": 0, "timeouts": 0,
+            "maxQueued": 0}
+
+    def getSlots(self):
+        '''
+        @summary: Returns the count of compile slots: the scheduling
+        parameter compileSlots or, if not set, the count of cpu cores
+        @result:
+        '''
+        slots = int(self.scheduler.schedulingParams.get("compileSlots", 0))
+        return slots if slots > 0 else getDefaultSlots()
+
+    def submit(self, job):
+        '''
+        @summary: Queues a job for compiling
+        @param job: the job
+        @result:
+        '''
+        with self.lock:
+            heapq.heappush(self.backlog, (-(job.priority or 0),
+                next(self.sequence), time.time(), job))
+            self.statistics["submitted"] += 1
+            self.statistics["maxQueued"] = max(self.statistics["maxQueued"],
+                len(self.backlog))
+
+        self._startCompiles()
+
+    def processEnded(self, job):
+        '''
+        @summary: Frees the slot of a finished compile process and starts the
+        next jobs of the backlog.
+        @param job: the job
+        @result: True if the compile was killed by its timeout
+        '''
+        with self.lock:
+            entry = self.running.pop(job.jobId, None)
+
+        if not entry:
+            return False
+
+        if entry["timeout"] and entry["timeout"].active():
+            entry["timeout"].cancel()
+
+        now = time.time()
+        with self.lock:
+            self.latencies.append((entry["started"] - entry["submitted"],
+                now - entry["started"]))
+
+        self._startCompiles()
+        return entry["timedOut"]
+
+    def getStatistics(self):
+        '''
+        @summary: Returns the pool statistics
+        @result: a dictionary with the keys slots, running, queued (backlog),
+        maxQueued, submitted, started, timeouts, and the averages and maxima
+        of the waiting and compile seconds of the last compiles (waiting,
+        maxWaiting, compiling, maxCompiling)
+        '''
+        with self.lock:
+            statistics = dict(self.statistics)
+            statistics["running"] = len(self.running)
+            statistics["queued"] = len(self.backlog)
+            latencies = list(self.latencies)
+
+        statistics["slots"] = self.getSlots()
+        for key, values in (("waiting", [l[0] for l in latencies]),
+                ("compiling", [l[1] for l in latencies])):
+            statistics[key] = sum(values) / len(values) if values else 0.0
+            statistics["max" + key[0].upper() + key[1:]] = \
+                max(values) if values else 0.0
+
+        return statistics
+
+    # Internal Functions
+    # ========================
+    def _startCompiles(self):
+        '''
+        @summary: Starts jobs of the backlog while slots are free
+        '''
+        slots = self.getSlots()
+        started = []
+        with self.lock:
+            while self.backlog and len(self.running) < slots:
+                priority, sequence, submitted, job = \
+                    heapq.heappop(self.backlog)
+                self.running[job.jobId] = {"submitted": submitted,
+                    "started": time.time(), "protocol": None,
+                    "timeout": None, "timedOut": False}
+                self.statistics["started"] += 1
+                started.append(job)
+
+        # The scheduler runs on its own thread, processes must be spawned
+        # within the reactor.
+        for job in started:
+            reactor.callFromThread(self._spawn, job)
+
+    def _spawn(self, job):
+        '''
+        @summary: Starts the compile process of a job
+        @param job:
+        @result:
+        '''
+
+        # Setting up the compile process parameter
+        # ==============================
+        jobPath = os.path.join(self.scheduler.workingDir, str(job.jobId))
+
+        # parse command Template
+        template = job.compilerStr.split(" ")
+
+        # Start the compiler
+        # ==============================
+
+        self.logger.debug("Spawn process: {}".format(template))
+        protocol = CompilerProcessProtocol(job, jobPath, self.compiler)
+        try:
+            reactor.spawnProcess(protocol, executable=template[0],
+                args=template, path=jobPath, env=os.environ)
+        except Exception, e:
+            self.logger.error("Failed to start the compiler of job {}: {}"
+                .format(job.jobId, e))
+            protocol.stdOutput.close()
+            protocol.errOutput.close()
+            self.compiler.compilingFailed(job)
+            return
+
+        timeout = self.scheduler.schedulingParams.get("compileTimeout",
+            COMPILE_TIMEOUT)
+        with self.lock:
+            entry = self.running.get(job.jobId, None)
+            if entry:
+                entry["protocol"] = protocol
+                if timeout > 0:
+                    entry["timeout"] = reactor.callLater(timeout,
+                        self._timeout, job.jobId)
+
+        # write a log file
+        # ==============================
+        self.logger.info("Compile process for job {} started.".format(job.jobId))
+
+    def _timeout(self, jobId):
+        with self.lock:
+            entry = self.running.get(jobId, None)
+            if not entry or not entry["protocol"]:
+                return
+            entry["timedOut"] = True
+            self.statistics["timeouts"] += 1
+
+        self.logger.warning("Compile process for job {} timed out."
+            .format(jobId))
+        entry["protocol"].kill()
@@ -6,11 +6,14 @@ Created on 2013-01-04 12:10
 '''
 
 from twisted.internet import reactor
+from twisted.python.threadable import isInIOThread
 
-from CompilerProcessProtocol import CompilerProcessProtocol
+from CompilePool import CompilePool, COMPILE_TIMEOUT
+from CompileCache import CompileCache, COMPILE_CACHE_SIZE
 
 import logging
 import os
+import threading
 
 class Compiler(object):
     '''
@@ -25,48 +28,158 @@ class Compiler(object):
         '''
         self.scheduler = scheduler
         self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
 
+        self.cache = CompileCache(scheduler.workingDir,
+            int(scheduler.schedulingParams.get("compileCacheSize",
+                COMPILE_CACHE_SIZE)))
 
-    def compileJob(self, job):
+        # jobId -> (key, input files) of the running compiles which are
+        # cached when completed
+        self.compiles = {}
+
+        # key -> jobs waiting for the running compile with the same key
+        self.waiting = {}
+
+        # Compile slots and backlog
+        self.pool = CompilePool(self)
+
+
+    def compileJob(self, job, indexed=False):
         '''
-        @summary: Compiles a job.
+        @summary: Compiles a job. The artefacts of a cached compile with the
+        same input files and compiler command are copied into the job
+        directory instead. Jobs with the key of a running compile wait for
+        its artefacts.
         @param job:
+        @param indexed: True if the Locality indexed the job for this call
         @result:
         '''
+        jobPath = self._getJobPath(job)
+        if not self.scheduler.schedulingParams.get("compileCache", 1):
+            return self._spawn(job)
+
+        # The digests of the large input files are taken from the input
+        # index of the Locality, which is built on a worker thread. Only the
+        # small files are hashed on the scheduler thread.
+        locality = self.scheduler.locality
+        digests = locality.getIndex(job)
+        if digests is None and not indexed:
+            locality.indexLater(job, lambda: self._resume(job))
+            return True
+
+        key, index = self.cache.snapshot(jobPath, job.compilerStr, digests)
+        with self.lock:
+            if key in self.waiting:
+                self.waiting[key].append(job)
+                self.logger.info("Job {} waits for the compile {}."
+                    .format(job.jobId, key))
+                return True
+
+            cached = self.cache.restore(key, jobPath)
+            if not cached:
+                self.waiting[key] = []
+                self.compiles[job.jobId] = (key, index)
+
+        if cached:
+            self.logger.info("Job {} compiled from the compile cache."
+                .format(job.jobId))
+            self.scheduler.compilingCompleted(job)
+            return True
+
+        return self._spawn(job)
 
-        # Setting up the compile process parameter
-        # ==============================
-        jobPath = os.path.join(self.scheduler.workingDir, str(job.jobId))
+    def compilingCompleted(self, job):
+        '''
+        @summary: Is called when a job is compiled successful. The artefacts
+        are cached and copied to the waiting jobs.
+        @param job:
+        @result:
+        '''
+        self.pool.processEnded(job)
+        if isInIOThread():
+            # Called by the compile process, the artefacts are copied on
+            # the scheduler thread.
+            self.scheduler.schedulerPool.callInThread(
+                self.compilingCompleted, job)
+            return
 
-        # parse command Template
-        template = job.compilerStr.split(" ")
+        with self.lock:
+            key, index = self.compiles.pop(job.jobId, (None, None))
 
-        # Start the compiler
-        # ==============================
+        if key:
+            self.cache.store(key, self._getJobPath(job), index)
 
-        self.logger.debug("Spawn process: {}".format(template))
+        self.scheduler.compilingCompleted(job)
 
-        reactor.spawnProcess(CompilerProcessProtocol(job, jobPath, self.scheduler), executable=template[0],
-            args=template, path=jobPath, env=os.environ)
+        with self.lock:
+            waiting = self.waiting.pop(key, [])
 
-        # write a log file
-        # ==============================
-        self.logger.info("Compile process for job {} started.".format(job.jobId))
-        return True
+        for waitingJob in waiting:
+            if self.cache.restore(key, self._getJobPath(waitingJob)):
+                self.scheduler.compilingCompleted(waitingJob)
+            else:
+                self._spawn(waitingJob)
 
-    def compilingCompleted(self, job):
+    def compilingFailed(self, job):
         '''
-        @summary: Is called when a job is compiled successful.
+        @summary: Is called when a job could not be compiled. The waiting
+        jobs are compiled on their own.
         @param job:
         @result:
         '''
-        self.scheduler.compilingComplete(job)
+        if self.pool.processEnded(job):
+            self.scheduler.pySchedServer.addToJobLog(job.jobId,
+                "Compiler killed after {} seconds.".format(
+                    self.scheduler.schedulingParams.get("compileTimeout",
+                        COMPILE_TIMEOUT)))
 
-    def compilingFailed(self, job):
+        with self.lock:
+            key, index = self.compiles.pop(job.jobId, (None, None))
+            waiting = self.waiting.pop(key, [])
+
+        self.scheduler.compilingFailed(job)
+
+        for waitingJob in waiting:
+            self._spawn(waitingJob)
+
+    def getStatistics(self):
+        '''
+        @summary: Returns the compile statistics
+        @result: a dictionary with the keys cache (see
+        CompileCache.getStatistics), pool (see CompilePool.getStatistics) and
+        waiting (jobs waiting for a running compile)
         '''
-        @summary: Is called when a job could not be compiled
+        with self.lock:
+            waiting = sum(len(jobs) for jobs in self.waiting.itervalues())
+
+        return {"cache": self.cache.getStatistics(),
+            "pool": self.pool.getStatistics(), "waiting": waiting}
+
+    # Internal Functions
+    # ========================
+    def _getJobPath(self, job):
+        return os.path.join(self.scheduler.workingDir, str(job.jobId))
+
+    def _resume(self, job):
+        '''
+        @summary: Continues compileJob on the scheduler thread after the job
+        was indexed
+        '''
+        # Without a running reactor (e.g. the Simulator) the job was indexed
+        # on the calling thread
+        if not reactor.running:
+            self.compileJob(job, indexed=True)
+        else:
+            self.scheduler.schedulerPool.callInThread(self.compileJob, job,
+                True)
+
+    def _spawn(self, job):
+        '''
+        @summary: Queues the compile process of a job
         @param job:
         @result:
         '''
-        self.scheduler.compilingFailed(job)
-
+        self.pool.submit(job)
+        self.logger.info("Job {} queued for compiling.".format(job.jobId))
+        return True
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Job dependencies. A job may depend on the end of other jobs
+(afterok: the parent must end with DONE, afterany: any end). Dependencies
+are written like "afterok:12:13" (one type, one or more job ids).
+'''
+
+from PySched.Common.DataStructures import JobState
+
+import threading
+
+AFTER_OK = "afterok"
+AFTER_ANY = "afterany"
+DEPENDENCY_TYPES = [AFTER_OK, AFTER_ANY]
+
+def parseDependencies(dependencies):
+    '''
+    @summary: Parses dependencies
+    @param dependencies: a list of strings like "afterok:12:13" or one
+    string with dependencies separated by ';'. References which are no
+    numbers are kept as strings (keys of a job DAG, see getLevels).
+    @result: a list of tuples (type, reference)
+    @raise ValueError: if a dependency is invalid
+    '''
+    if not dependencies:
+        return []
+
+    if isinstance(dependencies, basestring):
+        dependencies = dependencies.split(";")
+
+    edges = []
+    for dependency in dependencies:
+        parts = [part.strip() for part in str(dependency).split(":")]
+        if len(parts) < 2 or not parts[0].lower() in DEPENDENCY_TYPES:
+            raise ValueError("Invalid dependency '{}'".format(dependency))
+
+        for reference in parts[1:]:
+            if not reference:
+                raise ValueError("Invalid dependency '{}'".format(dependency))
+            edges.append((parts[0].lower(),
+                int(reference) if reference.isdigit() else reference))
+
+    return edges
+
+def formatDependencies(edges):
+    '''
+    @summary: Returns the dependencies as a list of strings (one per edge)
+    @param edges: a list of tuples (type, jobId)
+    @result:
+    '''
+    return ["{}:{}".format(dependencyType, reference)
+        for dependencyType, reference in edges]
+
+def getLevels(keys, edges):
+    '''
+    @summary: Sorts the jobs of a DAG topologically.
+    @param keys: the keys of the jobs
+    @param edges: a list with the edges of each job (see parseDependencies).
+    References to other jobs of the DAG are keys, numbers refer to existing
+    jobs and are ignored.
+    @result: a list of levels, each level is a list of indexes into keys.
+    The jobs of a level only depend on jobs of the previous levels.
+    @raise ValueError: if a key is unknown or not unique or the dependencies
+    contain a cycle
+    '''
+    indexes = {}
+    for index, key in enumerate(keys):
+        if key in indexes:
+            raise ValueError("Duplicate key '{}'".format(key))
+        indexes[key] = index
+
+    parents = []
+    children = [[] for key in keys]
+    for index, jobEdges in enumerate(edges):
+        local = set()
+        for dependencyType, reference in jobEdges:
+            if isinstance(reference, basestring):
+                if not reference in indexes:
+                    raise ValueError("Unknown key '{}'".format(reference))
+                local.add(indexes[reference])
+
+        parents.append(len(local))
+        for parent in local:
+            children[parent].append(index)
+
+    levels = []
+    level = [index for index, count in enumerate(parents) if count == 0]
+    while level:
+        levels.append(level)
+        nextLevel = []
+        for index in level:
+            for child in children[index]:
+                parents[child] -= 1
+                if parents[child] == 0:
+                    nextLevel.append(child)
+        level = nextLevel
+
+    if sum(len(level) for level in levels) < len(keys):
+        raise ValueError("Cycle between the jobs {}".format(", ".join(
+            str(keys[index]) for index, count in enumerate(parents) if count)))
+
+    return levels
+
+def isSuccessful(stateId):
+    return stateId in [JobState.lookup("DONE"),
+        JobState.lookup("ARCHIVED (DONE)")]
+
+def hasEnded(stateId):
+    return stateId is not None and stateId >= JobState.lookup("DONE")
+
+
+class DependencyGraph(object):
+    '''
+    @summary: The unresolved dependencies of the waiting jobs, indexed by
+    job and by parent.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # jobId -> {parentId: type}
+        self.pending = {}
+
+        # parentId -> set of jobIds
+        self.children = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, jobId):
+        return jobId in self.pending
+
+    def add(self, jobId, edges):
+        '''
+        @summary: Adds the dependencies of a job
+        @param jobId: the id of the job
+        @param edges: a list of tuples (type, parentId). If there are
+        several edges to the same parent, afterok wins.
+        @result:
+        '''
+        with self.lock:
+            parents = self.pending.setdefault(jobId, {})
+            for dependencyType, parentId in edges:
+                if parents.get(parentId, None) != AFTER_OK:
+                    parents[parentId] = dependencyType
+                self.children.setdefault(parentId, set()).add(jobId)
+
+    def remove(self, jobId):
+        '''
+        @summary: Removes all dependencies of a job
+        @result:
+        '''
+        with self.lock:
+            for parentId in self.pending.pop(jobId, {}):
+                self._discardChild(parentId, jobId)
+
+    def resolve(self, parentId, stateId):
+        '''
+        @summary: Resolves the dependencies on an ended job
+        @param parentId: the id of the ended job
+        @param stateId: the state of the ended job
+        @result: a tuple (released, failed). released is a list of job ids
+        without remaining dependencies, failed a list of job ids whose
+        afterok dependency failed. Both are removed from the graph.
+        '''
+        released = []
+        failed = []
+        successful = isSuccessful(stateId)
+
+        with self.lock:
+            for jobId in self.children.pop(parentId, set()):
+                parents = self.pending.get(jobId, None)
+                if parents is None:
+                    continue
+
+                dependencyType = parents.pop(parentId, None)
+                if dependencyType == AFTER_OK and not successful:
+                    failed.append(jobId)
+                    del self.pending[jobId]
+                    for otherId in parents:
+                        self._discardChild(otherId, jobId)
+                elif not parents:
+                    released.append(jobId)
+                    del self.pending[jobId]
+
+        return released, failed
+
+    def getDependencies(self, jobId):
+        '''
+        @summary: Returns the unresolved dependencies of a job
+        @result: a dictionary parentId -> type
+        '''
+        with self.lock:
+            return dict(self.pending.get(jobId, {}))
+
+    def _discardChild(self, parentId, jobId):
+        children = self.children.get(parentId, None)
+        if children is not None:
+            children.discard(jobId)
+            if not children:
+                del self.children[parentId]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Priority queue of the scheduler. Jobs are ordered by priority,
+waiting time (aging) and the recent usage of their owner (fair share).
+'''
+
+import heapq
+import itertools
+import threading
+import time
+
+# Seconds of waiting time which equal one priority level. A job waiting
+# AGING_INTERVAL seconds longer than another one is placed like a job with a
+# one level higher priority, thus no job starves.
+AGING_INTERVAL = 600
+
+# Waiting time in seconds which is subtracted from the jobs of a user using
+# all recently used cpus. Users with a smaller share lose proportionally less.
+FAIR_SHARE_WEIGHT = 3600
+
+# Half-life in seconds of the recorded usage
+USAGE_HALF_LIFE = 6 * 3600
+
+
+class JobQueue(object):
+    '''
+    @summary: Job queue with one heap per user and an index jobId -> heap
+    entry. Push and remove are O(log n), pop is O(u + log n) for u users.
+    Removed entries are only marked and skipped when they reach the top of
+    their heap.
+
+    The key of a job is (class, rank, sequence). Compiled jobs (class 0) are
+    always before all other jobs (class 1). The rank is
+        enqueued - priority * AGING_INTERVAL + share * FAIR_SHARE_WEIGHT
+    which is the same as ordering by the aged priority, as all jobs age at
+    the same speed. share is the part of the recent usage of the owner. It
+    is the same for all jobs of a user, thus the heaps are ordered without
+    it and the share is only added when the jobs of different users are
+    compared. A usage change doesn't recalculate any rank.
+    '''
+    def __init__(self, agingInterval=AGING_INTERVAL,
+        fairShareWeight=FAIR_SHARE_WEIGHT, usageHalfLife=USAGE_HALF_LIFE):
+        self.agingInterval = agingInterval
+        self.fairShareWeight = fairShareWeight
+        self.usageHalfLife = usageHalfLife
+
+        self.lock = threading.RLock()
+        # userId -> heap of entries
+        self.heaps = {}
+        self.heapSize = 0
+        self.entries = {}
+        self.sequence = itertools.count()
+
+        # userId -> (usage, timestamp of the last decay)
+        self.usage = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, jobId):
+        return jobId in self.entries
+
+    # Queue Functions
+    # ========================
+    def push(self, job, front=False):
+        '''
+        @summary: Adds a job to the queue
+        @param job: the job
+        @param front: if True, the job is placed before all other jobs
+        @result: False if the job is already queued
+        '''
+        with self.lock:
+            if job.jobId in self.entries:
+                return False
+
+            priority = job.priority or 0
+            enqueued = time.time()
+            entry = [(0 if front else 1,
+                enqueued - priority * self.agingInterval,
+                next(self.sequence)),
+                job.jobId, job.userId, priority, enqueued, True]
+            self.entries[job.jobId] = entry
+            heapq.heappush(self.heaps.setdefault(job.userId, []), entry)
+            self.heapSize += 1
+            return True
+
+    def pop(self):
+        '''
+        @summary: Removes and returns the first job id of the queue
+        @result: the job id or None if the queue is empty
+        '''
+        with self.lock:
+            shares = self._shares()
+            first = None
+            for userId, heap in self.heaps.items():
+                while heap and not heap[0][-1]:
+                    heapq.heappop(heap)
+                    self.heapSize -= 1
+
+                if not heap:
+                    del self.heaps[userId]
+                    continue
+
+                key = self._key(heap[0], shares)
+                if first is None or key < first[0]:
+                    first = (key, heap)
+
+            if first is None:
+                return None
+
+            entry = heapq.heappop(first[1])
+            self.heapSize -= 1
+            del self.entries[entry[1]]
+            return entry[1]
+
+    def remove(self, jobId):
+        '''
+        @summary: Removes a job from the queue
+        @result: True if the job was queued
+        '''
+        with self.lock:
+            entry = self.entries.pop(jobId, None)
+            if entry is None:
+                return False
+
+            entry[-1] = False
+            if self.heapSize > 2 * len(self.entries) + 64:
+                self._rebuild()
+            return True
+
+    def getWindow(self, size=None):
+        '''
+        @summary: Returns the first job ids of the queue in order, without
+        removing them. The heaps are read from their roots downwards, thus
+        only O(size) entries are visited.
+        @param size: the count of job ids. None returns all job ids.
+        @result: a list of job ids
+        '''
+        with self.lock:
+            return [entry[1] for entry in self._first(size)]
+
+    # Fair Share
+    # ========================
+    def chargeUsage(self, userId, cpus):
+        '''
+        @summary: Records the usage of a user, e.g. the cpus of a dispatched
+        job. The usage decays with the half-life of the queue.
+        @result:
+        '''
+        with self.lock:
+            self.usage[userId] = (self._decayedUsage(userId) + cpus, time.time())
+
+    def getUsage(self):
+        '''
+        @summary: Returns the decayed usage of all users
+        @result: a dictionary userId -> usage
+        '''
+        with self.lock:
+            return dict((userId, self._decayedUsage(userId))
+                for userId in self.usage)
+
+    def getEntries(self):
+        '''
+        @summary: Returns the queued jobs in queue order
+        @result: a list of dictionaries with the keys jobId, userId, priority,
+        enqueued, compiled and rank
+        '''
+        with self.lock:
+            shares = self._shares()
+            return [{
+                "jobId": entry[1],
+                "userId": entry[2],
+                "priority": entry[3],
+                "enqueued": entry[4],
+                "compiled": entry[0][0] == 0,
+                "rank": self._key(entry, shares)[1],
+                } for entry in self._first(None, shares)]
+
+    # Internal Functions
+    # ========================
+    def _decayedUsage(self, userId):
+        usage, timestamp = self.usage.get(userId, (0.0, time.time()))
+        return usage * 0.5 ** ((time.time() - timestamp) / self.usageHalfLife)
+
+    def _shares(self):
+        usage = dict((userId, self._decayedUsage(userId))
+            for userId in self.usage)
+        total = sum(usage.values())
+        if total <= 0:
+            return {}
+
+        return dict((userId, value / total) for userId, value in usage.iteritems())
+
+    def _key(self, entry, shares):
+        front, rank, sequence = entry[0]
+        return (front, rank + shares.get(entry[2], 0) * self.fairShareWeight,
+            sequence)
+
+    def _first(self, size, shares=None):
+        '''
+        @summary: Returns the first entries of the queue in order. The
+        children of a heap entry are never before the entry, thus a frontier
+        heap starting with the roots of the user heaps yields the entries in
+        order.
+        '''
+        if size is None or size > len(self.entries):
+            size = len(self.entries)
+        if shares is None:
+            shares = self._shares()
+
+        frontier = [(self._key(heap[0], shares), userId, 0)
+            for userId, heap in self.heaps.iteritems() if heap]
+        heapq.heapify(frontier)
+
+        entries = []
+        while frontier and len(entries) < size:
+            key, userId, index = heapq.heappop(frontier)
+            heap = self.heaps[userId]
+            if heap[index][-1]:
+                entries.append(heap[index])
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier,
+                        (self._key(heap[child], shares), userId, child))
+
+        return entries
+
+    def _rebuild(self):
+        self.heaps = {}
+        for entry in self.entries.itervalues():
+            self.heaps.setdefault(entry[2], []).append(entry)
+        for heap in self.heaps.itervalues():
+            heapq.heapify(heap)
+        self.heapSize = len(self.entries)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Lease ledger of the scheduler. Every placement leases the cpus and
+the memory of the job on its workstation until the workstation reports the
+job, the job ends or the lease expires. The scheduler subtracts the leased
+capacity synchronously, so back-to-back placements don't overcommit a
+workstation before its next workstation informations.
+'''
+
+from Placement import requiredCpus
+
+import logging
+import threading
+import time
+
+# Seconds after which a lease without a confirmation of the workstation
+# (job running or ended) expires
+LEASE_TIMEOUT = 1800
+
+
+class LeaseLedger(object):
+    '''
+    @summary: The leases of all workstations
+    '''
+    def __init__(self):
+        self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
+
+        # jobId -> {"workstation", "cpus", "memory", "acquired", "expires",
+        # "started"}
+        self.leases = {}
+
+        # workstationName -> set of jobIds
+        self.byWorkstation = {}
+
+    def __len__(self):
+        return len(self.leases)
+
+    def __contains__(self, jobId):
+        return jobId in self.leases
+
+    def acquire(self, job, timeout=LEASE_TIMEOUT):
+        '''
+        @summary: Leases the cpus and memory of a job on its workstation. An
+        existing lease of the job is replaced.
+        @param job: the job with the selected workstation
+        @param timeout: seconds until the lease expires
+        @result:
+        '''
+        now = time.time()
+        with self.lock:
+            self._release(job.jobId)
+            self.leases[job.jobId] = {
+                "workstation": job.workstation,
+                "cpus": requiredCpus(job),
+                "memory": job.minMemory or 0,
+                "acquired": now,
+                "expires": now + timeout,
+                "started": False,
+                }
+            self.byWorkstation.setdefault(job.workstation, set()).add(
+                job.jobId)
+
+    def renew(self, jobId, timeout=LEASE_TIMEOUT):
+        '''
+        @summary: Extends a lease, e.g. when the job is transferred
+        @result: True if the job has a lease
+        '''
+        with self.lock:
+            lease = self.leases.get(jobId, None)
+            if lease:
+                lease["expires"] = time.time() + timeout
+            return bool(lease)
+
+    def release(self, jobId):
+        '''
+        @summary: Releases the lease of a job
+        @result: the released lease or None
+        '''
+        with self.lock:
+            return self._release(jobId)
+
+    def started(self, jobId):
+        '''
+        @summary: Marks the job of a lease as running. The lease is released
+        with the next workstation informations (see workstationReported), as
+        the job is counted by the loads of the workstation then.
+        @result:
+        '''
+        with self.lock:
+            lease = self.leases.get(jobId, None)
+            if lease:
+                lease["started"] = True
+
+    def workstationReported(self, workstationName):
+        '''
+        @summary: Releases the leases of the running jobs of a workstation
+        @result: the list of released jobIds
+        '''
+        with self.lock:
+            released = [jobId for jobId in
+                self.byWorkstation.get(workstationName, ())
+                if self.leases[jobId]["started"]]
+            for jobId in released:
+                self._release(jobId)
+
+        return released
+
+    def removeWorkstation(self, workstationName):
+        with self.lock:
+            for jobId in list(self.byWorkstation.get(workstationName, ())):
+                self._release(jobId)
+
+    def expire(self, workstationName=None):
+        '''
+        @summary: Drops the expired leases. The reservations of the returned
+        workstations must be updated by the caller.
+        @param workstationName: only the leases of this workstation are
+        checked, None checks all leases
+        @result: the set of workstations with expired leases
+        '''
+        now = time.time()
+        expired = set()
+        with self.lock:
+            if workstationName is None:
+                jobIds = self.leases.keys()
+            else:
+                jobIds = list(self.byWorkstation.get(workstationName, ()))
+
+            for jobId in jobIds:
+                lease = self.leases[jobId]
+                if lease["expires"] < now:
+                    self._release(jobId)
+                    expired.add(lease["workstation"])
+                    self.logger.warning("Lease of job {} on {} expired."
+                        .format(jobId, lease["workstation"]))
+
+        return expired
+
+    def getReserved(self, workstationName):
+        '''
+        @summary: Returns the capacity leased on a workstation. Expired
+        leases are counted until they are dropped by expire.
+        @result: a tuple (cpus, memory)
+        '''
+        cpus = 0
+        memory = 0
+        with self.lock:
+            for jobId in self.byWorkstation.get(workstationName, ()):
+                lease = self.leases[jobId]
+                cpus += lease["cpus"]
+                memory += lease["memory"]
+
+        return cpus, memory
+
+    def getLeases(self):
+        '''
+        @summary: Returns all leases
+        @result: a dictionary jobId -> {"workstation", "cpus", "memory",
+        "acquired", "expires", "started"}
+        '''
+        with self.lock:
+            return dict((jobId, dict(lease))
+                for jobId, lease in self.leases.iteritems())
+
+    def _release(self, jobId):
+        lease = self.leases.pop(jobId, None)
+        if lease:
+            jobIds = self.byWorkstation.get(lease["workstation"], None)
+            if jobIds is not None:
+                jobIds.discard(jobId)
+                if not jobIds:
+                    del self.byWorkstation[lease["workstation"]]
+        return lease
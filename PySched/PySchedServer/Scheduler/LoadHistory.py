@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Load history of the workstations. The scheduler decides on a
+prediction of the cpu loads instead of the last reported snapshot: the
+smoothed load (EWMA), its trend and its deviation weighted by a risk factor.
+'''
+
+from collections import deque
+
+import math
+import threading
+import time
+
+# Count of samples kept per workstation (two minutes of workstation
+# informations)
+HISTORY_SIZE = 12
+
+# Defaults of the scheduling parameters
+LOAD_ALPHA = 0.5
+LOAD_RISK_FACTOR = 1.0
+LOAD_HORIZON = 10
+
+
+class WorkstationLoad(object):
+    '''
+    @summary: Load history of one workstation. The load of each cpu is
+    smoothed on its own.
+    '''
+    def __init__(self, loads, timestamp):
+        # Ring buffer of (timestamp, loads)
+        self.samples = deque(maxlen=HISTORY_SIZE)
+        self.samples.append((timestamp, loads))
+
+        self.level = list(loads)
+        self.variance = [0.0] * len(loads)
+        self.trend = [0.0] * len(loads)
+
+    def __len__(self):
+        return len(self.level)
+
+    def add(self, loads, timestamp, alpha):
+        '''
+        @summary: Adds a sample
+        @param loads: the cpu loads
+        @param timestamp: the time of the sample
+        @param alpha: weight of the sample within the EWMA
+        @result:
+        '''
+        for i, load in enumerate(loads):
+            difference = load - self.level[i]
+            self.level[i] += alpha * difference
+            self.variance[i] = (1 - alpha) * \
+                (self.variance[i] + alpha * difference * difference)
+
+        self.samples.append((timestamp, loads))
+        self.trend = self._slopes()
+
+    def predict(self, riskFactor, horizon):
+        '''
+        @summary: Returns the predicted cpu loads
+        @param riskFactor: weight of the standard deviation
+        @param horizon: seconds the trend is extrapolated
+        @result: a list with the predicted load of each cpu
+        '''
+        return [min(max(level + trend * horizon +
+            riskFactor * math.sqrt(variance), 0.0), 100.0)
+            for level, trend, variance in zip(self.level, self.trend,
+                self.variance)]
+
+    def _slopes(self):
+        '''
+        @summary: Returns the least squares slope (load per second) of each
+        cpu over the samples of the ring buffer
+        '''
+        count = len(self.samples)
+        meanTime = sum(timestamp for timestamp, loads in self.samples) / count
+        denominator = sum((timestamp - meanTime) ** 2
+            for timestamp, loads in self.samples)
+        if not denominator:
+            return [0.0] * len(self.level)
+
+        means = [sum(column) / count
+            for column in zip(*[loads for timestamp, loads in self.samples])]
+        slopes = [0.0] * len(self.level)
+        for timestamp, loads in self.samples:
+            weight = (timestamp - meanTime) / denominator
+            for i, load in enumerate(loads):
+                slopes[i] += weight * (load - means[i])
+
+        return slopes
+
+
+class LoadHistory(object):
+    '''
+    @summary: Load histories of all workstations
+    '''
+    def __init__(self, scheduler):
+        '''
+        @summary: Initializes the histories
+        @param scheduler: Reference to the PyScheduler (scheduling parameters)
+        @result:
+        '''
+        self.scheduler = scheduler
+        self.lock = threading.Lock()
+
+        # workstationName -> (WorkstationLoad, predicted loads)
+        self.histories = {}
+
+    def update(self, workstation):
+        '''
+        @summary: Adds the reported cpu loads of a workstation. A changed cpu
+        count restarts the history, repeated reports within one second are
+        ignored.
+        @param workstation: the workstation informations
+        @result:
+        '''
+        name = workstation.get("workstationName", None)
+        loads = [float(load) for load in workstation.get("cpuLoad", [])]
+        params = self.scheduler.schedulingParams
+        now = time.time()
+
+        with self.lock:
+            history = self.histories.get(name, (None, None))[0]
+            if history is None or len(history) != len(loads):
+                history = WorkstationLoad(loads, now)
+            elif history.samples[-1][1] == loads and \
+                now - history.samples[-1][0] < 1:
+                return
+            else:
+                history.add(loads, now, params.get("loadAlpha", LOAD_ALPHA))
+
+            self.histories[name] = (history, history.predict(
+                params.get("loadRiskFactor", LOAD_RISK_FACTOR),
+                params.get("loadHorizon", LOAD_HORIZON)))
+
+    def remove(self, workstationName):
+        with self.lock:
+            self.histories.pop(workstationName, None)
+
+    def getLoads(self, workstation):
+        '''
+        @summary: Returns the cpu loads the scheduler decides on
+        @param workstation: the workstation informations
+        @result: the predicted loads or, without history or with disabled
+        smoothing, the reported loads
+        '''
+        loads = workstation.get("cpuLoad", [])
+        if not self.scheduler.schedulingParams.get("loadSmoothing", 1):
+            return loads
+
+        with self.lock:
+            history, predicted = self.histories.get(
+                workstation.get("workstationName", None), (None, None))
+
+        if predicted is None or len(predicted) != len(loads):
+            return loads
+        return predicted
+
+    def getStatistics(self, workstationName):
+        '''
+        @summary: Returns the load statistics of a workstation
+        @result: a dictionary with the keys samples, level (smoothed loads),
+        trend (load per second), deviation and predicted (one value per cpu) or
+        None
+        '''
+        with self.lock:
+            history, predicted = self.histories.get(workstationName,
+                (None, None))
+            if history is None:
+                return None
+
+            return {
+                "samples": len(history.samples),
+                "level": list(history.level),
+                "trend": list(history.trend),
+                "deviation": [math.sqrt(variance)
+                    for variance in history.variance],
+                "predicted": list(predicted),
+                }
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Data locality. Workstations keep the larger input files of their
+jobs in an input cache and report the SHA1 digests of the cached files
+(workstation information inputCache). Workstations holding most of the
+input bytes of a job get a bonus, cached files aren't transferred again.
+'''
+
+from PySched.Common.IO import FileUtils
+
+from twisted.internet import reactor
+
+import logging
+import os
+import threading
+
+# Minimal size (bytes) of input files which are cached by the workstations
+INPUT_CACHE_MIN_SIZE = 1024 * 1024
+
+# Default bonus of a workstation which holds all input bytes of a job
+LOCALITY_BONUS = 300
+
+
+class Locality(object):
+    '''
+    @summary: Index of the input caches of the workstations and of the input
+    files of the jobs.
+    '''
+    def __init__(self, scheduler):
+        '''
+        @summary: Initializes the index
+        @param scheduler: Reference to the PyScheduler
+        @result:
+        '''
+        self.scheduler = scheduler
+        self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
+
+        # workstationName -> set of digests, digest -> set of workstationNames
+        self.cached = {}
+        self.holders = {}
+
+        # jobId -> (input bytes, {path: (size, mtime, digest)}). Only files
+        # with at least INPUT_CACHE_MIN_SIZE bytes have a digest.
+        self.jobInputs = {}
+        # jobId -> callbacks of the jobs indexed on a worker thread
+        self.indexing = {}
+
+        self.statistics = {"jobs": 0, "transferred": 0, "cached": 0}
+
+    # Workstation Functions
+    # ========================
+    def workstationUpdated(self, workstation):
+        '''
+        @summary: Updates the cached digests of a workstation
+        @param workstation: the workstation informations
+        @result:
+        '''
+        if not "inputCache" in workstation:
+            return
+
+        name = workstation.get("workstationName", None)
+        digests = set(workstation.get("inputCache", None) or [])
+        with self.lock:
+            old = self.cached.get(name, set())
+            for digest in old - digests:
+                self._discardHolder(digest, name)
+            for digest in digests - old:
+                self.holders.setdefault(digest, set()).add(name)
+            self.cached[name] = digests
+
+    def workstationRemoved(self, workstationName):
+        with self.lock:
+            for digest in self.cached.pop(workstationName, set()):
+                self._discardHolder(digest, workstationName)
+
+    # Job Functions
+    # ========================
+    def getInputs(self, job, refresh=False):
+        '''
+        @summary: Returns the input files of a job. The files are indexed
+        once, unchanged files aren't hashed again on a refresh.
+        @param job: the job
+        @param refresh: if True, the job directory is indexed again
+        @result: a tuple (input bytes, {path: (size, digest)}). The paths
+        are relative to the job directory and separated by '/', only the
+        cachable files are listed.
+        '''
+        with self.lock:
+            inputs = self.jobInputs.get(job.jobId, None)
+
+        if inputs is None or refresh:
+            inputs = self._indexJob(job, inputs[1] if inputs else {})
+            with self.lock:
+                self.jobInputs[job.jobId] = inputs
+
+        total, files = inputs
+        return total, dict((path, (size, digest))
+            for path, (size, mtime, digest) in files.iteritems())
+
+    def indexJob(self, job):
+        '''
+        @summary: Indexes the input files of a job, e.g. when its upload was
+        received. Hashing large files takes a while, thus this must not be
+        called on the scheduler thread.
+        @param job: the job
+        @result:
+        '''
+        try:
+            self.getInputs(job, refresh=True)
+        except (IOError, OSError), e:
+            self.logger.warning("Failed to index the inputs of job {}: {}"
+                .format(job.jobId, e))
+
+        with self.lock:
+            callbacks = self.indexing.pop(job.jobId, [])
+
+        for callback in callbacks:
+            callback()
+
+    def getIndex(self, job):
+        '''
+        @summary: Returns the index of the input files of a job without
+        indexing the job directory.
+        @param job: the job
+        @result: a dictionary {path: (size, mtime, digest)} or None if the
+        job isn't indexed yet (see indexLater)
+        '''
+        with self.lock:
+            inputs = self.jobInputs.get(job.jobId, None)
+
+        return dict(inputs[1]) if inputs else None
+
+    def indexLater(self, job, callback=None):
+        '''
+        @summary: Indexes the input files of a job on a worker thread.
+        Without a running reactor (e.g. the Simulator) the job is indexed
+        directly.
+        @param job: the job
+        @param callback: called without arguments on the worker thread when
+        the job is indexed
+        @result:
+        '''
+        if not reactor.running:
+            self.getInputs(job, refresh=True)
+            if callback:
+                callback()
+            return
+
+        with self.lock:
+            running = job.jobId in self.indexing
+            callbacks = self.indexing.setdefault(job.jobId, [])
+            if callback:
+                callbacks.append(callback)
+
+        if not running:
+            reactor.callFromThread(reactor.callInThread, self.indexJob, job)
+
+    def getCachedBytes(self, job):
+        '''
+        @summary: Returns the input bytes of a job cached by the workstations.
+        Jobs which aren't indexed yet (e.g. after a restart) are indexed on a
+        worker thread, until then nothing is cached for them.
+        @param job: the job
+        @result: a tuple (input bytes, {workstationName: cached bytes})
+        '''
+        with self.lock:
+            inputs = self.jobInputs.get(job.jobId, None)
+
+        if inputs is None:
+            self.indexLater(job)
+            return 0, {}
+
+        total, files = inputs
+
+        cached = {}
+        with self.lock:
+            for size, digest in set((size, digest)
+                for size, mtime, digest in files.itervalues()):
+                for name in self.holders.get(digest, ()):
+                    cached[name] = cached.get(name, 0) + size
+
+        return total, cached
+
+    def getBonuses(self, job):
+        '''
+        @summary: Returns the locality bonus of the workstations for a job:
+        localityBonus times the fraction of the input bytes cached by the
+        workstation.
+        @param job: the job
+        @result: a dictionary workstationName -> bonus (only workstations
+        caching input files of the job)
+        '''
+        bonus = self.scheduler.schedulingParams.get("localityBonus",
+            LOCALITY_BONUS)
+        if not bonus or not self.holders:
+            return {}
+
+        total, cached = self.getCachedBytes(job)
+        if not total:
+            return {}
+
+        return dict((name, bonus * float(size) / total)
+            for name, size in cached.iteritems())
+
+    def getTransferManifest(self, job, workstationName):
+        '''
+        @summary: Returns the input files of a job to transfer to a
+        workstation. The job directory is indexed again.
+        @param job: the job
+        @param workstationName: the target workstation
+        @result: a tuple (inputFiles, cachedInputs, cached bytes).
+        inputFiles is a dictionary path -> digest of the cachable files,
+        cachedInputs the list of paths cached by the workstation.
+        '''
+        total, files = self.getInputs(job, refresh=True)
+
+        with self.lock:
+            digests = self.cached.get(workstationName, set())
+            cachedInputs = [path for path, (size, digest) in files.iteritems()
+                if digest in digests]
+
+        return (dict((path, digest) for path, (size, digest)
+            in files.iteritems()), cachedInputs,
+            sum(files[path][0] for path in cachedInputs))
+
+    def transferred(self, jobId, transferred, cached):
+        '''
+        @summary: Counts the bytes of a transferred job
+        @param transferred: the size of the transferred archive
+        @param cached: the input bytes taken from the input cache
+        @result:
+        '''
+        with self.lock:
+            self.statistics["jobs"] += 1
+            self.statistics["transferred"] += transferred
+            self.statistics["cached"] += cached
+
+    def jobEnded(self, jobId):
+        with self.lock:
+            self.jobInputs.pop(jobId, None)
+
+    def getStatistics(self):
+        '''
+        @summary: Returns the transfer statistics
+        @result: a dictionary with the keys jobs (transferred jobs),
+        transferred (bytes) and cached (input bytes taken from the input
+        caches)
+        '''
+        with self.lock:
+            return dict(self.statistics)
+
+    # Internal Functions
+    # ========================
+    def _indexJob(self, job, files):
+        '''
+        @summary: Indexes the job directory
+        @param files: the previous index, digests of unchanged files are
+        reused
+        @result: a tuple (input bytes, {path: (size, mtime, digest)})
+        '''
+        jobDir = os.path.join(self.scheduler.pySchedServer.workingDir,
+            str(job.jobId))
+
+        total = 0
+        index = {}
+        for root, dirs, filenames in os.walk(jobDir):
+            for filename in filenames:
+                filePath = os.path.join(root, filename)
+                try:
+                    stat = os.stat(filePath)
+                except OSError:
+                    continue
+
+                total += stat.st_size
+                if stat.st_size < INPUT_CACHE_MIN_SIZE:
+                    continue
+
+                path = os.path.relpath(filePath, jobDir).replace(os.sep, "/")
+                previous = files.get(path, None)
+                if previous and previous[:2] == (stat.st_size, stat.st_mtime):
+                    index[path] = previous
+                else:
+                    index[path] = (stat.st_size, stat.st_mtime,
+                        FileUtils.getFileSHA1Hashsum(filePath))
+
+        return total, index
+
+    def _discardHolder(self, digest, workstationName):
+        holders = self.holders.get(digest, None)
+        if holders is not None:
+            holders.discard(workstationName)
+            if not holders:
+                del self.holders[digest]
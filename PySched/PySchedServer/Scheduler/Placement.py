@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Batch placement of queued jobs. A snapshot of the free capacity of
+all workstations is taken once per scheduling round and a whole window of
+jobs is packed onto it. Optionally with backfilling: the first job which
+can't be placed gets a reservation, later jobs may only use the reserved
+workstation if they don't delay the reservation.
+'''
+
+from PySched.Common.DataStructures import Job, JobState
+from PySched.Common import str2Datetime
+
+import logging
+import time
+
+# Walltime in seconds of jobs without an estimation
+DEFAULT_WALLTIME = 24 * 3600
+
+def requiredCpus(job):
+    '''
+    @summary: Returns the count of cpus a job occupies on its workstation
+    '''
+    return max(job.minCpu or 1, 1)
+
+def getFreeMemory(workstation):
+    '''
+    @summary: Returns the unused memory of a workstation in MB as reported
+    by the workstation (memory and memoryLoad)
+    '''
+    return workstation.get("memory", 0) * 1024 * \
+        (100 - workstation.get("memoryLoad", 0)) / 100.0
+
+def jobWalltime(job, default=DEFAULT_WALLTIME):
+    '''
+    @summary: Returns the estimated runtime of a job in seconds
+    '''
+    return job.walltime or default
+
+
+class BatchPlacement(object):
+    '''
+    @summary: Assigns a window of jobs to workstations (best fit). The jobs
+    are placed in queue order, every job on the workstation with the best
+    score of the scheduler, calculated with the remaining capacity of the
+    snapshot. Thus single cpu jobs fill up occupied workstations and free
+    workstations are kept for multi cpu jobs.
+    '''
+    def __init__(self, scheduler):
+        '''
+        @summary: Initializes the placement
+        @param scheduler: Reference to the PyScheduler
+        @result:
+        '''
+        self.scheduler = scheduler
+        self.logger = logging.getLogger("PySchedServer")
+
+        # Reservation and count of backfilled jobs of the last plan
+        self.reservation = None
+        self.backfilled = 0
+
+    def takeSnapshot(self):
+        '''
+        @summary: Returns the free capacity of all usable workstations
+        @result: a dictionary workstationName -> {"freeCpus", "memory",
+        "workstation"}
+        '''
+        registry = self.scheduler.pySchedServer.workstations
+        snapshot = {}
+
+        for workstation in registry.getCandidates(minFreeCpus=1):
+            if workstation.get("maintenance", False):
+                continue
+
+            freeCpus = self.scheduler.getFreeCpus(workstation)
+            if freeCpus <= 0:
+                continue
+
+            snapshot[workstation.get("workstationName", None)] = {
+                "freeCpus": freeCpus,
+                "memory": self.scheduler.getFreeMemory(workstation),
+                "workstation": workstation,
+                }
+
+        return snapshot
+
+    def plan(self, jobs, snapshot, backfill=False):
+        '''
+        @summary: Assigns the jobs to the workstations of the snapshot. The
+        capacity of the snapshot is reduced by every assignment.
+        @param jobs: list of jobs in queue order
+        @param snapshot: the snapshot (see takeSnapshot)
+        @param backfill: if True, the first job which can't be placed gets a
+        reservation (see reserve), which isn't delayed by later jobs.
+        @result: a tuple (placements, probes). placements is a dictionary
+        jobId -> workstationName, probes is a dictionary jobId -> list of
+        Deferreds for jobs which can't be placed until programs are probed.
+        '''
+        placements = {}
+        probes = {}
+
+        now = time.time()
+        defaultWalltime = self.scheduler.schedulingParams.get(
+            "defaultWalltime", DEFAULT_WALLTIME)
+        releases = self.getReleaseTimes(now, defaultWalltime) \
+            if backfill else {}
+        self.reservation = None
+        self.backfilled = 0
+
+        for job in jobs:
+            if not snapshot:
+                break
+
+            cpus = requiredCpus(job)
+            candidates, unknown = self.getCandidates(job, cpus, snapshot)
+            end = now + jobWalltime(job, defaultWalltime)
+
+            if self.reservation:
+                candidates = [name for name in candidates
+                    if self.canBackfill(name, cpus, end)]
+
+            if not candidates:
+                if unknown:
+                    probes[job.jobId] = self.probe(unknown)
+                elif backfill and not self.reservation:
+                    self.reservation = self.reserve(job, cpus, snapshot,
+                        releases, now)
+                continue
+
+            bonuses = self.scheduler.locality.getBonuses(job)
+            selected = max(candidates, key=lambda name:
+                self.scheduler.scoreWorkstation(job,
+                    snapshot[name]["workstation"],
+                    snapshot[name]["freeCpus"], bonuses))
+
+            capacity = snapshot[selected]
+            capacity["freeCpus"] -= cpus
+            capacity["memory"] -= job.minMemory or 0
+            if capacity["freeCpus"] <= 0:
+                del snapshot[selected]
+
+            placements[job.jobId] = selected
+
+            if self.reservation:
+                self.backfilled += 1
+                if selected == self.reservation["workstation"] and \
+                    end > self.reservation["start"]:
+                    self.reservation["spareCpus"] -= cpus
+
+        return placements, probes
+
+    # Backfilling
+    # ========================
+    def getReleaseTimes(self, now, defaultWalltime):
+        '''
+        @summary: Returns the estimated end of all dispatched and running
+        jobs.
+        @param now: the current time (seconds since the epoch)
+        @param defaultWalltime: walltime of jobs without an estimation
+        @result: a dictionary workstationName -> list of (end, cpus)
+        '''
+        releases = {}
+        jobs = self.scheduler.pySchedServer.getFromDatabase(Job, stateId=[
+            JobState.lookup("DISPATCHED"),
+            JobState.lookup("RUNNING"),
+            JobState.lookup("PAUSED")])
+
+        for job in jobs:
+            if not job.workstation:
+                continue
+
+            started = str2Datetime(job.started)
+            start = time.mktime(started.timetuple()) if started else now
+            end = max(now, start + jobWalltime(job, defaultWalltime))
+            releases.setdefault(job.workstation, []).append(
+                (end, requiredCpus(job)))
+
+        return releases
+
+    def reserve(self, job, cpus, snapshot, releases, now):
+        '''
+        @summary: Finds the workstation on which the job can start first.
+        @param job: the job
+        @param cpus: the required cpus of the job
+        @param snapshot: the snapshot of the free capacity
+        @param releases: the estimated ends of the running jobs (see
+        getReleaseTimes)
+        @param now: the current time
+        @result: a dictionary with the keys jobId, workstation, start
+        (seconds since the epoch), cpus and spareCpus (cpus which are free
+        at the start besides the reservation) or None
+        '''
+        registry = self.scheduler.pySchedServer.workstations
+        reservation = None
+
+        for workstation in registry.getCandidates(os=job.reqOS,
+            programs=job.reqPrograms):
+            if workstation.get("maintenance", False) or \
+                workstation.get("memory", 0) * 1024 < (job.minMemory or 0):
+                continue
+
+            name = workstation.get("workstationName", None)
+            capacity = snapshot.get(name, None)
+            freeCpus = capacity["freeCpus"] if capacity else 0
+
+            start = now
+            if freeCpus < cpus:
+                start = None
+                for end, used in sorted(releases.get(name, [])):
+                    freeCpus += used
+                    if freeCpus >= cpus:
+                        start = end
+                        break
+
+            if start is None:
+                continue
+
+            if not reservation or start < reservation["start"]:
+                reservation = {
+                    "jobId": job.jobId,
+                    "workstation": name,
+                    "start": start,
+                    "cpus": cpus,
+                    "spareCpus": freeCpus - cpus,
+                    }
+
+        if reservation:
+            self.logger.debug("Reserved {} cpus on {} in {:.0f} s for job {}."
+                .format(cpus, reservation["workstation"],
+                    reservation["start"] - now, job.jobId))
+
+        return reservation
+
+    def canBackfill(self, workstationName, cpus, end):
+        '''
+        @summary: Returns True if a job can be placed on the workstation
+        without delaying the reservation.
+        @param workstationName: the workstation
+        @param cpus: the required cpus of the job
+        @param end: the estimated end of the job
+        @result:
+        '''
+        reservation = self.reservation
+        if workstationName != reservation["workstation"]:
+            return True
+
+        return end <= reservation["start"] or cpus <= reservation["spareCpus"]
+
+    def getCandidates(self, job, cpus, snapshot):
+        '''
+        @summary: Returns the workstations of the snapshot which can run the
+        job.
+        @result: a tuple (candidates, unknown). candidates is a list of
+        workstation names, unknown a list of (workstationName, program)
+        tuples of workstations which fit except for unknown programs.
+        '''
+        registry = self.scheduler.pySchedServer.workstations
+        programCache = self.scheduler.programCache
+        candidates = []
+        unknown = []
+
+        for workstation in registry.getCandidates(os=job.reqOS,
+            minFreeCpus=cpus):
+            name = workstation.get("workstationName", None)
+            capacity = snapshot.get(name, None)
+            if not capacity or capacity["freeCpus"] < cpus or \
+                capacity["memory"] < (job.minMemory or 0):
+                continue
+
+            missing = []
+            available = True
+            for program in job.reqPrograms:
+                if not program or program in workstation.get("programs", []):
+                    continue
+
+                cached = programCache.lookup(name, program)
+                if cached is None:
+                    missing.append((name, program))
+                elif not cached:
+                    available = False
+                    break
+
+            if not available:
+                continue
+
+            if missing:
+                unknown.extend(missing)
+            else:
+                candidates.append(name)
+
+        return candidates, unknown
+
+    def probe(self, unknown):
+        programCache = self.scheduler.programCache
+        return [programCache.probe(name, program) for name, program in unknown]
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Priority preemption. A high priority job which can't be placed
+pauses running jobs with a lower priority (the victims) and is placed on
+their cpus. The victims are resumed when the preemptor ended and their
+workstation has enough free cpus again.
+'''
+
+from PySched.Common.DataStructures import Job, JobState
+from PySched.Common import str2Datetime
+
+from Placement import requiredCpus
+
+import logging
+import threading
+import time
+
+# Minimal priority of a job to preempt other jobs
+PREEMPTION_PRIORITY = 5
+
+# Cost of a victim: VICTIM_COST + PRIORITY_COST * priority +
+# RUNTIME_COST * minutes running. The victims are chosen by cost per cpu.
+VICTIM_COST = 100
+PRIORITY_COST = 100
+RUNTIME_COST = 1
+
+
+class Preemption(object):
+    '''
+    @summary: Selects and tracks the victims of preemptions. The scheduler
+    calls preempt for high priority jobs which weren't placed and
+    resumeVictims before every scheduling pass.
+    '''
+    def __init__(self, scheduler):
+        '''
+        @summary: Initializes the preemption
+        @param scheduler: Reference to the PyScheduler
+        @result:
+        '''
+        self.scheduler = scheduler
+        self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
+
+        # victim jobId -> {"workstation", "cpus", "priority", "preemptor",
+        # "time"}
+        self.victims = {}
+
+    def __len__(self):
+        return len(self.victims)
+
+    def preempt(self, job):
+        '''
+        @summary: Pauses the cheapest set of victims which frees enough cpus
+        for the job.
+        @param job: the high priority job
+        @result: the name of the workstation with the freed cpus or None
+        '''
+        workstation, victims = self.selectVictims(job)
+        if not workstation:
+            return None
+
+        server = self.scheduler.pySchedServer
+        with self.lock:
+            for victim in victims:
+                self.victims[victim.jobId] = {
+                    "workstation": workstation,
+                    "cpus": requiredCpus(victim),
+                    "priority": victim.priority or 0,
+                    "preemptor": job.jobId,
+                    "time": time.time(),
+                    }
+
+        for victim in victims:
+            server.suspendJob(victim)
+            server.addToJobLog(victim.jobId,
+                "Paused for job {} (priority {}).".format(job.jobId,
+                job.priority))
+
+        self.logger.info("Job {} preempts job(s) {} on {}.".format(job.jobId,
+            ", ".join(str(victim.jobId) for victim in victims), workstation))
+        return workstation
+
+    def selectVictims(self, job):
+        '''
+        @summary: Finds the workstation on which the job can be placed by
+        pausing the cheapest running jobs with a lower priority.
+        @param job: the high priority job
+        @result: a tuple (workstationName, list of victim jobs) or (None, [])
+        '''
+        scheduler = self.scheduler
+        params = scheduler.schedulingParams
+        cpus = requiredCpus(job)
+        priority = job.priority or 0
+        now = time.time()
+
+        running = {}
+        with self.lock:
+            for victim in scheduler.pySchedServer.getFromDatabase(Job,
+                stateId=JobState.lookup("RUNNING")) or []:
+                if (victim.priority or 0) < priority and \
+                    victim.workstation and not victim.jobId in self.victims:
+                    running.setdefault(victim.workstation, []).append(victim)
+
+        selected = None
+        for workstation in scheduler.pySchedServer.workstations.getCandidates(
+            os=job.reqOS, programs=job.reqPrograms):
+            name = workstation.get("workstationName", None)
+            if not name in running or workstation.get("maintenance", False) \
+                or workstation.get("memory", 0) * 1024 < (job.minMemory or 0):
+                continue
+
+            freeCpus = max(scheduler.getFreeCpus(workstation), 0)
+            candidates = sorted(running[name], key=lambda victim:
+                self.getCost(victim, now, params) / requiredCpus(victim))
+
+            victims = []
+            cost = 0
+            for victim in candidates:
+                if freeCpus >= cpus:
+                    break
+                victims.append(victim)
+                freeCpus += requiredCpus(victim)
+                cost += self.getCost(victim, now, params)
+
+            if freeCpus >= cpus and (not selected or cost < selected[0]):
+                selected = (cost, name, victims)
+
+        if not selected:
+            return None, []
+
+        return selected[1], selected[2]
+
+    def getCost(self, victim, now, params):
+        '''
+        @summary: Returns the cost of pausing a job
+        @param victim: the running job
+        @param now: the current time
+        @param params: the scheduling parameters
+        @result:
+        '''
+        started = str2Datetime(victim.started)
+        runtime = now - time.mktime(started.timetuple()) if started else 0
+
+        return params.get("preemptionVictimCost", VICTIM_COST) + \
+            params.get("preemptionPriorityCost", PRIORITY_COST) * \
+            (victim.priority or 0) + \
+            params.get("preemptionRuntimeCost", RUNTIME_COST) * \
+            max(runtime, 0) / 60.0
+
+    def resumeVictims(self):
+        '''
+        @summary: Resumes the victims whose preemptor ended and whose
+        workstation has enough free cpus. Victims with a higher priority are
+        resumed first. The cpus of a
+        resumed victim are reserved until it is reported as running.
+        @result: the count of resumed victims
+        '''
+        scheduler = self.scheduler
+        server = scheduler.pySchedServer
+
+        with self.lock:
+            victims = sorted(self.victims.items(), key=lambda (jobId, victim):
+                (-victim["priority"], victim["time"]))
+
+        active = [JobState.lookup("DISPATCHED"), JobState.lookup("RUNNING"),
+            JobState.lookup("PAUSED")]
+        resumed = 0
+        freeCpus = {}
+        for jobId, victim in victims:
+            name = victim["workstation"]
+
+            # The cpus of the victim may look free until the workstation
+            # reports the load of the preemptor
+            preemptor = server.getJob(victim["preemptor"])
+            if preemptor and preemptor.workstation == name and \
+                preemptor.stateId in active:
+                continue
+
+            if not name in freeCpus:
+                workstation = server.workstations.getByName(name)
+                freeCpus[name] = scheduler.getFreeCpus(workstation) \
+                    if workstation else 0
+
+            if freeCpus[name] < victim["cpus"]:
+                continue
+
+            job = server.getJob(jobId)
+            with self.lock:
+                self.victims.pop(jobId, None)
+
+            if not job or job.stateId >= JobState.lookup("DONE"):
+                continue
+
+            freeCpus[name] -= victim["cpus"]
+            scheduler.reserveCpus(job)
+            server.continueJob(job)
+            server.addToJobLog(jobId, "Resumed after preemption.")
+            resumed += 1
+
+        if resumed:
+            self.logger.info("{} preempted job(s) resumed.".format(resumed))
+
+        return resumed
+
+    def jobEnded(self, jobId):
+        with self.lock:
+            self.victims.pop(jobId, None)
+
+    def workstationRemoved(self, workstationName):
+        with self.lock:
+            for jobId, victim in self.victims.items():
+                if victim["workstation"] == workstationName:
+                    del self.victims[jobId]
+
+    def getVictims(self):
+        '''
+        @summary: Returns the paused victims
+        @result: a dictionary jobId -> {"workstation", "cpus", "priority",
+        "preemptor", "time"}
+        '''
+        with self.lock:
+            return dict((jobId, dict(victim))
+                for jobId, victim in self.victims.iteritems())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Cache of the program availability per workstation. Missing entries
+are probed asynchronously, the answer is delivered by a Deferred.
+'''
+
+from PySched.Common.DataStructures import Program
+
+from twisted.internet import reactor, defer
+from twisted.python.threadable import isInIOThread
+
+import logging
+import threading
+import time
+
+# Seconds an answer is valid if the program is available / not available
+POSITIVE_TTL = 3600
+NEGATIVE_TTL = 600
+
+# A workstation information received earlier than PROBE_MIN_TIME seconds
+# after the probe may have been sent before the workstation got the probe.
+# Probes without an answer are considered negative after PROBE_TIMEOUT.
+PROBE_MIN_TIME = 2
+PROBE_TIMEOUT = 30
+
+
+class ProgramCache(object):
+    '''
+    @summary: Caches which programs are available on which workstation.
+    A workstation answers a probe (checkForPrograms) with its workstation
+    informations, which contain the list of the found programs.
+    '''
+    def __init__(self, pySchedServer):
+        '''
+        @summary: Initializes the cache
+        @param pySchedServer: Reference to the PySchedServer
+        @result:
+        '''
+        self.pySchedServer = pySchedServer
+        self.logger = logging.getLogger("PySchedServer")
+        self.lock = threading.Lock()
+
+        # (workstationName, program) -> (available, timestamp)
+        self.entries = {}
+
+        # (workstationName, program) -> (timestamp, [deferreds])
+        self.probes = {}
+
+    def lookup(self, workstationName, program):
+        '''
+        @summary: Returns the cached availability of a program
+        @param workstationName: the name of the workstation
+        @param program: the name of the program
+        @result: True or False, None if unknown or expired
+        '''
+        with self.lock:
+            entry = self.entries.get((workstationName, program), None)
+
+        if entry is None:
+            return None
+
+        available, timestamp = entry
+        ttl = POSITIVE_TTL if available else NEGATIVE_TTL
+        if time.time() - timestamp > ttl:
+            return None
+
+        return available
+
+    def probe(self, workstationName, program):
+        '''
+        @summary: Asks the workstation for a program. A running probe for the
+        same program is reused.
+        @param workstationName: the name of the workstation
+        @param program: the name of the program
+        @result: a Deferred which is called with True or False within the
+        reactor thread.
+        '''
+        d = defer.Deferred()
+        key = (workstationName, program)
+
+        with self.lock:
+            running = key in self.probes
+            if not running:
+                self.probes[key] = (time.time(), [])
+            self.probes[key][1].append(d)
+
+        if not running:
+            self.logger.info("Requesting program '{}' from {}".format(
+                program, workstationName))
+
+            p = Program()
+            p.programName = program
+            p.programExec = program
+            self.pySchedServer.checkForPrograms(workstationName, [p])
+
+            if reactor.running:
+                reactor.callFromThread(reactor.callLater, PROBE_TIMEOUT,
+                    self._probeTimeout, key)
+
+        return d
+
+    def programsReceived(self, workstationName, programs):
+        '''
+        @summary: Is called when the workstation informations containing the
+        list of programs are received. Answers the probes of the workstation.
+        @param workstationName: the name of the workstation
+        @param programs: the list of available programs
+        @result:
+        '''
+        now = time.time()
+        answered = []
+
+        with self.lock:
+            for program in programs:
+                self.entries[(workstationName, program)] = (True, now)
+
+            for key, (timestamp, deferreds) in self.probes.items():
+                if key[0] != workstationName:
+                    continue
+
+                available = key[1] in programs
+                if available or now - timestamp >= PROBE_MIN_TIME:
+                    self.entries[key] = (available, now)
+                    del self.probes[key]
+                    answered.append((deferreds, available))
+
+        self._fire(answered)
+
+    def workstationRemoved(self, workstationName):
+        '''
+        @summary: Drops all entries of a workstation. Running probes are
+        answered negative.
+        @result:
+        '''
+        answered = []
+        with self.lock:
+            for key in self.entries.keys():
+                if key[0] == workstationName:
+                    del self.entries[key]
+
+            for key, (timestamp, deferreds) in self.probes.items():
+                if key[0] == workstationName:
+                    del self.probes[key]
+                    answered.append((deferreds, False))
+
+        self._fire(answered)
+
+    def _probeTimeout(self, key):
+        with self.lock:
+            probe = self.probes.get(key, None)
+            if probe is None or time.time() - probe[0] < PROBE_TIMEOUT:
+                return
+
+            del self.probes[key]
+            self.entries[key] = (False, time.time())
+
+        self.logger.info("No answer for program '{}' from {}.".format(
+            key[1], key[0]))
+        self._fire([(probe[1], False)])
+
+    def _fire(self, answered):
+        if not answered:
+            return
+
+        # Without a running reactor (e.g. the Simulator) the deferreds are
+        # fired directly
+        if reactor.running and not isInIOThread():
+            reactor.callFromThread(self._fire, answered)
+            return
+
+        for deferreds, available in answered:
+            for d in deferreds:
+                d.callback(available)
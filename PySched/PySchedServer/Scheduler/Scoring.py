@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Vectorised workstation scoring. The state of all workstations is
+kept in columns (per core load, free memory, leases, active users, program
+bitsets), feasibility and scores of all workstations are calculated in one
+pass. Uses NumPy if available, else a pure Python implementation.
+'''
+
+from Placement import getFreeMemory
+
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Initial count of rows / cores of the NumPy columns. Both grow on demand.
+INITIAL_ROWS = 64
+INITIAL_CORES = 8
+
+# Bits per program bitset word
+WORD_BITS = 64
+
+
+class ScoringEngine(object):
+    '''
+    @summary: Selects the workstation with the best score for a job. The
+    feasibility checks and the score are the same as in
+    PyScheduler.selectWorkstation and PyScheduler.scoreWorkstation, but only
+    programs reported by the workstation are considered. Jobs requiring
+    other programs have no candidate, the scheduler checks them one by one.
+    '''
+    def __init__(self, scheduler, useNumpy=True):
+        '''
+        @summary: Initializes the engine
+        @param scheduler: Reference to the PyScheduler (scheduling parameters)
+        @param useNumpy: if False, the pure Python implementation is used
+        @result:
+        '''
+        self.scheduler = scheduler
+        self.lock = threading.RLock()
+        self.numpy = useNumpy and numpy is not None
+
+        # workstationName -> row, row -> workstationName
+        self.rows = {}
+        self.names = []
+        self.unusedRows = []
+
+        # Codes of the (lowercase) operating systems and bits of the programs
+        self.osCodes = {}
+        self.programBits = {}
+
+        if self.numpy:
+            self._allocate(INITIAL_ROWS, INITIAL_CORES, 1)
+        else:
+            # row -> [loads, memory, reserved, schedulerReserved, activeUsers,
+            # maintenance, os, programs, programCount, schedulerMemory]
+            self.columns = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Update Functions
+    # ========================
+    def update(self, workstation):
+        '''
+        @summary: Adds or updates the state of a workstation
+        @param workstation: the workstation informations
+        @result:
+        '''
+        name = workstation.get("workstationName", None)
+        loads = [float(load) for load in self.scheduler.getCpuLoads(workstation)]
+        memory = getFreeMemory(workstation)
+        reserved = workstation.get("reservedCpus", workstation.get("reserved", 0))
+        activeUsers = workstation.get("activeUsers", 0) > 0
+        maintenance = bool(workstation.get("maintenance", False))
+        programs = workstation.get("programs", None) or []
+
+        with self.lock:
+            os = self.osCodes.setdefault(
+                (workstation.get("os", None) or "").lower(), len(self.osCodes))
+            bits = self._programBitset(programs)
+            row = self._getRow(name)
+
+            if not self.numpy:
+                schedulerReserved, schedulerMemory = \
+                    (self.columns[row][3], self.columns[row][9]) \
+                    if self.columns[row] else (0, 0)
+                self.columns[row] = [loads, memory, reserved,
+                    schedulerReserved, activeUsers, maintenance, os, bits,
+                    len(programs), schedulerMemory]
+                return
+
+            if len(loads) > self.load.shape[1]:
+                self._allocate(self.load.shape[0], len(loads),
+                    self.programs.shape[1])
+            words = self._words(bits)
+            if len(words) > self.programs.shape[1]:
+                self._allocate(self.load.shape[0], self.load.shape[1],
+                    len(words))
+
+            self.load[row] = numpy.inf
+            self.load[row, :len(loads)] = loads
+            self.memory[row] = memory
+            self.reserved[row] = reserved
+            self.activeUsers[row] = activeUsers
+            self.maintenance[row] = maintenance
+            self.os[row] = os
+            self.programs[row] = 0
+            self.programs[row, :len(words)] = words
+            self.programCount[row] = len(programs)
+
+    def updateReservation(self, workstationName, cpus, memory=0):
+        '''
+        @summary: Sets the cpus and memory (MB) leased by the scheduler on a
+        workstation
+        @result:
+        '''
+        with self.lock:
+            row = self.rows.get(workstationName, None)
+            if row is None:
+                return
+
+            if self.numpy:
+                self.schedulerReserved[row] = cpus
+                self.schedulerMemory[row] = memory
+            else:
+                self.columns[row][3] = cpus
+                self.columns[row][9] = memory
+
+    def remove(self, workstationName):
+        with self.lock:
+            row = self.rows.pop(workstationName, None)
+            if row is None:
+                return
+
+            self.names[row] = None
+            self.unusedRows.append(row)
+            if self.numpy:
+                self.os[row] = -1
+            else:
+                self.columns[row] = None
+
+    # Scoring Functions
+    # ========================
+    def select(self, job, workstations=None, bonuses=None):
+        '''
+        @summary: Returns the workstation with the best score for a job
+        @param job: the job
+        @param workstations: list of workstation informations the selection
+        is restricted to. Unknown workstations are added. None selects from
+        all workstations.
+        @param bonuses: a dictionary workstationName -> bonus added to the
+        score (e.g. the locality bonus)
+        @result: a tuple (workstationName, score) or (None, None) if no
+        workstation fits
+        '''
+        with self.lock:
+            rows = None
+            if workstations is not None:
+                rows = [self.rows.get(workstation.get("workstationName", None))
+                    for workstation in workstations]
+                if None in rows:
+                    for workstation in workstations:
+                        if not workstation.get("workstationName", None) \
+                            in self.rows:
+                            self.update(workstation)
+                    rows = [self.rows[workstation.get("workstationName", None)]
+                        for workstation in workstations]
+
+            if self.numpy:
+                return self._selectNumpy(job, rows, bonuses or {})
+            return self._selectPython(job, rows, bonuses or {})
+
+    def _requirements(self, job):
+        '''
+        @summary: Returns the requirements of a job as (os code, program
+        bitset, minCpu, minMemory). os code None matches every os, program
+        bitset None matches no workstation.
+        '''
+        os = None
+        if job.reqOS is not None:
+            os = self.osCodes.get(job.reqOS.lower(), -2)
+
+        bits = 0
+        for program in job.reqPrograms:
+            if not program:
+                continue
+            if not program in self.programBits:
+                bits = None
+                break
+            bits |= 1 << self.programBits[program]
+
+        return os, bits, job.minCpu or 0, job.minMemory or 0
+
+    def _parameters(self, job):
+        params = self.scheduler.schedulingParams
+        return (params.get("cpuThreshold", 20),
+            params.get("cpusForUsers", 0),
+            params.get("unusedProgramPenality", 100) * -1,
+            params.get("activeUserPenality", 100) * -1,
+            params.get("usableCpuBonus", 100) if job.multiCpu
+                else params.get("unusedCpuPenality", 100) * -1)
+
+    def _selectNumpy(self, job, rows, bonuses):
+        os, bits, minCpu, minMemory = self._requirements(job)
+        if bits is None or os == -2:
+            return None, None
+
+        threshold, cpusForUsers, programWeight, userWeight, cpuWeight = \
+            self._parameters(job)
+
+        if rows is None:
+            rows = slice(0, len(self.names))
+        elif not rows:
+            return None, None
+        else:
+            rows = numpy.array(rows)
+
+        freeCpus = (self.load[rows] < threshold).sum(axis=1) - \
+            numpy.maximum(self.reserved[rows], self.schedulerReserved[rows]) - \
+            self.activeUsers[rows] * cpusForUsers
+
+        mask = (self.os[rows] >= 0) & ~self.maintenance[rows] & \
+            (freeCpus > 0) & (freeCpus >= minCpu) & \
+            (self.memory[rows] - self.schedulerMemory[rows] >= minMemory)
+        if os is not None:
+            mask &= self.os[rows] == os
+        if bits:
+            words = numpy.zeros(self.programs.shape[1], dtype=numpy.uint64)
+            required = self._words(bits)
+            words[:len(required)] = required
+            mask &= ((self.programs[rows] & words) == words).all(axis=1)
+
+        if not mask.any():
+            return None, None
+
+        scores = programWeight * (self.programCount[rows] -
+            len(job.reqPrograms)) + userWeight * self.activeUsers[rows] + \
+            cpuWeight * freeCpus
+        if bonuses:
+            scores = scores + self._bonusColumn(bonuses, rows)
+        scores = numpy.where(mask, scores, -numpy.inf)
+
+        best = int(scores.argmax())
+        if isinstance(rows, slice):
+            row = best
+        else:
+            row = int(rows[best])
+        return self.names[row], float(scores[best])
+
+    def _selectPython(self, job, rows, bonuses):
+        os, bits, minCpu, minMemory = self._requirements(job)
+        if bits is None or os == -2:
+            return None, None
+
+        threshold, cpusForUsers, programWeight, userWeight, cpuWeight = \
+            self._parameters(job)
+        reqProgramCount = len(job.reqPrograms)
+
+        selected = None
+        best = None
+        for row in (range(len(self.names)) if rows is None else rows):
+            column = self.columns[row]
+            if column is None:
+                continue
+
+            loads, memory, reserved, schedulerReserved, activeUsers, \
+                maintenance, wsOs, programs, programCount, schedulerMemory = \
+                column
+            if maintenance or (os is not None and wsOs != os) or \
+                memory - schedulerMemory < minMemory or \
+                programs & bits != bits:
+                continue
+
+            freeCpus = len([load for load in loads if load < threshold]) - \
+                max(reserved, schedulerReserved) - \
+                (cpusForUsers if activeUsers else 0)
+            if freeCpus <= 0 or freeCpus < minCpu:
+                continue
+
+            score = programWeight * (programCount - reqProgramCount) + \
+                (userWeight if activeUsers else 0) + cpuWeight * freeCpus + \
+                bonuses.get(self.names[row], 0)
+            if best is None or score > best:
+                selected, best = row, score
+
+        if selected is None:
+            return None, None
+        return self.names[selected], best
+
+    # Internal Functions
+    # ========================
+    def _getRow(self, name):
+        row = self.rows.get(name, None)
+        if row is not None:
+            return row
+
+        if self.unusedRows:
+            row = self.unusedRows.pop()
+            self.names[row] = name
+        else:
+            row = len(self.names)
+            self.names.append(name)
+            if self.numpy and row >= self.load.shape[0]:
+                self._allocate(row * 2, self.load.shape[1],
+                    self.programs.shape[1])
+            elif not self.numpy:
+                self.columns.append(None)
+
+        if self.numpy:
+            self.schedulerReserved[row] = 0
+            self.schedulerMemory[row] = 0
+        self.rows[name] = row
+        return row
+
+    def _bonusColumn(self, bonuses, rows):
+        '''
+        @summary: Returns the bonuses of the selected rows as column
+        '''
+        column = numpy.zeros(len(self.names))
+        for name, bonus in bonuses.iteritems():
+            row = self.rows.get(name, None)
+            if row is not None:
+                column[row] = bonus
+        return column[rows]
+
+    def _programBitset(self, programs):
+        bits = 0
+        for program in programs:
+            bit = self.programBits.setdefault(program, len(self.programBits))
+            bits |= 1 << bit
+        return bits
+
+    def _words(self, bits):
+        words = []
+        while bits:
+            words.append(bits & (2 ** WORD_BITS - 1))
+            bits >>= WORD_BITS
+        return numpy.array(words, dtype=numpy.uint64)
+
+    def _allocate(self, rows, cores, words):
+        '''
+        @summary: Allocates (or grows) the columns, existing values are kept
+        '''
+        columns = [
+            ("load", (rows, cores), numpy.float64, numpy.inf),
+            ("memory", (rows,), numpy.float64, 0),
+            ("reserved", (rows,), numpy.int64, 0),
+            ("schedulerReserved", (rows,), numpy.int64, 0),
+            ("schedulerMemory", (rows,), numpy.float64, 0),
+            ("activeUsers", (rows,), numpy.bool_, False),
+            ("maintenance", (rows,), numpy.bool_, False),
+            ("os", (rows,), numpy.int64, -1),
+            ("programs", (rows, words), numpy.uint64, 0),
+            ("programCount", (rows,), numpy.int64, 0),
+            ]
+
+        for name, shape, dtype, fill in columns:
+            column = numpy.full(shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                column[tuple(slice(0, size) for size in old.shape)] = old
+            setattr(self, name, column)
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Discrete event simulator for the PyScheduler. Drives the scheduler
+with synthetic workstations and jobs, without network, database and reactor,
+and reports makespan, mean wait, utilisation, oversubscription and decisions
+per second.
+'''
+
+from PySched.Common.DataStructures import Job, JobState
+from PySched.Common import datetime2Str
+from PySched.PySchedServer.WorkstationRegistry import WorkstationRegistry
+from PySched.PySchedServer.Scheduler import PyScheduler
+from PySched.PySchedServer.Scheduler.ProgramCache import PROBE_MIN_TIME
+
+import datetime
+import heapq
+import itertools
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Seconds between the dispatch of a job and its start on the workstation
+TRANSFER_TIME = 1
+
+# Modules of the scheduler which read the time
+CLOCK_MODULES = ["PySched.PySchedServer.Scheduler",
+    "PySched.PySchedServer.Scheduler.JobQueue",
+    "PySched.PySchedServer.Scheduler.Placement",
+    "PySched.PySchedServer.Scheduler.ProgramCache",
+    "PySched.PySchedServer.Scheduler.LoadHistory",
+    "PySched.PySchedServer.Scheduler.Leases"]
+
+# Load of a cpu within an idle dip of a busy cpu
+DIP_LOAD = 5.0
+
+
+class SimulationClock(object):
+    '''
+    @summary: Replaces the time module within the scheduler modules. time()
+    returns the simulated time.
+    '''
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def mktime(self, t):
+        return time.mktime(t)
+
+
+class SimulatedScheduler(PyScheduler):
+    '''
+    @summary: PyScheduler without scheduler thread. Requested scheduling
+    passes are run by the simulator.
+    '''
+    def __init__(self, workingDir, server, schedulingParams=None):
+        super(SimulatedScheduler, self).__init__(workingDir, server)
+        self.schedulerPool.stop()
+        self.schedulingParams.update(schedulingParams or {})
+        self.passRequested = False
+
+    def requestSchedulingPass(self):
+        if self.jobQueue:
+            self.passRequested = True
+
+
+class SimulatedServer(object):
+    '''
+    @summary: In memory replacement of the PySchedServer. Provides the
+    functions used by the scheduler.
+    '''
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.jobs = {}
+        self.workstations = None
+
+    def getJob(self, jobId):
+        return self.jobs.get(jobId, None)
+
+    def getFromDatabase(self, objClass, first=False, **filterArgs):
+        result = []
+        for job in self.jobs.itervalues():
+            if all(getattr(job, key) in value if isinstance(value, list)
+                else getattr(job, key) == value
+                for key, value in filterArgs.iteritems()):
+                if first:
+                    return job
+                result.append(job)
+
+        return None if first else result
+
+    def updateDatabaseEntry(self, obj):
+        self.jobs[obj.jobId] = obj
+
+    def addToJobLog(self, jobId, message):
+        pass
+
+    def reserveCPU(self, job):
+        pass
+
+    def checkForPrograms(self, workstation, programs=[]):
+        self.simulator.schedule(PROBE_MIN_TIME, "programs", workstation)
+
+    def transferJob(self, job):
+        self.simulator.schedule(TRANSFER_TIME, "start", job.jobId)
+        return True
+
+
+class Simulator(object):
+    '''
+    @summary: Discrete event simulation of a cluster. Events are the
+    submission, start and end of jobs, the answers of program probes and
+    the workstation informations. After all events of a point in time, a
+    requested scheduling pass is run.
+    '''
+    def __init__(self, workstations, jobs, schedulingParams=None,
+        reportInterval=None, loadNoise=0.0, seed=None):
+        '''
+        @summary: Initializes the simulation
+        @param workstations: list of workstation dictionaries (see
+        WorkstationReference). cpuLoad is set by the simulator.
+        @param jobs: list of tuples (submitTime, job, runtime). submitTime
+        is relative to the start of the simulation in seconds.
+        @param schedulingParams: scheduling parameters which override the
+        defaults of the scheduler
+        @param reportInterval: seconds between two workstation informations.
+        None reports the exact loads with every change, load smoothing is
+        disabled then unless it is set in schedulingParams.
+        @param loadNoise: probability that a reported cpu load is a short
+        spike (idle cpu) or dip (busy cpu). Requires a reportInterval.
+        @param seed: seed of the load noise
+        @result:
+        '''
+        self.clock = SimulationClock(time.time())
+        self.start = self.clock.now
+        self.events = []
+        self.sequence = itertools.count()
+        self.reportInterval = reportInterval
+        self.loadNoise = loadNoise
+        self.random = random.Random(seed)
+
+        params = {} if reportInterval else {"loadSmoothing": 0}
+        params.update(schedulingParams or {})
+
+        self.workingDir = tempfile.mkdtemp()
+        self.server = SimulatedServer(self)
+        self.scheduler = SimulatedScheduler(self.workingDir, self.server,
+            params)
+        self.server.workstations = WorkstationRegistry(
+            self.scheduler.getFreeCpus)
+
+        # Count of cpus used by the running jobs of each workstation, may
+        # exceed the cpu count of an oversubscribed workstation
+        self.busyCpus = {}
+
+        self.networkIds = {}
+        for networkId, workstation in enumerate(workstations):
+            workstation = dict(workstation)
+            workstation["cpuLoad"] = [0.0] * workstation.get("cpuCount", 1)
+            self.networkIds[workstation["workstationName"]] = networkId
+            self.busyCpus[workstation["workstationName"]] = 0
+            self.server.workstations.add(networkId, workstation)
+            if reportInterval:
+                self.schedule(self.random.uniform(0, reportInterval),
+                    "report", workstation["workstationName"])
+
+        self.runtimes = {}
+        self.submitted = {}
+        self.startTimes = {}
+        for submitTime, job, runtime in jobs:
+            self.runtimes[job.jobId] = runtime
+            self.schedule(submitTime, "submit", job)
+
+    def schedule(self, delay, event, data):
+        '''
+        @summary: Adds an event
+        @param delay: seconds from the current simulated time
+        @param event: submit, start, end or programs
+        @param data: the event data
+        @result:
+        '''
+        heapq.heappush(self.events,
+            (self.clock.now + delay, next(self.sequence), event, data))
+
+    def run(self):
+        '''
+        @summary: Runs the simulation until no event is left
+        @result: a dictionary with the results (see getResults)
+        '''
+        modules = [sys.modules[name] for name in CLOCK_MODULES]
+        originals = [module.time for module in modules]
+        for module in modules:
+            module.time = self.clock
+
+        self.passes = 0
+        self.decisions = 0
+        self.schedulingTime = 0.0
+        self.busyCpuSeconds = 0.0
+        self.oversubscribed = 0
+
+        try:
+            while self.events:
+                self.clock.now = self.events[0][0]
+                while self.events and self.events[0][0] <= self.clock.now:
+                    when, sequence, event, data = heapq.heappop(self.events)
+                    getattr(self, "_" + event)(data)
+
+                while self.scheduler.passRequested:
+                    self.scheduler.passRequested = False
+                    start = time.time()
+                    self.decisions += self.scheduler.schedulingPass()
+                    self.schedulingTime += time.time() - start
+                    self.passes += 1
+        finally:
+            for module, original in zip(modules, originals):
+                module.time = original
+            shutil.rmtree(self.workingDir, ignore_errors=True)
+
+        return self.getResults()
+
+    def getResults(self):
+        '''
+        @summary: Returns the results of the simulation
+        @result: a dictionary with the keys jobs, finished, makespan
+        (seconds), meanWait (seconds), utilisation (0..1), oversubscribed
+        (jobs started on a workstation without enough free cpus), passes,
+        decisions and decisionsPerSecond (real time)
+        '''
+        ends = [job.finishedTime for job in self.server.jobs.itervalues()
+            if hasattr(job, "finishedTime")]
+        waits = [self.startTimes[jobId] - self.submitted[jobId]
+            for jobId in self.startTimes]
+
+        makespan = (max(ends) - self.start) if ends else 0.0
+        cpus = sum(len(workstation["cpuLoad"])
+            for workstation in self.server.workstations.getAll())
+
+        return {
+            "jobs": len(self.runtimes),
+            "finished": len(ends),
+            "makespan": makespan,
+            "meanWait": sum(waits) / len(waits) if waits else 0.0,
+            "utilisation": self.busyCpuSeconds / (cpus * makespan)
+                if makespan and cpus else 0.0,
+            "oversubscribed": self.oversubscribed,
+            "passes": self.passes,
+            "decisions": self.decisions,
+            "decisionsPerSecond": self.decisions / self.schedulingTime
+                if self.schedulingTime else 0.0,
+            }
+
+    # Events
+    # ========================
+    def _submit(self, job):
+        job.added = self._timestamp()
+        job.stateId = JobState.lookup("QUEUED")
+        self.submitted[job.jobId] = self.clock.now
+        self.server.jobs[job.jobId] = job
+        self.scheduler.scheduleJob(job)
+
+    def _start(self, jobId):
+        job = self.server.getJob(jobId)
+        job.stateId = JobState.lookup("RUNNING")
+        job.started = self._timestamp()
+        self.startTimes[jobId] = self.clock.now
+
+        cpus = max(job.minCpu or 1, 1)
+        workstation = self.server.workstations.getByName(job.workstation)
+        freeCpus = max(len(workstation["cpuLoad"]) -
+            self.busyCpus[job.workstation], 0)
+        if cpus > freeCpus:
+            self.oversubscribed += 1
+
+        self.scheduler.jobStateChanged(job)
+        self._occupy(job.workstation, cpus)
+        self.busyCpuSeconds += min(cpus, freeCpus) * self.runtimes[jobId]
+        self.schedule(self.runtimes[jobId], "end", jobId)
+
+    def _end(self, jobId):
+        job = self.server.getJob(jobId)
+        job.stateId = JobState.lookup("DONE")
+        job.finished = self._timestamp()
+        job.finishedTime = self.clock.now
+
+        self._occupy(job.workstation, -max(job.minCpu or 1, 1))
+        self.scheduler.jobStateChanged(job)
+
+    def _programs(self, workstationName):
+        if self.reportInterval:
+            # The workstation sends its informations with the programs
+            self._sendInformations(workstationName)
+            return
+
+        workstation = self.server.workstations.getByName(workstationName)
+        if workstation:
+            self.scheduler.workstationUpdated(workstation)
+
+    def _report(self, workstationName):
+        self._sendInformations(workstationName)
+        if len(self.startTimes) < len(self.runtimes) or \
+            any(self.busyCpus.itervalues()):
+            self.schedule(self.reportInterval, "report", workstationName)
+
+    # Internal Functions
+    # ========================
+    def _sendInformations(self, workstationName):
+        '''
+        @summary: Sends the workstation informations with the current loads.
+        Each cpu load is a spike or dip with the probability loadNoise.
+        '''
+        networkId = self.networkIds[workstationName]
+        cpuCount = len(self.server.workstations.get(networkId)["cpuLoad"])
+        busy = min(self.busyCpus[workstationName], cpuCount)
+
+        cpuLoad = []
+        for i in range(cpuCount):
+            noise = self.random.random() < self.loadNoise
+            if i < busy:
+                cpuLoad.append(DIP_LOAD if noise else 100.0)
+            else:
+                cpuLoad.append(100.0 if noise else 0.0)
+
+        self.scheduler.workstationUpdated(self.server.workstations.update(
+            networkId, {"cpuLoad": cpuLoad}))
+
+    def _occupy(self, workstationName, cpus):
+        '''
+        @summary: Changes the count of used cpus of a workstation. Without a
+        reportInterval, the scheduler is informed like by a received
+        workstation information.
+        @param cpus: the count of started (positive) or ended (negative) cpus
+        @result:
+        '''
+        self.busyCpus[workstationName] += cpus
+        if self.reportInterval:
+            return
+
+        networkId = self.networkIds[workstationName]
+        cpuCount = len(self.server.workstations.get(networkId)["cpuLoad"])
+        busy = min(self.busyCpus[workstationName], cpuCount)
+
+        self.scheduler.workstationUpdated(self.server.workstations.update(
+            networkId, {"cpuLoad": [100.0] * busy + [0.0] * (cpuCount - busy)}))
+
+    def _timestamp(self):
+        return datetime2Str(datetime.datetime.fromtimestamp(self.clock.now))
+
+
+# Workload Generators
+# ========================
+def generateWorkstations(count, cpuCounts=(4, 8, 16), memory=(8, 16, 32),
+    programs=("matlab", "mathematica"), programShare=0.5, seed=None):
+    '''
+    @summary: Creates synthetic workstation informations
+    @param count: the count of workstations
+    @param cpuCounts: cpu counts to choose from
+    @param memory: memory sizes (GB) to choose from
+    @param programs: programs which may be installed
+    @param programShare: probability that a program is installed
+    @param seed: seed of the random generator
+    @result: a list of workstation dictionaries
+    '''
+    rand = random.Random(seed)
+    return [{
+        "workstationName": "ws{:04d}".format(i),
+        "os": "Linux",
+        "cpuCount": rand.choice(cpuCounts),
+        "memory": rand.choice(memory),
+        "programs": [program for program in programs
+            if rand.random() < programShare],
+        "activeUsers": 0,
+        "reservedCpus": 0,
+        "maintenance": False,
+        } for i in range(count)]
+
+def generateJobs(count, interarrival=10.0, meanRuntime=1800.0, bigShare=0.2,
+    bigCpus=(4, 8), users=5, programs=("matlab", "mathematica"),
+    programShare=0.1, walltimeFactor=(1.0, 2.0), seed=None):
+    '''
+    @summary: Creates a synthetic job stream with exponential interarrival
+    and runtimes.
+    @param count: the count of jobs
+    @param interarrival: mean seconds between two submissions
+    @param meanRuntime: mean runtime in seconds
+    @param bigShare: probability of a multi cpu job
+    @param bigCpus: cpu counts of multi cpu jobs to choose from
+    @param users: count of users
+    @param programs: programs which may be required
+    @param programShare: probability that a job requires a program
+    @param walltimeFactor: range of the factor between the walltime
+    estimation and the runtime. None creates jobs without walltime.
+    @param seed: seed of the random generator
+    @result: a list of tuples (submitTime, job, runtime)
+    '''
+    rand = random.Random(seed)
+    jobs = []
+    submitTime = 0.0
+
+    for jobId in range(1, count + 1):
+        submitTime += rand.expovariate(1.0 / interarrival)
+        runtime = rand.expovariate(1.0 / meanRuntime)
+        big = rand.random() < bigShare
+
+        job = Job()
+        job.jobId = jobId
+        job.jobName = "job{}".format(jobId)
+        job.userId = rand.randint(1, users)
+        job.reqOS = "Linux"
+        job.multiCpu = big
+        job.minCpu = rand.choice(bigCpus) if big else 1
+        job.minMemory = 0
+        job.reqPrograms = [rand.choice(programs)] \
+            if programs and rand.random() < programShare else []
+        job.walltime = int(runtime * rand.uniform(*walltimeFactor)) + 1 \
+            if walltimeFactor else None
+
+        jobs.append((submitTime, job, runtime))
+
+    return jobs
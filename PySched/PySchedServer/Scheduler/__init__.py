@@ -6,18 +6,39 @@ Created on 2012-12-05 11:59
 '''
 
 from PySched.Common.Interfaces.SchedulerInterface import SchedulerInterface
-from PySched.Common.DataStructures import JobState, Program
+from PySched.Common.DataStructures import Job, JobState
 from PySched.Common.IO import FileUtils
 from Compiler import Compiler as CompilerClass
+from Compiler.CompileCache import COMPILE_CACHE_SIZE
+from Compiler.CompilePool import COMPILE_TIMEOUT
+from ProgramCache import ProgramCache
+from Placement import BatchPlacement, requiredCpus, getFreeMemory
+from JobQueue import JobQueue
+from Scoring import ScoringEngine
+from Dependencies import DependencyGraph, parseDependencies, hasEnded
+from Preemption import Preemption, PREEMPTION_PRIORITY
+from Locality import Locality, LOCALITY_BONUS
+from LoadHistory import LoadHistory, LOAD_ALPHA, LOAD_RISK_FACTOR, \
+    LOAD_HORIZON
+from Leases import LeaseLedger, LEASE_TIMEOUT
+
+from twisted.internet import reactor, defer
+from twisted.python.threadable import isInIOThread
+from twisted.python.threadpool import ThreadPool
 
-from twisted.internet.task import LoopingCall
-
-from time import sleep
 from collections import deque
 
 import copy
 import logging
 import os
+import threading
+import time
+
+# Default count of queued jobs placed per scheduling round
+BATCH_WINDOW = 200
+
+# Count of scheduling rounds kept for the statistics
+ROUND_STATISTICS = 100
 
 
 class PyScheduler(SchedulerInterface):
@@ -32,13 +53,55 @@ class PyScheduler(SchedulerInterface):
         @result:
         '''
         super(PyScheduler, self).__init__(workingDir, pySchedServer)
-        self.compiler = CompilerClass(self)
+        self.programCache = ProgramCache(pySchedServer)
         self.logger = logging.getLogger("PySchedServer")  
 
         self.schedulingParams = self._loadSchedulingParameter()      
+        self.compiler = CompilerClass(self)
+
+        self.jobQueue = JobQueue(
+            agingInterval=self.schedulingParams.get("agingInterval", 600),
+            fairShareWeight=self.schedulingParams.get("fairShareWeight", 3600),
+            usageHalfLife=self.schedulingParams.get("usageHalfLife", 21600))
+        self.queueLock = threading.RLock()
+        self.passPending = False
+
+        # Jobs which wait for the answer of program probes
+        self.parkedJobs = set()
+
+        # Batch placement: jobId -> workstationName of the current round
+        self.placement = BatchPlacement(self)
+        self.placements = {}
+        self.roundStatistics = deque(maxlen=ROUND_STATISTICS)
+
+        # Vectorised scoring of all workstations for selectWorkstation
+        self.scoring = ScoringEngine(self)
+
+        # Jobs waiting for the end of other jobs. The lock serializes the
+        # release of a job and the arrival of its upload.
+        self.dependencies = DependencyGraph()
+        self.releaseLock = threading.Lock()
+
+        # Jobs paused for high priority jobs
+        self.preemption = Preemption(self)
 
-        self.jobQueue = deque()
-        self.schedulingLoop = LoopingCall(self.scheduleNext)
+        # Input caches of the workstations and input files of the jobs
+        self.locality = Locality(self)
+
+        # Smoothed cpu loads of the workstations
+        self.loadHistory = LoadHistory(self)
+
+        # Optimistic accounting: cpus and memory of jobs which are
+        # dispatched to a workstation, but not yet counted by its loads.
+        self.leases = LeaseLedger()
+        self.lastFreeCpus = {}
+        self.reservationLock = threading.Lock()
+
+        # All scheduling passes are run in order on the scheduler thread
+        self.schedulerPool = ThreadPool(1, 1, "PySchedServer-Scheduler")
+        self.schedulerPool.start()
+        reactor.addSystemEventTrigger("after", "shutdown",
+            self.schedulerPool.stop)
 
     def _loadSchedulingParameter(self):
         paramPath = os.path.join(self.workingDir, "SchedulingParams")
@@ -58,6 +121,26 @@ class PyScheduler(SchedulerInterface):
             params["unusedProgramPenality"] = 100
             params["cpusForUsers"] = 1
             params["activeUserPenality"] = 100            
+            params["batchPlacement"] = 1
+            params["batchWindow"] = BATCH_WINDOW
+            params["agingInterval"] = 600
+            params["fairShareWeight"] = 3600
+            params["usageHalfLife"] = 21600
+            params["backfill"] = 0
+            params["defaultWalltime"] = 86400
+            params["vectorScoring"] = 1
+            params["preemption"] = 0
+            params["preemptionPriority"] = PREEMPTION_PRIORITY
+            params["localityBonus"] = LOCALITY_BONUS
+            params["loadSmoothing"] = 1
+            params["loadAlpha"] = LOAD_ALPHA
+            params["loadRiskFactor"] = LOAD_RISK_FACTOR
+            params["loadHorizon"] = LOAD_HORIZON
+            params["leaseTimeout"] = LEASE_TIMEOUT
+            params["compileCache"] = 1
+            params["compileCacheSize"] = COMPILE_CACHE_SIZE
+            params["compileSlots"] = 0
+            params["compileTimeout"] = COMPILE_TIMEOUT
 
         return params
 
@@ -69,56 +152,606 @@ class PyScheduler(SchedulerInterface):
 
         FileUtils.createFile(paramPath, filedata=data, forceCreate=True)
 
-    def scheduleNext(self):
-        '''
-        @summary: Schedules the next job of the queue.
-        @result: 
-        '''
-        self.logger.debug("Scheduling next Job...")
-        try:
-            jobId = self.jobQueue.popleft()
-            job = self.pySchedServer.getJob(jobId)
-            if job.stateId <= JobState.lookup("WAITING_FOR_WORKSTATION"):
-                super(PyScheduler, self).scheduleJob(
-                    self.pySchedServer.getWorkstations(),
-                    job)
-            elif job.stateId == JobState.lookup("COMPILED"):
-                self.transfer(job)
-        except IndexError:
-            self.logger.debug("All jobs scheduled. Stopping scheduling Loop.")
-            try: 
-                self.schedulingLoop.stop()
-            except:
-                pass
-
+    # Scheduling Loop
+    # ========================
     def scheduleJob(self, job, workstations=None):
         '''
-        @summary:   Overrides the standard scheduleJob implementenation
-                    to add scheduling queue. The Problem is: If too many
-                    Jobs are added at once, the scheduling algorithm is
-                    faster than the workstation information loop. Thus
-                    the known state of the workstation by the scheduler
-                    doesn't represent the actual state. Therefore some kind
-                    of Queue is needed to add a wait time between the job
-                    scheduling.
-        @param workstations: List of available Workstations
+        @summary:   Overrides the standard scheduleJob implementenation.
+                    The job is added to the queue and a scheduling pass is
+                    requested. Jobs which can't be placed stay within the
+                    queue until the next pass. The queue is ordered by
+                    priority, waiting time and the usage of the job owner,
+                    compiled jobs are always first.
+        @param workstations: unused, the workstations are read by the pass
         @param job: The job to schedule
         @result: 
         '''
-        if not job.jobId in self.jobQueue:
+        with self.queueLock:
+            if not self.jobQueue.push(job,
+                front=job.stateId == JobState.lookup("COMPILED")):
+                return False
+
             self.logger.debug("Added Job to queue.")
-            if job.stateId == JobState.lookup("COMPILED"):
-                self.jobQueue.appendleft(job.jobId)
+
+        self.requestSchedulingPass()
+        return True
+
+    def requestSchedulingPass(self):
+        '''
+        @summary: Requests a scheduling pass. Several requests are merged into
+        one pass, if the pass didn't start yet.
+        @result:
+        '''
+        with self.queueLock:
+            if self.passPending or not (self.jobQueue or self.preemption):
+                return
+            self.passPending = True
+
+        self.schedulerPool.callInThread(self.schedulingPass)
+
+    def schedulingPass(self):
+        '''
+        @summary: Tries to place the queued jobs. Is run on the scheduler
+        thread. If batchPlacement is enabled, a window of jobs is placed at
+        once, otherwise the jobs are placed one by one. If preemption is
+        enabled, paused victims are resumed first and high priority jobs
+        which weren't placed may preempt other jobs afterwards.
+        @result: the count of placed jobs
+        '''
+        with self.queueLock:
+            self.passPending = False
+            queued = len(self.jobQueue)
+
+        start = time.time()
+        for workstationName in self.leases.expire():
+            self._updateReservation(workstationName)
+
+        preemption = self.schedulingParams.get("preemption", 0)
+        resumed = self.preemption.resumeVictims() if preemption else 0
+
+        if self.schedulingParams.get("batchPlacement", 1):
+            windowSize = int(self.schedulingParams.get("batchWindow", BATCH_WINDOW))
+            jobIds = self.jobQueue.getWindow(windowSize + len(self.parkedJobs))
+            window, placed = self._batchPass(jobIds, windowSize)
+            backfilled = self.placement.backfilled if window else 0
+            reservation = self.placement.reservation if window else None
+        else:
+            jobIds = self.jobQueue.getWindow()
+            window, placed = len(jobIds), self._singlePass(jobIds)
+            backfilled, reservation = 0, None
+
+        preempted = self._preemptionPass() if preemption else 0
+        placed += preempted
+
+        duration = time.time() - start
+        self.roundStatistics.append({
+            "time": start,
+            "queued": queued,
+            "window": window,
+            "placed": placed,
+            "duration": duration,
+            "backfilled": backfilled,
+            "reservation": reservation,
+            "preempted": preempted,
+            "resumed": resumed,
+            })
+
+        if placed:
+            self.logger.info("Scheduling round: {} of {} jobs placed in {:.1f} ms."
+                .format(placed, window, duration * 1000))
+
+        return placed
+
+    def _singlePass(self, jobIds):
+        placed = 0
+        for jobId in jobIds:
+            try:
+                job = self._loadQueuedJob(jobId)
+                if job and self._scheduleQueuedJob(job):
+                    placed += 1
+            except Exception, e:
+                self.logger.error("Scheduling of job {} failed: {}".format(
+                    jobId, e))
+                self._dequeue(jobId)
+
+        return placed
+
+    def _batchPass(self, jobIds, windowSize):
+        '''
+        @summary: Places a window of queued jobs on a snapshot of the free
+        capacity.
+        @param jobIds: the queued job ids in queue order
+        @param windowSize: the maximal count of jobs to place
+        @result: a tuple (count of jobs within the window, count of placed jobs)
+        '''
+        window = []
+        for jobId in jobIds:
+            if len(window) >= windowSize:
+                break
+            try:
+                job = self._loadQueuedJob(jobId)
+                if job:
+                    window.append(job)
+            except Exception, e:
+                self.logger.error("Scheduling of job {} failed: {}".format(
+                    jobId, e))
+                self._dequeue(jobId)
+
+        if not window:
+            return 0, 0
+
+        snapshot = self.placement.takeSnapshot()
+        placements, probes = self.placement.plan(window, snapshot,
+            backfill=bool(self.schedulingParams.get("backfill", 0)))
+
+        placed = 0
+        for job in window:
+            # Without free capacity left, unplaced jobs stay in the queue
+            if not job.jobId in placements and not snapshot:
+                continue
+
+            try:
+                self.placements[job.jobId] = placements.get(job.jobId, None)
+                if self._scheduleQueuedJob(job, placed=True):
+                    placed += 1
+                elif job.jobId in probes:
+                    self.parkJob(job, probes[job.jobId])
+            except Exception, e:
+                self.logger.error("Scheduling of job {} failed: {}".format(
+                    job.jobId, e))
+                self._dequeue(job.jobId)
+            finally:
+                self.placements.pop(job.jobId, None)
+
+        return len(window), placed
+
+    def _preemptionPass(self):
+        '''
+        @summary: Lets the queued high priority jobs which weren't placed
+        preempt jobs with a lower priority (see Preemption).
+        @result: the count of placed jobs
+        '''
+        minPriority = self.schedulingParams.get("preemptionPriority",
+            PREEMPTION_PRIORITY)
+        windowSize = int(self.schedulingParams.get("batchWindow", BATCH_WINDOW))
+
+        placed = 0
+        for jobId in self.jobQueue.getWindow(windowSize):
+            try:
+                job = self._loadQueuedJob(jobId)
+                if not job or (job.priority or 0) < minPriority:
+                    continue
+
+                workstation = self.preemption.preempt(job)
+                if not workstation:
+                    continue
+
+                self.placements[job.jobId] = workstation
+                if self._scheduleQueuedJob(job, placed=True):
+                    placed += 1
+            except Exception, e:
+                self.logger.error("Preemption for job {} failed: {}".format(
+                    jobId, e))
+                self._dequeue(jobId)
+            finally:
+                self.placements.pop(jobId, None)
+
+        return placed
+
+    def _loadQueuedJob(self, jobId):
+        '''
+        @summary: Loads a job of the queue. Compiled jobs are transferred,
+        jobs which aren't waiting any more are removed from the queue.
+        @result: the job if it has to be placed, else None
+        '''
+        job = self.pySchedServer.getJob(jobId)
+        if not job:
+            self._dequeue(jobId)
+            return None
+
+        if job.stateId == JobState.lookup("COMPILED"):
+            self._dequeue(jobId)
+            if self.transferJob(job):
+                job.stateId = JobState.lookup("DISPATCHED")
             else:
-                self.jobQueue.append(job.jobId)
-            if not self.schedulingLoop.running:
-                try: 
-                    self.schedulingLoop.start(15, now=True)
-                except:
-                    pass
+                job.stateId = JobState.lookup("SCHEDULER_ERROR")
+            self.pySchedServer.updateDatabaseEntry(job)
+            return None
+
+        if job.stateId > JobState.lookup("WAITING_FOR_WORKSTATION"):
+            self._dequeue(jobId)
+            return None
+
+        with self.queueLock:
+            if jobId in self.parkedJobs:
+                return None
+
+        return job
+
+    def _scheduleQueuedJob(self, job, placed=False):
+        '''
+        @summary: Schedules one job of the queue.
+        @param placed: True if the workstation was selected by the batch
+        placement.
+        @result: True if the job was placed on a workstation
+        '''
+        if placed:
+            workstation = self.placements.get(job.jobId, None)
+            workstations = [self.pySchedServer.workstations.getByName(
+                workstation)] if workstation else []
+        else:
+            registry = self.pySchedServer.workstations
+            if not registry.hasFreeCpus():
+                return False
+            workstations = self.getCandidates(registry, job)
+
+        # Jobs which aren't waiting yet are prepared by scheduleJob even if
+        # there is no candidate
+        if not workstations and \
+            job.stateId == JobState.lookup("WAITING_FOR_WORKSTATION"):
+            return False
+
+        super(PyScheduler, self).scheduleJob(workstations, job)
+
+        if not job.workstation and \
+            job.stateId == JobState.lookup("WAITING_FOR_WORKSTATION"):
+            return False
+
+        self._dequeue(job.jobId)
+        return bool(job.workstation)
+
+    def getQueue(self):
+        '''
+        @summary: Returns the state of the job queue
+        @result: a dictionary with the keys jobs (list of queue entries in
+        order, see JobQueue.getEntries, extended by position, waiting seconds
+        and parked), usage ({userId: decayed usage}), rounds (statistics
+        of the last scheduling rounds), victims (paused jobs, see
+        Preemption.getVictims), transfers (see Locality.getStatistics),
+        leases (see LeaseLedger.getLeases) and compiler (see
+        Compiler.getStatistics)
+        '''
+        now = time.time()
+        jobs = self.jobQueue.getEntries()
+        with self.queueLock:
+            for position, entry in enumerate(jobs):
+                entry["position"] = position
+                entry["waiting"] = int(now - entry.pop("enqueued"))
+                entry["parked"] = entry["jobId"] in self.parkedJobs
+
+        return {
+            "jobs": jobs,
+            "usage": self.jobQueue.getUsage(),
+            "rounds": self.getRoundStatistics(),
+            "victims": self.preemption.getVictims(),
+            "transfers": self.locality.getStatistics(),
+            "leases": self.leases.getLeases(),
+            "compiler": self.compiler.getStatistics(),
+            }
+
+    def getRoundStatistics(self):
+        '''
+        @summary: Returns the statistics of the last scheduling rounds
+        @result: a list of dictionaries with the keys time, queued, window,
+        placed, duration (seconds), backfilled (jobs placed behind a
+        reservation), reservation (see BatchPlacement.reserve), preempted
+        (jobs placed by preemption) and resumed (resumed victims)
+        '''
+        return list(self.roundStatistics)
+
+    def getCandidates(self, registry, job):
+        '''
+        @summary: Returns the workstations of the registry with the required
+        OS and enough free cpus for the job. Workstations with all required
+        programs are preferred, if there are none, all workstations are
+        returned so missing programs can be requested by selectWorkstation.
+        @param registry: the WorkstationRegistry
+        @param job: the job to place
+        @result: a list of workstation informations
+        '''
+        minFreeCpus = requiredCpus(job)
+        candidates = registry.getCandidates(os=job.reqOS,
+            programs=job.reqPrograms, minFreeCpus=minFreeCpus)
+
+        if not candidates and any(job.reqPrograms):
+            candidates = registry.getCandidates(os=job.reqOS,
+                minFreeCpus=minFreeCpus)
+
+        return candidates
+
+    def parkJob(self, job, probes):
+        '''
+        @summary: Parks a job until one of the given program probes is answered
+        positive or all probes are answered. Parked jobs are skipped by the
+        scheduling passes.
+        @param job: the job
+        @param probes: list of Deferreds of the ProgramCache
+        @result:
+        '''
+        with self.queueLock:
+            self.parkedJobs.add(job.jobId)
+
+        self.logger.debug("Job {} parked until {} program probe(s) are answered."
+            .format(job.jobId, len(probes)))
+
+        # The ProgramCache fires the probes within the reactor thread, thus
+        # the callbacks must be added there as well. Without a running
+        # reactor (e.g. the Simulator) they are added directly.
+        if reactor.running and not isInIOThread():
+            reactor.callFromThread(self._watchProbes, job.jobId, probes)
+        else:
+            self._watchProbes(job.jobId, probes)
+
+    def _watchProbes(self, jobId, probes):
+        for probe in probes:
+            probe.addCallback(self._probeAnswered, jobId)
+
+        d = defer.DeferredList(probes)
+        d.addBoth(lambda result: self.unparkJob(jobId))
+
+    def _probeAnswered(self, available, jobId):
+        if available:
+            self.unparkJob(jobId)
+        return available
+
+    def unparkJob(self, jobId):
+        with self.queueLock:
+            if not jobId in self.parkedJobs:
+                return
+            self.parkedJobs.discard(jobId)
+
+        self.requestSchedulingPass()
+
+    def _dequeue(self, jobId):
+        with self.queueLock:
+            self.parkedJobs.discard(jobId)
+            self.jobQueue.remove(jobId)
+
+    # Events
+    # ========================
+    def workstationUpdated(self, workstation):
+        '''
+        @summary: Is called when new informations of a workstation are
+        received. Requests a pass if the workstation has more free cpus than
+        before.
+        @param workstation: the workstation informations
+        @result:
+        '''
+        name = workstation.get("workstationName", None)
+        released = self.leases.workstationReported(name)
+        if self.leases.expire(name) or released:
+            self._updateReservation(name)
+
+        self.loadHistory.update(workstation)
+        self.pySchedServer.workstations.refresh(name)
+
+        freeCpus = self.getFreeCpus(workstation)
+        self.scoring.update(workstation)
+        self.locality.workstationUpdated(workstation)
+
+        if "programs" in workstation:
+            self.programCache.programsReceived(name, workstation["programs"])
+
+        with self.reservationLock:
+            increased = freeCpus > self.lastFreeCpus.get(name, 0)
+            self.lastFreeCpus[name] = freeCpus
+
+        if increased:
+            self.requestSchedulingPass()
+
+    def workstationRemoved(self, workstationName):
+        '''
+        @summary: Is called when a workstation is removed. All leases on the
+        workstation are dropped.
+        @result:
+        '''
+        self.leases.removeWorkstation(workstationName)
+        with self.reservationLock:
+            self.lastFreeCpus.pop(workstationName, None)
+
+        self.scoring.remove(workstationName)
+        self.loadHistory.remove(workstationName)
+        self.preemption.workstationRemoved(workstationName)
+        self.locality.workstationRemoved(workstationName)
+        self.programCache.workstationRemoved(workstationName)
+
+    def jobStateChanged(self, job):
+        '''
+        @summary: Is called when a workstation reports a new state of a job.
+        The lease of a running job is released with the next workstation
+        informations, as the job is counted by the loads of the workstation
+        then. If the job ended, the lease is released and a pass is
+        requested.
+        @param job: the job
+        @result:
+        '''
+        if job.stateId >= JobState.lookup("DONE"):
+            self.releaseCpus(job.jobId, job.workstation)
+        elif job.stateId >= JobState.lookup("RUNNING"):
+            self.leases.started(job.jobId)
+
+        if job.stateId >= JobState.lookup("DONE"):
+            self.preemption.jobEnded(job.jobId)
+            self.jobEnded(job.jobId, job.stateId)
+            self.requestSchedulingPass()
+
+    # Dependencies
+    # ========================
+    def loadDependencies(self):
+        '''
+        @summary: Adds the dependencies of all jobs waiting for dependencies
+        within the database. Is called by the server on startup, after the
+        workstation registry was created, as released jobs are scheduled.
+        @result:
+        '''
+        for job in self.pySchedServer.getFromDatabase(Job,
+            stateId=JobState.lookup("WAITING_FOR_DEPENDENCIES")) or []:
+            self.addDependencies(job)
+
+    def addDependencies(self, job):
+        '''
+        @summary: Adds the dependencies of a job waiting for dependencies.
+        Dependencies on jobs which already ended are resolved at once.
+        @param job: the job (with the job ids of the parents)
+        @result:
+        '''
+        edges = parseDependencies(job.dependencies)
+        self.dependencies.add(job.jobId, edges)
+
+        for parentId in set(parentId for _, parentId in edges):
+            parent = self.pySchedServer.getJob(parentId)
+            if not parent:
+                self.jobEnded(parentId, JobState.lookup("DELETED"))
+            elif hasEnded(parent.stateId):
+                self.jobEnded(parentId, parent.stateId)
+
+        if not edges:
+            self.dependencies.remove(job.jobId)
+            self._releaseJob(job.jobId)
+
+    def jobEnded(self, jobId, stateId):
+        '''
+        @summary: Resolves the dependencies on an ended job. Jobs without
+        remaining dependencies are queued, jobs with a failed afterok
+        dependency end with DEPENDENCY_ERROR, which is resolved again.
+        @param jobId: the id of the ended job
+        @param stateId: the state of the ended job
+        @result:
+        '''
+        self.locality.jobEnded(jobId)
+
+        ended = [(jobId, stateId)]
+        while ended:
+            parentId, parentState = ended.pop()
+            released, failed = self.dependencies.resolve(parentId, parentState)
+
+            for childId in released:
+                self._releaseJob(childId)
+
+            for childId in failed:
+                job = self.pySchedServer.getJob(childId)
+                if not job:
+                    continue
+
+                job.stateId = JobState.lookup("DEPENDENCY_ERROR")
+                self.pySchedServer.updateDatabaseEntry(job)
+                self.pySchedServer.addToJobLog(childId,
+                    "Dependency on job {} failed ({}).".format(parentId,
+                    JobState.lookup(parentState)))
+                ended.append((childId, job.stateId))
+
+    def jobUploaded(self, jobId):
+        '''
+        @summary: Marks the files of a job as received. A job is only
+        scheduled after its upload arrived, also if its dependencies are
+        resolved earlier.
+        @param jobId: the id of the job
+        @result: the updated job
+        '''
+        with self.releaseLock:
+            job = self.pySchedServer.getJob(jobId)
+            if job and not job.uploaded:
+                job.uploaded = True
+                self.pySchedServer.updateDatabaseEntry(job)
+
+        return job
+
+    def _releaseJob(self, jobId):
+        with self.releaseLock:
+            job = self.pySchedServer.getJob(jobId)
+            if not job or \
+                job.stateId != JobState.lookup("WAITING_FOR_DEPENDENCIES"):
+                return
+
+            job.stateId = JobState.lookup("QUEUED")
+            self.pySchedServer.updateDatabaseEntry(job)
+
+        self.pySchedServer.addToJobLog(jobId, "Dependencies resolved.")
+        self.logger.info("Dependencies of job {} resolved.".format(jobId))
+
+        # Jobs without upload are scheduled by fileReceived
+        if job.uploaded:
+            self.scheduleJob(job)
+
+    # Optimistic Accounting
+    # ========================
+    def reserveCpus(self, job):
+        '''
+        @summary: Leases the cpus and the memory of a job on its workstation
+        until the workstation reports the job (see LeaseLedger).
+        @param job: the job with the selected workstation
+        @result:
+        '''
+        self.leases.acquire(job, self.schedulingParams.get("leaseTimeout",
+            LEASE_TIMEOUT))
+        self._updateReservation(job.workstation)
+
+    def releaseCpus(self, jobId, workstationName=None):
+        lease = self.leases.release(jobId)
+        if lease:
+            self._updateReservation(lease["workstation"])
+
+    def getReservedCpus(self, workstationName):
+        '''
+        @summary: Returns the count of cpus leased by the scheduler on a
+        workstation
+        @result:
+        '''
+        return self.leases.getReserved(workstationName)[0]
+
+    def getReservedMemory(self, workstationName):
+        '''
+        @summary: Returns the memory (MB) leased by the scheduler on a
+        workstation
+        @result:
+        '''
+        return self.leases.getReserved(workstationName)[1]
+
+    def _updateReservation(self, workstationName):
+        cpus, memory = self.leases.getReserved(workstationName)
+        self.scoring.updateReservation(workstationName, cpus, memory)
+        self.pySchedServer.workstations.refresh(workstationName)
 
-                return True        
+    def getCpuLoads(self, workstation):
+        '''
+        @summary: Returns the cpu loads of a workstation the scheduler
+        decides on. If loadSmoothing is enabled, these are the predicted
+        loads (see LoadHistory), else the reported loads.
+        @param workstation: the workstation informations
+        @result: a list with the load of each cpu
+        '''
+        return self.loadHistory.getLoads(workstation)
 
+    def getFreeCpus(self, workstation):
+        '''
+        @summary: Returns the count of free cpus of a workstation. The
+        reservations of the workstation (and of this scheduler, if higher)
+        and the cpus for active users are subtracted.
+        @param workstation: the workstation informations
+        @result: the count of free cpus
+        '''
+        threshold = self.schedulingParams.get("cpuThreshold", 20)
+        freeCpus = len([load for load in self.getCpuLoads(workstation)
+            if load < threshold])
+
+        freeCpus -= max(
+            workstation.get("reservedCpus", workstation.get("reserved", 0)),
+            self.getReservedCpus(workstation.get("workstationName", None)))
+
+        if workstation.get("activeUsers", 0) > 0:
+            freeCpus -= self.schedulingParams.get("cpusForUsers", 0)
+
+        return freeCpus
+
+    def getFreeMemory(self, workstation):
+        '''
+        @summary: Returns the free memory of a workstation in MB. The memory
+        leased by the scheduler is subtracted.
+        @param workstation: the workstation informations
+        @result:
+        '''
+        return getFreeMemory(workstation) - self.getReservedMemory(
+            workstation.get("workstationName", None))
 
     def checkJobPermission(self, job):
         return True
@@ -138,9 +771,22 @@ class PyScheduler(SchedulerInterface):
         return True
 
     def selectWorkstation(self, workstations, job):
+        if job.jobId in self.placements:
+            return self._plannedWorkstation(job)
+
         if len(workstations) == 0:
             return None
 
+        # All workstations are scored at once. Without a fitting workstation
+        # (e.g. programs have to be probed) they are checked one by one.
+        bonuses = self.locality.getBonuses(job)
+        if self.schedulingParams.get("vectorScoring", 1):
+            selected, score = self.scoring.select(job, workstations, bonuses)
+            if selected:
+                self.pySchedServer.addToJobLog(job.jobId,
+                    "Workstation {} ({}) selected.".format(selected, score))
+                return selected
+
         # For normal jobs select the workstation with the least amount of
         # free cpus.
 
@@ -152,12 +798,11 @@ class PyScheduler(SchedulerInterface):
 
         # Same for jobs with minimum required memory
         scores = {}
+        probes = []
         workstationList = copy.copy(workstations)
 
         for workstation in workstationList:
             self.logger.debug("Checking workstation {}".format(workstation))
-            freeCpus = 0
-
 
             # Check Maintenance Mode
             if workstation.get("maintenance", False):
@@ -173,23 +818,13 @@ class PyScheduler(SchedulerInterface):
                     format(workstation.get("workstationName"), None))
                 continue
 
-            for load in workstation.get("cpuLoad", []):
-            # Count free cpus. Threshold of a free cpu is 30% CPU-Load
-                if load < self.schedulingParams.get("cpuThreshold", 20):
-                    freeCpus += 1
-
-            # reserved Cpus
-            reserved = workstation.get("reserved", 0)
-            freeCpus -= reserved
-
-            # reserve Cpus for users
-            if workstation.get("activeUsers", 0) > 0:
-                freeCpus -= self.schedulingParams.get("cpusForUsers", 0)
+            # Count free cpus (including reserved cpus and cpus for users)
+            freeCpus = self.getFreeCpus(workstation)
 
             self.logger.debug("Free cpu count: {}".format(freeCpus))
             # when no cpu is free, this workstation should not
             # be considered any further
-            if freeCpus == 0:
+            if freeCpus <= 0:
                 self.pySchedServer.addToJobLog(
                     job.jobId,
                     "{} not appropriate: No free CPU-Cores".format(
@@ -205,14 +840,15 @@ class PyScheduler(SchedulerInterface):
 
             # when the workstation has not the required amount of
             # memory, it should not be considered any further
-            if job.minMemory > workstation.get("memory", 0) * 1024:
+            if job.minMemory > self.getFreeMemory(workstation):
                 self.pySchedServer.addToJobLog(
                     job.jobId,                    
                     "{} not appropriate: Not enough Memory".format(
                     workstation.get("workstationName"), None))
                 continue
 
-            # Check for programs
+            # Check for programs. Unknown programs are probed, the
+            # workstation is considered again when the answer arrived.
             reqProgramsAvailable = True
             for program in job.reqPrograms:
                 if program == "":
@@ -222,58 +858,36 @@ class PyScheduler(SchedulerInterface):
                 if program in workstation.get("programs", []):
                     continue
 
+                available = self.programCache.lookup(
+                    workstation.get("workstationName", None), program)
+                if available:
+                    continue
+
+                reqProgramsAvailable = False
+                if available is None:
+                    probes.append(self.programCache.probe(
+                        workstation.get("workstationName", None), program))
+                    self.pySchedServer.addToJobLog(
+                        job.jobId,
+                        "{} not appropriate yet: Checking for program '{}'".format(
+                        workstation.get("workstationName", None), program))
                 else:
-                    self.logger.info("Requesting program '{}' from {}".format(
-                            program,
-                            workstation.get("workstationName", None))
-                        )
-                    p = Program()
-                    p.programName = program
-                    p.programExec = program
-                    self.pySchedServer.checkForPrograms(
-                        workstation.get("workstationName", None),
-                        [p]
-                        )
-                    sleep(2)
-                    
-                    if program in workstation.get("programs", []):
-                        continue
-                    else:
-                        reqProgramsAvailable = False
-                        self.pySchedServer.addToJobLog(
-                            job.jobId,
-                            "{} not appropriate: Program '{}' not available".format(
-                            workstation.get("workstationName", None), program))
-                        break
+                    self.pySchedServer.addToJobLog(
+                        job.jobId,
+                        "{} not appropriate: Program '{}' not available".format(
+                        workstation.get("workstationName", None), program))
+                break
 
             if not reqProgramsAvailable:
                 continue
                 
-            score = 0
-            # Dont use machines with many programs that aren't
-            # used by the job
-            notReqProgramCount = len(workstation.get("programs", [])) - len(job.reqPrograms)
-            score -= self.schedulingParams.get("unusedProgramPenality", 100) * notReqProgramCount
-
-            # If someone working on the machine the scheduler
-            # should select another one first.
-            if workstation.get("activeUsers", 0) > 0:
-                score -= self.schedulingParams.get("activeUserPenality", 100)
-
-            if job.multiCpu:
-                # If the job supports multiple cpus, every free cpu
-                # is valuable
-                score += self.schedulingParams.get("usableCpuBonus", 100) * freeCpus
-            else:
-                # If not, workstations which are already occupied by
-                # jobs should be selected, so other workstations might
-                # be available for multiprocessor jobs
-                score -= self.schedulingParams.get("unusedCpuPenality", 100) * freeCpus
-
+            score = self.scoreWorkstation(job, workstation, freeCpus, bonuses)
             scores[workstation.get("workstationName", None)] = score
             self.logger.debug("Scores: {}".format(scores))
 
-        if len(scores) == 0:                    
+        if len(scores) == 0:
+            if probes:
+                self.parkJob(job, probes)
             return None
 
         selected = max(scores, key=scores.get)
@@ -284,27 +898,87 @@ class PyScheduler(SchedulerInterface):
             format(selected, max(scores)))
         return selected
 
+    def _plannedWorkstation(self, job):
+        selected = self.placements.get(job.jobId, None)
+        if selected:
+            self.pySchedServer.addToJobLog(job.jobId,
+                "Workstation {} selected.".format(selected))
+        return selected
+
+    def scoreWorkstation(self, job, workstation, freeCpus, bonuses=None):
+        '''
+        @summary: Returns the score of a workstation for a job. The
+        workstation with the highest score is selected.
+        @param job: the job
+        @param workstation: the workstation informations
+        @param freeCpus: the count of free cpus of the workstation
+        @param bonuses: the locality bonuses of the job (see
+        Locality.getBonuses). Callers scoring several workstations pass
+        them, so they are calculated once per job.
+        @result: the score
+        '''
+        # Workstations caching the input files of the job save the transfer
+        if bonuses is None:
+            bonuses = self.locality.getBonuses(job)
+        score = bonuses.get(workstation.get("workstationName", None), 0)
+
+        # Dont use machines with many programs that aren't
+        # used by the job
+        notReqProgramCount = len(workstation.get("programs", [])) - len(job.reqPrograms)
+        score -= self.schedulingParams.get("unusedProgramPenality", 100) * notReqProgramCount
+
+        # If someone working on the machine the scheduler
+        # should select another one first.
+        if workstation.get("activeUsers", 0) > 0:
+            score -= self.schedulingParams.get("activeUserPenality", 100)
+
+        if job.multiCpu:
+            # If the job supports multiple cpus, every free cpu
+            # is valuable
+            score += self.schedulingParams.get("usableCpuBonus", 100) * freeCpus
+        else:
+            # If not, workstations which are already occupied by
+            # jobs should be selected, so other workstations might
+            # be available for multiprocessor jobs
+            score -= self.schedulingParams.get("unusedCpuPenality", 100) * freeCpus
+
+        return score
+
     def workstationSelected(self, job):
+        self.reserveCpus(job)
+        self.jobQueue.chargeUsage(job.userId, requiredCpus(job))
         self.pySchedServer.reserveCPU(job)
 
     def prepareForTransfer(self, job):
         return True
 
     def transfer(self, job):
+        self.leases.renew(job.jobId, self.schedulingParams.get("leaseTimeout",
+            LEASE_TIMEOUT))
         if self.pySchedServer.transferJob(job):
             return True
         else:
             return False
 
     def compilingCompleted(self, job):
+        if isInIOThread():
+            # Called by the compile process within the reactor thread
+            self.schedulerPool.callInThread(self.compilingCompleted, job)
+            return
+
         self.logger.info("Compiling completed.")
         job.stateId = JobState.lookup("COMPILED")
         self.pySchedServer.updateDatabaseEntry(job)
         self.scheduleJob(job)
 
     def compilingFailed(self, job):
+        if isInIOThread():
+            self.schedulerPool.callInThread(self.compilingFailed, job)
+            return
+
         job.stateId = JobState.lookup("COMPILER_ERROR")
         self.pySchedServer.updateDatabaseEntry(job)
+        self.releaseCpus(job.jobId, job.workstation)
         self.logger.error("Failed to compile job {}".format(job.jobId))
 
     def updateSchedulingParameter(self, parameter):
@@ -315,8 +989,8 @@ class PyScheduler(SchedulerInterface):
         return self.schedulingParams
 
     def jobAborted(self, jobId):
-        try:
-            while jobId in self.jobQueue:
-                self.jobQueue.remove(jobId)
-        except ValueError:
-            pass        
+        self._dequeue(jobId)
+        self.releaseCpus(jobId)
+        self.preemption.jobEnded(jobId)
+        self.dependencies.remove(jobId)
+        self.jobEnded(jobId, JobState.lookup("ABORTED"))        
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+'''
+@summary: Registry of the connected workstations. Keeps indexes by name, OS,
+program and count of free cpus, which are updated with every received
+workstation information.
+'''
+
+import threading
+
+class WorkstationRegistry(object):
+    '''
+    @summary: Registry of the connected workstations. The workstations are
+    stored as dictionaries (see Common.Interfaces.WorkstationReference) and
+    are identified by their network id.
+    '''
+    def __init__(self, freeCpuFunction=None):
+        '''
+        @summary: Initializes the registry
+        @param freeCpuFunction: function returning the count of free cpus of a
+        workstation dictionary. Used for the free cpu index.
+        @result:
+        '''
+        self.freeCpuFunction = freeCpuFunction
+        self.lock = threading.RLock()
+
+        self.workstations = {}
+        self.byName = {}
+        self.byOS = {}
+        self.byProgram = {}
+        self.byFreeCpus = {}
+
+        # networkId -> indexed values, to remove outdated index entries
+        self.indexed = {}
+
+    def __len__(self):
+        return len(self.workstations)
+
+    def __contains__(self, networkId):
+        return networkId in self.workstations
+
+    # Registry Functions
+    # ========================
+    def add(self, networkId, workstationInfo):
+        '''
+        @summary: Adds a workstation. A registered workstation with the same
+        name is replaced.
+        @param networkId: the network id of the workstation
+        @param workstationInfo: the workstation informations
+        @result: the network id of the replaced workstation or None
+        '''
+        with self.lock:
+            replaced = self.byName.get(
+                workstationInfo.get("workstationName", None), None)
+            if replaced is not None:
+                self.remove(replaced)
+
+            self.workstations[networkId] = workstationInfo
+            self._index(networkId)
+
+        return replaced
+
+    def update(self, networkId, workstationInfo):
+        '''
+        @summary: Updates the informations of a registered workstation
+        @param networkId: the network id of the workstation
+        @param workstationInfo: the (changed) workstation informations
+        @result: the updated workstation informations
+        '''
+        with self.lock:
+            workstation = self.workstations[networkId]
+            workstation.update(workstationInfo)
+            self._index(networkId)
+
+        return workstation
+
+    def remove(self, networkId):
+        '''
+        @summary: Removes a workstation
+        @param networkId: the network id of the workstation
+        @result: the informations of the removed workstation or None
+        '''
+        with self.lock:
+            workstation = self.workstations.pop(networkId, None)
+            if workstation is not None:
+                self._unindex(networkId)
+
+        return workstation
+
+    def refresh(self, workstationName):
+        '''
+        @summary: Updates the free cpu index of a workstation. Must be called
+        if the free cpus changed without new informations (e.g. reservations)
+        @param workstationName: the name of the workstation
+        @result:
+        '''
+        with self.lock:
+            networkId = self.byName.get(workstationName, None)
+            if networkId is not None:
+                self._index(networkId)
+
+    # Lookup Functions
+    # ========================
+    def get(self, networkId):
+        return self.workstations.get(networkId, None)
+
+    def getByName(self, workstationName):
+        with self.lock:
+            return self.workstations.get(
+                self.byName.get(workstationName, None), None)
+
+    def getNetworkId(self, workstationName):
+        '''
+        @summary: Returns the network id of a workstation
+        @param workstationName: the name of the workstation
+        @result: the network id or -1 if no such workstation is registered
+        '''
+        return self.byName.get(workstationName, -1)
+
+    def getNetworkIds(self):
+        with self.lock:
+            return self.workstations.keys()
+
+    def getAll(self):
+        with self.lock:
+            return self.workstations.values()
+
+    def getFreeCpus(self, workstationName):
+        '''
+        @summary: Returns the indexed count of free cpus of a workstation
+        '''
+        with self.lock:
+            indexed = self.indexed.get(
+                self.byName.get(workstationName, None), None)
+            return indexed[3] if indexed else 0
+
+    def hasFreeCpus(self, minFreeCpus=1):
+        '''
+        @summary: Returns True if any workstation has at least minFreeCpus
+        free cpus.
+        '''
+        with self.lock:
+            return any(freeCpus >= minFreeCpus and networkIds
+                for freeCpus, networkIds in self.byFreeCpus.iteritems())
+
+    def getCandidates(self, os=None, programs=None, minFreeCpus=0):
+        '''
+        @summary: Returns the workstations which fulfill all requirements.
+        @param os: the required operating system (case insensitive)
+        @param programs: list of required program names
+        @param minFreeCpus: minimal count of free cpus
+        @result: a list of workstation informations
+        '''
+        with self.lock:
+            candidates = None
+
+            if minFreeCpus > 0:
+                candidates = set()
+                for freeCpus, networkIds in self.byFreeCpus.iteritems():
+                    if freeCpus >= minFreeCpus:
+                        candidates |= networkIds
+
+            if os:
+                candidates = self._intersect(candidates,
+                    self.byOS.get(os.lower(), set()))
+
+            for program in programs or []:
+                if program:
+                    candidates = self._intersect(candidates,
+                        self.byProgram.get(program, set()))
+
+            if candidates is None:
+                return self.workstations.values()
+
+            return [self.workstations[networkId] for networkId in candidates]
+
+    # Internal Functions
+    # ========================
+    def _intersect(self, candidates, networkIds):
+        if candidates is None:
+            return set(networkIds)
+
+        return candidates & networkIds
+
+    def _index(self, networkId):
+        workstation = self.workstations[networkId]
+
+        name = workstation.get("workstationName", None)
+        os = (workstation.get("os", None) or "").lower()
+        programs = frozenset(workstation.get("programs", None) or [])
+        freeCpus = self.freeCpuFunction(workstation) \
+            if self.freeCpuFunction else 0
+
+        if self.indexed.get(networkId, None) == (name, os, programs, freeCpus):
+            return
+
+        self._unindex(networkId)
+
+        self.byName[name] = networkId
+        self.byOS.setdefault(os, set()).add(networkId)
+        for program in programs:
+            self.byProgram.setdefault(program, set()).add(networkId)
+        self.byFreeCpus.setdefault(freeCpus, set()).add(networkId)
+
+        self.indexed[networkId] = (name, os, programs, freeCpus)
+
+    def _unindex(self, networkId):
+        indexed = self.indexed.pop(networkId, None)
+        if not indexed:
+            return
+
+        name, os, programs, freeCpus = indexed
+        if self.byName.get(name, None) == networkId:
+            del self.byName[name]
+
+        self._discard(self.byOS, os, networkId)
+        for program in programs:
+            self._discard(self.byProgram, program, networkId)
+        self._discard(self.byFreeCpus, freeCpus, networkId)
+
+    def _discard(self, index, key, networkId):
+        networkIds = index.get(key, None)
+        if networkIds is not None:
+            networkIds.discard(networkId)
+            if not networkIds:
+                del index[key]
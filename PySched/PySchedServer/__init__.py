@@ -11,26 +11,40 @@ Workstations.
 
 from PySched.Common.Communication.CommandBuilder import CommandBuilder
 from PySched.Common.DataStructures import Job, User, JobState, Program
-from PySched.Common import datetime2Str
+from PySched.Common import datetime2Str, str2Datetime
 from PySched.Common.IO import FileUtils
 from PySched.Common.IO import Archive
+from PySched.Common.Database.DatabaseExecutor import DatabaseExecutor
+from PySched.Common.Database.StorageProfile import CheckpointLoop
 
 from DatabaseManagement import SqliteManager
+from DatabaseManagement.ObjectCache import ObjectCache
 from Scheduler import PyScheduler
+from Scheduler.Dependencies import parseDependencies, formatDependencies, \
+    getLevels
 from NetworkManagement import NetworkManager
 from MessageHandler import MessageHandler
+from WorkstationRegistry import WorkstationRegistry
 
 from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python.threadable import isInIOThread
 
 import psutil
 
 import platform
 import logging
+import threading
 import datetime
 import os
 
 
 VERSION = "1.4.3"
+DATABASE_READER_THREADS = 2
+# Interval of the archive loop in seconds
+ARCHIVE_INTERVAL = 3600
+# Count of jobs moved to the archive before the database is compacted
+VACUUM_THRESHOLD = 10000
 TITLE = """
  _____        _____      _              _  _____                           
 |  __ \      / ____|    | |            | |/ ____|                          
@@ -61,16 +75,34 @@ class PySchedServer(object):
 
         self.logger.info("Starting PySchedServer v{}".format(VERSION))
 
-        self.dbController = SqliteManager(self.workingDir)
+        self.dbExecutor = DatabaseExecutor(
+            SqliteManager(self.workingDir, profile=args.dbProfile),
+            readerThreads=DATABASE_READER_THREADS)
+        self.dbExecutor.start()
+        self.checkpointLoop = CheckpointLoop(self.dbExecutor)
+        self.checkpointLoop.start()
+        self.dbController = ObjectCache(self.dbExecutor.getBlockingProxy())
+
+        self.jobLogBuffer = []
+        self.jobLogLock = threading.Lock()
+        self.jobLogLoop = LoopingCall(self.flushJobLog)
+        self.jobLogLoop.start(1, now=False)
+
+        self.archiveAge = args.archiveAge
+        self.jobsArchivedSinceVacuum = 0
+        self.archiveLoop = LoopingCall(self.moveJobsToArchive)
+        if self.archiveAge > 0:
+            self.archiveLoop.start(ARCHIVE_INTERVAL, now=False)
+
         self.scheduler = PyScheduler(self.workingDir, self)
+        self.workstations = WorkstationRegistry(self.scheduler.getFreeCpus)
+        self.scheduler.loadDependencies()
         
         self.networkManager = NetworkManager(
             self.workingDir, 
             MessageHandler(self),
             multiGroup=args.multicast)
 
-        self.workstations = {}
-
         self.networkManager.startService()
         reactor.run()
 
@@ -85,23 +117,30 @@ class PySchedServer(object):
         return self.dbController.addToDatabase(obj)
 
 
-    def getFromDatabase(self, objClass, first=False, **filterArgs):
+    def addAllToDatabase(self, objs):
+        '''
+        @summary: Adds all given objects to the database within one
+        transaction.
+        @param objs: The objects to add.
+        @result: The added objects
+        '''
+        return self.dbController.addAllToDatabase(objs)
+
+    def getFromDatabase(self, objClass, first=False, orderBy=None, limit=None,
+        offset=None, **filterArgs):
         '''
         @summary: Returns a list of all <type> that passes the filter
         from the database.
         @param type: Which object should be read from the database
+        @param first: Return only the first object that passes the filter
+        @param orderBy: Attribute to order by. A leading '-' sorts descending
+        @param limit: Maximal count of returned objects
+        @param offset: Count of objects to skip
         @param **filterArgs: a List of filters to use. E.g. id=0
         @result:
         '''
-        objects = self.dbController.getFromDatabase(objClass)
-        returnList = filter(self.createFilterFunction(**filterArgs), objects)
-
-        if first:
-            if len(returnList) == 0:
-                return None
-            return returnList[0]
-
-        return returnList
+        return self.dbController.getFromDatabase(objClass, first=first,
+            orderBy=orderBy, limit=limit, offset=offset, **filterArgs)
 
     def updateDatabaseEntry(self, obj):
         '''
@@ -120,22 +159,6 @@ class PySchedServer(object):
         self.dbController.deleteFromDatabase(obj)
 
 
-    def createFilterFunction(self, **filterArgs):
-        '''
-        @summary: Creates a function from filterArgs to be used in
-        a filter.
-        @param **filterArgs:
-        @result:
-        '''
-        def checkItem(item):
-            for key, value in filterArgs.iteritems():
-                if str(getattr(item, key, None)) != str(value):
-                    return False
-
-            return True
-        return checkItem
-
-
     # Scheduling Functions
     # ========================
     def schedule(self, jobId=None):
@@ -144,17 +167,21 @@ class PySchedServer(object):
         @result:
         '''
         if not jobId:
-            jobs = self.getFromDatabase(Job)
+            jobs = self.getFromDatabase(Job, stateId=[
+                JobState.lookup("QUEUED"),
+                JobState.lookup("PREPARED"),
+                JobState.lookup("WAITING_FOR_WORKSTATION")])
             for job in jobs:
                 self.schedule(job.jobId)
+            self.scheduler.requestSchedulingPass()
         else:
             job = self.getFromDatabase(Job, jobId=jobId, first=True)
-            if job:
+            if job and job.uploaded:
                 if job.stateId == JobState.lookup("WAITING_FOR_WORKSTATION") or \
                     job.stateId == JobState.lookup("QUEUED") or \
                     job.stateId == JobState.lookup("PREPARED"):
                         self.scheduler.scheduleJob(job=job, 
-                            workstations=self.workstations.values())
+                            workstations=self.workstations.getAll())
                         self.addToJobLog(job.jobId, "Job scheduled.")
 
     # Job Functions
@@ -165,35 +192,190 @@ class PySchedServer(object):
         @param jobInformations: Dictionary with job informations
         @result: Returns true if the job was added successful.
         '''
-        job = Job()
-        job.added = datetime2Str(datetime.datetime.now())
-
-        for key in jobInformations:
-            if key in job.__dict__:
-                setattr(job, key, jobInformations[key])
-            else:
-                job.otherAttr[key] = jobInformations[key]
-
-        self.logger.debug("New Job: {}".format(job.__dict__))
-
         userId = jobInformations.get("userId", None)
         user = self.getUser(userId)
         if not user:
             return False
 
-        job.userId = user.id
+        job = self.createJob(user, jobInformations)
+        self.logger.debug("New Job: {}".format(job.__dict__))
+        if not self.checkDependencies(job):
+            return False
 
         job = self.addToDatabase(job)
         if job:
-            jobDir = FileUtils.createDirectory(
-                os.path.join(self.workingDir, str(job.jobId)))
-
-            FileUtils.createDirectory(os.path.join(jobDir, "logs"))
+            self.createJobDir(job.jobId)
             self.addToJobLog(job.jobId, "Job added.")
+            if job.dependencies:
+                self.scheduler.addDependencies(job)
             return job
 
         return False
 
+    def addJobs(self, userId, jobInformationList):
+        '''
+        @summary: Adds a list of jobs of one user to the database. All jobs
+        are inserted within one transaction.
+        @param userId: the user id of the owner of the jobs
+        @param jobInformationList: list of dictionaries with job informations
+        @result: Returns the list of added jobs or False if the jobs couldn't
+        be added.
+        '''
+        user = self.getUser(userId)
+        if not user or not jobInformationList:
+            return False
+
+        jobs = [self.createJob(user, jobInformations)
+            for jobInformations in jobInformationList]
+        self.logger.debug("Adding {} jobs for user {}".format(
+            len(jobs), user.userId))
+        if not all(self.checkDependencies(job) for job in jobs):
+            return False
+
+        jobs = self.addAllToDatabase(jobs)
+        if not jobs:
+            return False
+
+        for job in jobs:
+            self.createJobDir(job.jobId)
+            self.addToJobLog(job.jobId, "Job added.")
+            if job.dependencies:
+                self.scheduler.addDependencies(job)
+
+        return jobs
+
+    def addJobDag(self, userId, jobInformationList):
+        '''
+        @summary: Adds a workflow of jobs of one user. A job may depend on
+        other jobs of the workflow, which are referenced by their dagKey,
+        e.g. {"dagKey": "post", "dependencies": ["afterok:solve1:solve2"]},
+        or on existing jobs (referenced by their job id). References equal
+        to a dagKey of the workflow (the default key is the index of the
+        job) always refer to the workflow job, other numbers to existing
+        jobs. The jobs are added level by level, so the ids of the parents
+        are known when a job is added.
+        @param userId: the user id of the owner of the jobs
+        @param jobInformationList: list of dictionaries with job informations
+        @result: Returns the list of added jobs (in the given order) or False
+        if the workflow is invalid (e.g. contains a cycle) or couldn't be
+        added.
+        '''
+        user = self.getUser(userId)
+        if not user or not jobInformationList:
+            return False
+
+        try:
+            keys = [str(jobInformations.get("dagKey", index))
+                for index, jobInformations in enumerate(jobInformationList)]
+            keySet = set(keys)
+            edges = [[(dependencyType, str(reference)
+                if str(reference) in keySet else reference)
+                for dependencyType, reference in parseDependencies(
+                    jobInformations.get("dependencies", []))]
+                for jobInformations in jobInformationList]
+            levels = getLevels(keys, edges)
+        except ValueError, e:
+            self.logger.error("Invalid job workflow: {}".format(e))
+            return False
+
+        jobIds = {}
+        added = {}
+        for level in levels:
+            jobs = []
+            for index in level:
+                jobInformations = dict(jobInformationList[index])
+                jobInformations.pop("dagKey", None)
+                jobInformations["dependencies"] = formatDependencies(
+                    [(dependencyType, jobIds.get(reference, reference))
+                    for dependencyType, reference in edges[index]])
+
+                job = self.createJob(user, jobInformations)
+                if not self.checkDependencies(job):
+                    self._abortJobs(added.values())
+                    return False
+                jobs.append(job)
+
+            jobs = self.addAllToDatabase(jobs)
+            if not jobs:
+                self._abortJobs(added.values())
+                return False
+
+            for index, job in zip(level, jobs):
+                jobIds[keys[index]] = job.jobId
+                added[index] = job
+
+        self.logger.debug("Added workflow of {} jobs in {} levels for user {}"
+            .format(len(added), len(levels), user.userId))
+
+        jobs = [added[index] for index in range(len(jobInformationList))]
+        for job in jobs:
+            self.createJobDir(job.jobId)
+            self.addToJobLog(job.jobId, "Job added.")
+            if job.dependencies:
+                self.scheduler.addDependencies(job)
+
+        return jobs
+
+    def checkDependencies(self, job):
+        '''
+        @summary: Validates the dependencies of a new job. All parents must
+        exist. A job with dependencies waits for them.
+        @param job: the new job
+        @result: True if the dependencies are valid
+        '''
+        try:
+            edges = parseDependencies(job.dependencies)
+        except ValueError, e:
+            self.logger.error("Invalid dependencies of job {}: {}".format(
+                job.jobName, e))
+            return False
+
+        for dependencyType, parentId in edges:
+            if isinstance(parentId, basestring) or not self.getJob(parentId):
+                self.logger.error("Job {} depends on unknown job {}".format(
+                    job.jobName, parentId))
+                return False
+
+        job.dependencies = formatDependencies(edges)
+        if edges:
+            job.stateId = JobState.lookup("WAITING_FOR_DEPENDENCIES")
+
+        return True
+
+    def _abortJobs(self, jobs):
+        for job in jobs:
+            job.stateId = JobState.lookup("ABORTED")
+            self.updateDatabaseEntry(job)
+
+    def createJob(self, user, jobInformations):
+        '''
+        @summary: Creates a new Job object owned by the given user
+        @param user: the owner of the job
+        @param jobInformations: Dictionary with job informations
+        @result: the job
+        '''
+        job = Job()
+        job.added = datetime2Str(datetime.datetime.now())
+
+        for key in jobInformations:
+            if key in job.__dict__:
+                setattr(job, key, jobInformations[key])
+            else:
+                job.otherAttr[key] = jobInformations[key]
+
+        job.userId = user.id
+        return job
+
+    def createJobDir(self, jobId):
+        '''
+        @summary: Creates the directory (and the log directory) of a job
+        @param jobId: the id of the job
+        @result: the path to the job directory
+        '''
+        jobDir = os.path.join(self.workingDir, str(jobId))
+        FileUtils.createDirectory(os.path.join(jobDir, "logs"))
+        return jobDir
+
     def updateJobState(self, jobInformations):
         '''
         @summary: updates the jobInformations
@@ -217,13 +399,13 @@ class PySchedServer(object):
                     job.otherAttr[key] = jobInformations[key]
 
         self.updateDatabaseEntry(job)
+        self.scheduler.jobStateChanged(job)
         if job.stateId >= JobState.lookup("DONE"):
             self.logger.info("Job {} ended with state {}.".format(
                 job.jobId, JobState.lookup(job.stateId)))
             self.cleanupJobDir(job.jobId)
             self.getResultsFromWorkstation(job.jobId)    
             self.addToJobLog(job.jobId, "Job Ended.")        
-            reactor.callInThread(self.schedule)
 
         if isDeleted:
             job.JobState = JobState.lookup("DELETED")
@@ -271,7 +453,7 @@ class PySchedServer(object):
         @result:
         '''
         self.logger.info("Deleting Job {}...".format(jobId))
-        job = self.getFromDatabase(Job, jobId=jobId, first=True)
+        job = self.getJob(jobId)
         user = self.getFromDatabase(User, userId=userId, first=True)
 
         if not (job or user) or not (job.userId == user.id or user.admin):
@@ -292,7 +474,8 @@ class PySchedServer(object):
     def transferJob(self, job):
         '''
         @summary: Transfers a job to the selected Client.
-        All files within the job folder are packed and transferred
+        All files within the job folder are packed and transferred, except
+        the input files the workstation holds in its input cache.
         @param job: The job to transfer.
         @result:
         '''
@@ -300,14 +483,24 @@ class PySchedServer(object):
         archivePath = os.path.join(
             self.workingDir, "temp", "{}.tar".format(job.jobId))
 
+        inputFiles, cachedInputs, cachedBytes = \
+            self.scheduler.locality.getTransferManifest(job, job.workstation)
+
         FileUtils.createDirectory(os.path.split(archivePath)[0])
-        archive = Archive.packFolder(archivePath, jobDir)
+        archive = Archive.packFolder(archivePath, jobDir, exclude=cachedInputs)
         networkId = self.lookupWorkstationName(job.workstation)
 
+        transferred = os.path.getsize(archive)
+        self.scheduler.locality.transferred(job.jobId, transferred, cachedBytes)
+        self.addToJobLog(job.jobId, "Transferring {} bytes ({} bytes cached "
+            "by {}).".format(transferred, cachedBytes, job.workstation))
+
         self.networkManager.sendMessage(
             networkId, 
             CommandBuilder.buildAddJobString(
                 archive, 
+                inputFiles=inputFiles,
+                cachedInputs=cachedInputs,
                 **job.__dict__))
         return True
 
@@ -341,21 +534,95 @@ class PySchedServer(object):
             return False
 
     def addToJobLog(self, jobId, message):
-        job = self.getFromDatabase(Job, jobId=jobId, first=True)
+        '''
+        @summary: Adds a message to the log of a job. The messages are
+        buffered and written to the database by the job log loop.
+        @param jobId: the id of the job
+        @param message: the message to log
+        @result:
+        '''
+        try:
+            jobId = int(jobId)
+        except (TypeError, ValueError):
+            return
 
-        if job:
-            logPath = os.path.join(
-                self.workingDir, str(jobId), "logs", "joblog.log")
+        with self.jobLogLock:
+            self.jobLogBuffer.append((jobId, datetime.datetime.now(), message))
 
-            m = "[{}] {}\n".format(datetime2Str(datetime.datetime.now()),
-                message)
-            FileUtils.createOrAppendToFile(logPath, m)
+    def flushJobLog(self, blocking=False):
+        '''
+        @summary: Writes all buffered job log messages to the database
+        @param blocking: Wait until the messages are written. Must not be
+        used within the reactor thread.
+        @result:
+        '''
+        with self.jobLogLock:
+            entries = self.jobLogBuffer
+            self.jobLogBuffer = []
+
+        if not entries:
+            return
+
+        if blocking:
+            self.dbController.appendToJobLog(entries)
+        else:
+            d = self.dbExecutor.runWrite(
+                self.dbExecutor.dbController.appendToJobLog, entries)
+            d.addErrback(lambda f: self.logger.error(
+                "Could not write job log: {}".format(f.getErrorMessage())))
 
     def getJob(self, jobId):
         job = self.getFromDatabase(Job, first=True, jobId=jobId)
+        if not job:
+            job = self.dbController.getArchivedJobs(first=True, jobId=jobId)
 
         return job
 
+    def moveJobsToArchive(self):
+        '''
+        @summary: Moves the archived jobs older than archiveAge days into the
+        archive table. Runs on the database writer thread, the database is
+        compacted afterwards if enough jobs were moved.
+        @result:
+        '''
+        cutoff = datetime.datetime.now() - \
+            datetime.timedelta(days=self.archiveAge)
+        d = self.dbExecutor.runWrite(
+            self.dbExecutor.dbController.moveToArchive, cutoff)
+        d.addCallback(self._jobsMovedToArchive)
+        d.addErrback(lambda f: self.logger.error(
+            "Could not move jobs to the archive: {}".format(
+                f.getErrorMessage())))
+
+    def _jobsMovedToArchive(self, jobIds):
+        if not jobIds:
+            return
+
+        self.logger.info("{} jobs moved to the archive.".format(len(jobIds)))
+        self.jobsArchivedSinceVacuum += len(jobIds)
+        if self.jobsArchivedSinceVacuum >= VACUUM_THRESHOLD:
+            self.jobsArchivedSinceVacuum = 0
+            self.logger.info("Compacting database...")
+            self.vacuumDatabase()
+
+    def vacuumDatabase(self, freePages=None):
+        '''
+        @summary: Releases the free pages of the database file in small
+        steps. Each step is queued on the writer thread separately, so other
+        writes are run between the steps.
+        @param freePages: the free pages left by the last step
+        @result:
+        '''
+        if freePages == 0:
+            d = self.dbExecutor.runRead(
+                self.dbExecutor.dbController.checkpoint, "TRUNCATE")
+        else:
+            d = self.dbExecutor.runWrite(self.dbExecutor.dbController.vacuum)
+            d.addCallback(self.vacuumDatabase)
+
+        d.addErrback(lambda f: self.logger.error(
+            "Could not compact the database: {}".format(f.getErrorMessage())))
+
     def reserveCPU(self, job):
         self.logger.info("Reserving CPU for job {} on {}".format(
             job.jobId,
@@ -371,9 +638,7 @@ class PySchedServer(object):
 
         if (job and user) and \
             (job.userId == user.id or user.admin):
-            networkId = self.lookupWorkstationName(job.workstation)
-            self.networkManager.sendMessage(networkId,
-                CommandBuilder.buildPauseJobString(job.jobId))            
+            self.suspendJob(job)
 
     def resumeJob(self, userId, jobId):
         self.logger.info("Try to resume job {}".format(jobId))
@@ -382,9 +647,29 @@ class PySchedServer(object):
 
         if (job and user) and \
             (job.userId == user.id or user.admin):
-            networkId = self.lookupWorkstationName(job.workstation)
-            self.networkManager.sendMessage(networkId,
-                CommandBuilder.buildResumeJobString(job.jobId)) 
+            self.continueJob(job)
+
+    def suspendJob(self, job):
+        '''
+        @summary: Sends a pause command to the workstation of the job. No
+        permissions are checked (used by the scheduler for preemption).
+        @param job: the job
+        @result:
+        '''
+        networkId = self.lookupWorkstationName(job.workstation)
+        self.networkManager.sendMessage(networkId,
+            CommandBuilder.buildPauseJobString(job.jobId))
+
+    def continueJob(self, job):
+        '''
+        @summary: Sends a resume command to the workstation of the job. No
+        permissions are checked (used by the scheduler for preemption).
+        @param job: the job
+        @result:
+        '''
+        networkId = self.lookupWorkstationName(job.workstation)
+        self.networkManager.sendMessage(networkId,
+            CommandBuilder.buildResumeJobString(job.jobId))
 
     def getFileContentFromWS(self, userId, jobId, path, lineCount, sender):
         '''
@@ -503,30 +788,141 @@ class PySchedServer(object):
 
         return False
 
-    def getJobList(self, userId, showAll, showAllUser):
+    def getJobList(self, userId, showAll, showAllUser, offset=None,
+        limit=None, after=None, states=None, workstation=None,
+        addedSince=None, addedUntil=None):
         '''
-        @summary: Returns a list with all jobs of the user
+        @summary: Returns a list with all jobs of the user. All filters are
+        done by the database.
         @param userId: the user id
         @param showAll: show all Jobs including archived
-        @result:
+        @param showAllUser: show the jobs of all users (admin only)
+        @param offset: count of jobs to skip
+        @param limit: maximal count of returned jobs
+        @param after: only return jobs with a jobId greater than this one
+        (cursor for paging)
+        @param states: a state name or a list of state names
+        @param workstation: only return jobs on this workstation
+        @param addedSince: only return jobs added at or after this date
+        @param addedUntil: only return jobs added before this date
+        @result: a list of jobs ordered by jobId or False if the user is
+        unknown or the paging arguments are invalid
         '''
+        try:
+            after = int(after) if after is not None else None
+            offset = int(offset) if offset else None
+            limit = int(limit) if limit else None
+            for name, value in (("after", after), ("offset", offset),
+                ("limit", limit)):
+                if value is not None and value < 0:
+                    raise ValueError("negative {} {}".format(name, value))
+        except (TypeError, ValueError), e:
+            self.logger.error("Invalid paging arguments: {}".format(e))
+            return False
+
         user = self.getFromDatabase(User, userId=userId, first=True)
         if not user:
             return False
 
-        jobs = []
-        if user.admin and showAllUser:
-            jobs = self.getFromDatabase(Job)
-        else:
-            jobs = self.getFromDatabase(Job, userId=user.id)
+        filterArgs = {}
+        if not (user.admin and showAllUser):
+            filterArgs["userId"] = user.id
+
+        if states:
+            if not isinstance(states, list):
+                states = [states]
+            filterArgs["stateId"] = [JobState.lookup(state)
+                if isinstance(state, basestring) else state
+                for state in states]
+        elif not showAll:
+            filterArgs["stateId__lt"] = JobState.lookup("ARCHIVED")
+
+        if workstation:
+            filterArgs["workstation"] = workstation
+        if after is not None:
+            filterArgs["jobId__gt"] = after
+        if addedSince:
+            filterArgs["added__ge"] = addedSince
+        if addedUntil:
+            filterArgs["added__lt"] = addedUntil
+
+        # Jobs within the archive table are only read if archived jobs
+        # are requested.
+        if not (showAll or (states and max(filterArgs["stateId"]) >=
+            JobState.lookup("ARCHIVED"))):
+            return self.getFromDatabase(Job, orderBy="jobId",
+                offset=offset, limit=limit, **filterArgs)
+
+        # Merge the pages of both tables
+        window = (offset or 0) + limit if limit else None
+        jobs = self.getFromDatabase(Job, orderBy="jobId", limit=window,
+            **filterArgs)
+        jobs += self.dbController.getArchivedJobs(orderBy="jobId",
+            limit=window, **filterArgs)
+        jobs.sort(key=lambda job: job.jobId)
+
+        jobs = jobs[offset:]
+        if limit:
+            jobs = jobs[:limit]
+
+        return jobs
+
+    def getJobStats(self, userId):
+        '''
+        @summary: Returns the count of jobs per state. Admins get the counts
+        of all users and workstations, other users only their own counts.
+        @param userId: the user id of the requesting user
+        @result: a dictionary with the keys states ({state: count}),
+        users ({userId: {state: count}}) and workstations
+        ({workstation: {state: count}}) or False if the user is unknown
+        '''
+        user = self.getUser(userId)
+        if not user:
+            return False
+
+        stats = self.dbController.jobCounters.getStatistics(
+            None if user.admin else user.id)
+
+        def stateNames(counts):
+            return dict((JobState.lookup(stateId), count)
+                for stateId, count in counts.iteritems())
+
+        users = {}
+        for userRealId, counts in stats["users"].iteritems():
+            owner = self.lookupUserId(userRealId)
+            users[owner.userId if owner else userRealId] = stateNames(counts)
+
+        return {
+            "states": stateNames(stats["states"]),
+            "users": users,
+            "workstations": dict((workstation, stateNames(counts))
+                for workstation, counts in stats["workstations"].iteritems()),
+            }
+
+    def getQueue(self, userId):
+        '''
+        @summary: Returns the job queue of the scheduler. Admin only.
+        @param userId: the user id of the requesting user
+        @result: see PyScheduler.getQueue, the user ids are replaced by the
+        user names. False if the user isn't an admin.
+        '''
+        user = self.getUser(userId)
+        if not user or not user.admin:
+            return False
+
+        queue = self.scheduler.getQueue()
+        names = {}
+        for userRealId in set([entry["userId"] for entry in queue["jobs"]] +
+            queue["usage"].keys()):
+            owner = self.lookupUserId(userRealId)
+            names[userRealId] = owner.userId if owner else userRealId
 
-        returnList = []
-        for i in range(0, len(jobs)):
-            if (showAll and jobs[i].stateId >= JobState.lookup("ARCHIVED")) or \
-               (jobs[i].stateId < JobState.lookup("ARCHIVED")):
-                returnList.append(jobs[i])
+        for entry in queue["jobs"]:
+            entry["userId"] = names[entry["userId"]]
+        queue["usage"] = dict((names[userRealId], usage)
+            for userRealId, usage in queue["usage"].iteritems())
 
-        return returnList
+        return queue
 
     def returnResultsToClient(self, userId, jobId):
         '''
@@ -550,21 +946,35 @@ class PySchedServer(object):
         self.logger.info("Results for job {} prepared.".format(jobId))
         return archive  
 
-    def getLog(self, userId, jobId):
+    def getLog(self, userId, jobId, since=None, tail=None):
         '''
-        @summary: Reads the logfile of a job and returns it
+        @summary: Reads the log of a job and returns it
         @param jobId: the jobId of the job
         @param userId: the user id of the requesting user
-        @result: 
+        @param since: only return messages logged at or after this time
+        @param tail: only return the last <tail> messages
+        @result: the log or False if since or tail are invalid
         '''
+        try:
+            since = str2Datetime(since)
+            tail = int(tail) if tail else None
+            if tail is not None and tail < 0:
+                raise ValueError("negative tail {}".format(tail))
+        except (AttributeError, TypeError, ValueError), e:
+            self.logger.error("Invalid log request: {}".format(e))
+            return False
+
         user = self.getUser(userId)
         job = self.getJob(jobId)
 
-        if (user and job) and user.id == job.userId or user.admin:
-            logPath = os.path.join(self.workingDir, str(jobId), "logs", "joblog.log")            
+        if (user and job) and (user.id == job.userId or user.admin):
+            self.flushJobLog(blocking=True)
+            entries = self.dbController.getJobLog(job.jobId,
+                since=since, tail=tail)
+
             log = ""
-            for bytes in FileUtils.readBytesFromFile(logPath):
-                log += bytes
+            for timestamp, message in entries:
+                log += "[{}] {}\n".format(datetime2Str(timestamp), message)
 
             return log
 
@@ -623,16 +1033,11 @@ class PySchedServer(object):
         newMachineName = workstationInfo.get("workstationName", None)
         if not newMachineName:
             self.logger.warning("Try to add a Workstation with no name.")
-        
-        try:
-            for k, v in self.workstations.iteritems():
-                if v.get("workstationName", None) == newMachineName:
-                    self.logger.debug("Overriding old workstation Informations")
-                    del self.workstations[k]        
-        except:
-            return            
-
-        self.workstations[networkId] = workstationInfo
+
+        if self.workstations.add(networkId, workstationInfo) is not None:
+            self.logger.debug("Overriding old workstation Informations")
+        self.scheduler.workstationUpdated(workstationInfo)
+
         self.logger.info("New workstation {} added. Currently are {} workstations available."
             .format(workstationInfo.get("workstationName", None), len(self.workstations)))
 
@@ -656,7 +1061,8 @@ class PySchedServer(object):
         if not networkId in self.workstations:
             self.addWorkstation(networkId, workstationInfo)
         else:
-            self.workstations[networkId].update(workstationInfo)
+            self.scheduler.workstationUpdated(
+                self.workstations.update(networkId, workstationInfo))
 
     def removeWorkstation(self, networkId):
         '''
@@ -664,31 +1070,26 @@ class PySchedServer(object):
         @param networkId: the networkId to remove
         @result:
         '''
-        if networkId in self.workstations:
-            self.logger.info("Connection to workstation {} lost.".format(self.lookupNetworkId(networkId).get("workstationName")))
-            del self.workstations[networkId]            
+        workstation = self.workstations.remove(networkId)
+        if workstation is not None:
+            workstationName = workstation.get("workstationName")
+            self.logger.info("Connection to workstation {} lost.".format(workstationName))
+            self.scheduler.workstationRemoved(workstationName)
 
     def getWorkstations(self):
         '''
         @summary: Returns all currently registered workstations
         @result: a list of workstations (dictionaries containing the workstation informations)
         '''
-        return self.workstations.values()
+        return self.workstations.getAll()
 
     def lookupWorkstationName(self, workstationName):
         '''
         @summary: Takes a machine name and search for a registered network client
         @param workstationName: the name to look up
-        @result:
+        @result: the networkId or -1 if the workstation is not registered
         '''
-        try:
-            for k, v in self.workstations.iteritems():
-                if v.get("workstationName", None) == workstationName:
-                    return k
-        except:
-            return -1
-            
-        return -1
+        return self.workstations.getNetworkId(workstationName)
 
     def lookupNetworkId(self, networkId):
         '''
@@ -696,7 +1097,7 @@ class PySchedServer(object):
         @param workstationName: the networkId to look up
         @result:
         '''
-        return self.workstations.get(networkId, None)        
+        return self.workstations.get(networkId)
 
     def getJobCountOnWorkstation(self, workstation):
         '''
@@ -707,14 +1108,8 @@ class PySchedServer(object):
         if not workstation:
             return 0
 
-        jobs = self.getFromDatabase(Job, workstation=workstation)
-
-        runningJobs = 0
-        for job in jobs:
-            if job.stateId == JobState.lookup("RUNNING"):
-                runningJobs += 1
-
-        return runningJobs
+        return self.dbController.jobCounters.getCount(
+            JobState.lookup("RUNNING"), workstation=workstation)
 
     def checkForPrograms(self, workstation, programs=[]):
         '''
@@ -728,7 +1123,7 @@ class PySchedServer(object):
         if not isinstance(progs, list):
             progs = [progs]
 
-        checkFor = programs
+        checkFor = list(programs)
         if progs:
             checkFor.extend(progs)
 
@@ -746,7 +1141,9 @@ class PySchedServer(object):
         updates them if necessary.
         @result:
         '''
-        jobs = self.getFromDatabase(Job)
+        jobs = self.getFromDatabase(Job,
+            stateId__ge=JobState.lookup("RUNNING"),
+            stateId__lt=JobState.lookup("ARCHIVED"))
 
         for job in jobs:
             if job.stateId == JobState.lookup("RUNNING"):
@@ -839,12 +1236,16 @@ class PySchedServer(object):
         else:
             self.logger.info("Unpacking file...")
             Archive.unpack(dest)
+            FileUtils.deleteFile(dest)
+
+            # The input files are hashed here instead of on the scheduler
+            # thread, when the job is placed
+            self.scheduler.locality.indexJob(job)
 
+            job = self.scheduler.jobUploaded(jobId)
             if job.stateId < JobState.lookup("PREPARED"):
                 reactor.callInThread(self.schedule, jobId)
 
-            FileUtils.deleteFile(dest)
-
         return True
 
     def getUploadPath(self, jobId):
@@ -879,14 +1280,14 @@ class PySchedServer(object):
         '''
         user = self.getUser(userId)
         if user.admin:
-            for networkId in self.workstations.keys():
+            for networkId in self.workstations.getNetworkIds():
                 self.logger.info("Shutting down {}".format(
                     self.lookupNetworkId(networkId).get("workstationName", "")))
                 self.networkManager.sendMessage(
                     networkId, 
                     CommandBuilder.buildShutdownString())
 
-        reactor.callLater(10, self.shutdown)
+        reactor.callFromThread(reactor.callLater, 10, self.shutdown)
 
     def stopWorkstation(self, userId, workstationName):
         '''
@@ -912,8 +1313,18 @@ class PySchedServer(object):
         @summary: Shut the server down.
         @result: 
         '''
+        if not isInIOThread():
+            reactor.callFromThread(self.shutdown)
+            return
+
         self.logger.info("Shutting down...")
         self.networkManager.stopService()
+        self.jobLogLoop.stop()
+        if self.archiveLoop.running:
+            self.archiveLoop.stop()
+        self.flushJobLog()
+        self.checkpointLoop.stop()
+        self.dbExecutor.stop()
         reactor.stop()
 
     def restartServer(self, userId):
@@ -964,6 +1375,7 @@ class PySchedServer(object):
             "diskLoad": psutil.disk_usage(self.workingDir)[3],
             "diskFree": psutil.disk_usage(self.workingDir)[2] / (1024**3),
             "version": VERSION,
+            "databaseCache": self.dbController.getStatistics(),
             })
 
         return server
@@ -976,7 +1388,7 @@ class PySchedServer(object):
                 os.path.join(self.workingDir, "PATHS"),
                 path + "\n")
 
-            for networkId in self.workstations.keys():
+            for networkId in self.workstations.getNetworkIds():
                 self.networkManager.sendMessage(
                     networkId,
                     CommandBuilder.createUpdatePathString([path]))
@@ -13,6 +13,7 @@ setup(name='PySched',
             'PySched',
             'PySched.Common',
             'PySched.Common.Communication',
+            'PySched.Common.Database',
             'PySched.Common.IO',
             'PySched.Common.Interfaces',
             'PySched.Common.Interfaces.DatabaseInterface',
@@ -22,6 +23,7 @@ setup(name='PySched',
             'PySched.Common.Interfaces.WIMInterface',
             'PySched.PySchedClient',
             'PySched.PySchedClient.DatabaseManagement',
+            'PySched.PySchedClient.InputCache',
             'PySched.PySchedClient.JobRunner',
             'PySched.PySchedClient.NetworkManagement.',
             'PySched.PySchedClient.NetworkManagement.SSH',
@@ -40,6 +42,7 @@ setup(name='PySched',
                         'twisted',
                         'psutil',
                         'paramiko',],
+      extras_require={'scoring': ['numpy']},
       scripts=[
             'PySched/PySchedClient/PySchedClient.sh',
             'PySched/PySchedServer/PySchedServer.sh'],